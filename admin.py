@@ -0,0 +1,5 @@
+from server_modules.profiling import main
+
+# Send a profiling command to a running server.
+if __name__ == "__main__":
+    main()
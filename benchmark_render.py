@@ -0,0 +1,6 @@
+from client import GameClient
+from client_modules.render_benchmark import main
+
+# Measure how long the client takes to draw a frame, without opening a window.
+if __name__ == "__main__":
+    main(GameClient)
@@ -0,0 +1,5 @@
+from server_modules.room_benchmark import main
+
+# Measure joins and broadcasts in a room full of bot players.
+if __name__ == "__main__":
+    main()
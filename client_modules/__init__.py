@@ -1,10 +1,22 @@
 """
 Client modules package for Deny & Conquer game.
 Contains UI components and utilities for the game client.
+The UI components need pygame and are only imported when first used,
+so the headless ClientCore can be used without pygame installed.
 """
 
 from .constants import *
-from .grid import GridComponent
-from .login import LoginComponent
+from .core import ClientCore
 
-__all__ = ['GridComponent', 'LoginComponent']
+__all__ = ['ClientCore', 'GridComponent', 'LoginComponent']
+
+
+def __getattr__(name):
+    """Import the pygame UI components lazily."""
+    if name == 'GridComponent':
+        from .grid import GridComponent
+        return GridComponent
+    if name == 'LoginComponent':
+        from .login import LoginComponent
+        return LoginComponent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
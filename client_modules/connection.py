@@ -0,0 +1,77 @@
+import errno
+import os
+import socket
+
+# Bytes read from the server per poll, so a flood of messages cannot stall a frame
+RECEIVE_BUDGET = 256 * 1024
+# Outgoing bytes that may pile up before the connection is considered dead
+MAX_OUTGOING_BYTES = 1024 * 1024
+
+
+class Connection:
+    """
+    Non-blocking TCP connection to the server. Nothing here ever waits on the network:
+    connecting, sending and receiving only do what the socket allows right now, and the
+    client polls the socket once per frame to do the rest.
+    """
+    def __init__(self, address):
+        """Start connecting to address. The connection completes when the socket turns writable."""
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setblocking(False)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        error = self.sock.connect_ex(address)
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            self.sock.close()
+            raise ConnectionError(os.strerror(error))
+        self.connecting = error != 0
+        self.outgoing = bytearray()
+
+    def finish_connect(self):
+        """Check the result of connecting once the socket is writable. Raises ConnectionError if it failed."""
+        error = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            raise ConnectionRefusedError(os.strerror(error)) if error == errno.ECONNREFUSED \
+                else ConnectionError(os.strerror(error))
+        self.connecting = False
+
+    def send(self, data):
+        """Queue bytes and send as much as the socket takes right away."""
+        if len(self.outgoing) + len(data) > MAX_OUTGOING_BYTES:
+            raise ConnectionError(f"{len(self.outgoing)} bytes could not be sent")
+        self.outgoing += data
+        self.flush()
+
+    def flush(self):
+        """Send queued bytes until the socket would block."""
+        if self.connecting:
+            return
+        while self.outgoing:
+            try:
+                sent = self.sock.send(self.outgoing)
+            except (BlockingIOError, InterruptedError):
+                return
+            del self.outgoing[:sent]
+
+    def receive(self):
+        """Read what has arrived, up to RECEIVE_BUDGET bytes.
+        Raises ConnectionError when the server closed the connection."""
+        chunks = []
+        received = 0
+        while received < RECEIVE_BUDGET:
+            try:
+                data = self.sock.recv(RECEIVE_BUDGET - received)
+            except (BlockingIOError, InterruptedError):
+                break
+            if not data:
+                if chunks:
+                    # Hand over what came before the close first
+                    break
+                raise ConnectionError("Server closed connection.")
+            chunks.append(data)
+            received += len(data)
+        return b''.join(chunks)
+
+    def close(self):
+        """Close the socket and drop anything not sent yet."""
+        self.outgoing.clear()
+        self.sock.close()
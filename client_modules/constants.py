@@ -1,14 +1,31 @@
-import pygame
-
 # --- Game Constants ---
 BUFFER_SIZE = 4096
 TARGET_COVERAGE = 0.50  # Minimum coverage required to claim a square (50%)
+RECONNECT_WINDOW = 25  # Seconds to keep trying to resume a dropped session (server keeps it for 30)
+RECONNECT_INTERVAL = 1  # Seconds between reconnect attempts
+GAME_OVER_CLOSE_DELAY = 20  # Seconds the result stays on screen before the client closes, unless another round follows
+PREDICT_LOCKS = True  # Start scribbling before the server grants the lock, roll back if denied
+QUEUE_LOCKS = True  # Wait in line for squares other players hold, instead of clicking until they are free
+ROLLBACK_FLASH_TIME = 0.5  # Seconds a rolled back square flashes
+USE_UDP = True  # Send and receive scribbles over UDP when the server and network allow it
+UDP_HELLO_ATTEMPTS = 3  # UDP handshakes to try before staying on TCP
+UDP_HELLO_INTERVAL = 0.5  # Seconds between UDP handshakes
+USE_COMPRESSION = True  # Ask the server to compress messages with zlib and its preset dictionary
+SCRIBBLE_MIN_DISTANCE = 3  # Pixels the mouse must move before another scribble point is sent
+SCRIBBLE_TOLERANCE = 1.5  # Pixels a sent stroke may stray from the drawn one, well under the line width
+MAX_SCRIBBLE_POINTS = 512  # Points kept of another player's stroke, like the server's stroke store
+SCRIBBLE_BACKLOG_BYTES = 16 * 1024  # Unsent bytes at which scribble points are dropped instead of queued
+HASH_MISMATCH_LIMIT = 2  # Board hashes in a row that must differ from ours before we ask for a resync
 
 # --- Screen Constants ---
 GRID_AREA_SIZE = 480  # 
 GRID_TOP_LEFT = (50, 70)  # Top-left corner of the grid on screen
 SCREEN_WIDTH = GRID_TOP_LEFT[0] + GRID_AREA_SIZE + 200  # Add 100 pixels for the player list
 SCREEN_HEIGHT = GRID_TOP_LEFT[1] + GRID_AREA_SIZE + 50  # Add 50 pixels for the player list
+MAX_LISTED_PLAYERS = 14  # Players shown in the player list, the rest are summed up in one line
+FRAME_RATE = 60  # Frames per second while something on screen is changing
+IDLE_WAIT = 0.5  # Most seconds the client sleeps without input or messages, so reconnects and handshakes stay on time
+INPUT_POLL_INTERVAL = 0.01  # Seconds between input checks while sleeping on the network
 
 # --- Colors for the game ---
 COLOR_WHITE = (255, 255, 255)
@@ -25,16 +42,9 @@ COLOR_BUTTON_TEXT = COLOR_WHITE
 COLOR_STATUS_INFO = (50, 50, 150)
 COLOR_STATUS_ERROR = (180, 50, 50)
 COLOR_STATUS_SUCCESS = (50, 150, 50)
+COLOR_ROLLBACK = (220, 40, 40)
 
 # --- Alpha Values ---
 ALPHA_LOCK_SELF = 100
 ALPHA_LOCK_OTHER = 100
-
-# helper function for drawing rects 
-def draw_rect_alpha(surface, color_rgb, alpha, rect):
-    """ Draw a rectangle with alpha transparency onto a surface. 
-        To allow player to scribble and see the trail."""
-
-    shape_surf = pygame.Surface(pygame.Rect(rect).size, pygame.SRCALPHA)
-    pygame.draw.rect(shape_surf, color_rgb + (alpha,), shape_surf.get_rect())
-    surface.blit(shape_surf, rect)
\ No newline at end of file
+ALPHA_ROLLBACK = 160
@@ -0,0 +1,769 @@
+import socket
+import select
+import selectors
+import ast
+import time
+from collections import Counter, deque
+from shared_modules.board_hash import board_hash, row_hash, square_hash
+from shared_modules.commands import CommandTable
+from shared_modules.compression import inflate
+from .connection import Connection
+from .constants import *
+
+
+class ClientCore:
+    """Network connection and game state of a client, without any pygame dependency.
+    The pygame client builds its UI on top of this class, and bots can use it directly."""
+    def __init__(self):
+        """
+        Initialize the client core. Set up the network and game state.
+        """
+        # --- Network State ---
+        self.connection = None
+        self.connected = False
+        self.receive_buffer = b""
+        # Sockets are polled once per frame, nothing waits on the network
+        self.selector = selectors.DefaultSelector()
+        self.message_queue = deque()
+        self.session_token = None  # Issued in WELCOME, used to resume a dropped connection
+        self.last_seq = 0  # Last sequenced server event we have applied
+        self.reconnect_deadline = None
+        self.next_reconnect_attempt = 0
+        self.udp_sock = None  # Optional side channel for scribbles
+        self.udp_ready = False
+        self.udp_seq = 0
+        self.udp_last_received = -1
+        self.udp_hello_attempts = 0
+        self.next_udp_hello = 0
+
+        # --- Game State ---
+        self.player_name = ""
+        self.server_ip = "127.0.0.1"
+        self.server_port = "65433"
+        self.my_player_id = -1
+        self.my_color_tuple = (0, 0, 0)
+        self.my_color_str = 'black'
+        self.grid_size = 8
+        self.board = []
+        self.row_hashes = []  # Hash of each row of our board, checked against the server's board hash
+        self.hash_mismatches = 0
+        self.players = {}
+        self.scores = Counter()  # Player ID -> claimed squares, counted when the board changes
+        self.leaders = []  # IDs of the leading players, best first, as ranked by the server
+        self.locked_squares = {}
+        self.game_over = False
+        self.game_over_message = ""
+        self.close_deadline = None  # When the client closes after the game ended
+        self.status_text = "Enter details and connect."
+        self.status_color = COLOR_STATUS_INFO
+        self.remaining_time = 120
+
+        # --- Scribbling State ---
+        self.is_scribbling = False
+        self.scribble_square = None
+        self.pending_lock_request = None
+        self.queued_square = None  # Square we wait in line for, the server grants it when it is our turn
+        self.other_players_scribbles = {} 
+        self.current_scene = "login"
+        self.needs_redraw = True  # Cleared by the UI once it drew the current state
+
+        # Handlers of server messages
+        self.commands = CommandTable()
+        self.register_commands()
+
+        # There is no network thread, update_network polls the sockets and processes the queue once per frame
+        self.process_queue()
+
+    def hex_to_rgb(self, hex_color):
+        """ Converts a given hex color to an RGB tuple."""
+
+        if not hasattr(self, '_color_cache'):
+            self._color_cache = {}
+        if hex_color not in self._color_cache:
+            hex_color = hex_color.lstrip('#')
+            try:
+                self._color_cache[hex_color] = tuple(int(hex_color[i : i + 2], 16) for i in (0, 2, 4))
+            except ValueError:
+                print(f"Warning: Invalid color hex {hex_color}, using black.")
+                self._color_cache[hex_color] = (0, 0, 0)
+        return self._color_cache[hex_color]
+
+    # === Network Methods for Connecting with Server ===
+    def connect_to_game(self):
+        """Connect to the game server using the provided IP and port."""
+        if not self.player_name:
+            self.set_status("Player Name cannot be empty.", COLOR_STATUS_ERROR)
+            return
+        if not self.server_ip:
+            self.set_status("Server IP cannot be empty.", COLOR_STATUS_ERROR)
+            return
+        try:
+            port_num = int(self.server_port)
+            if not (1024 < port_num < 65536):
+                raise ValueError("Port out of range")
+        except ValueError:
+            self.set_status("Invalid Port number (1025-65535).", COLOR_STATUS_ERROR)
+            return
+
+        try:
+            self.set_status(f"Connecting to {self.server_ip}:{self.server_port}...", COLOR_STATUS_INFO)
+            # Start connecting, the connection completes while frames keep running
+            self.open_connection((self.server_ip, port_num))
+            self.connected = True
+            self.game_over = False
+            self.game_over_message = ""
+
+            # Send connection message to server, it goes out once connected
+            connect_msg = f"CONNECT|{self.player_name}{self.connect_options()}\n"
+            self.send_message(connect_msg)
+            self.log_message(f"Connection attempt initiated...")
+
+        except ConnectionRefusedError:
+            self.set_status(f"Connection refused. Server offline?", COLOR_STATUS_ERROR)
+            self.cleanup_connection()
+        except socket.gaierror:
+            self.set_status(f"Could not resolve hostname.", COLOR_STATUS_ERROR)
+            self.cleanup_connection()
+        except Exception as e:
+            self.set_status(f"Connection failed: {e}", COLOR_STATUS_ERROR)
+            self.cleanup_connection()
+
+    def open_connection(self, address):
+        """Start a non-blocking connection to the server."""
+        self.connection = Connection(address)
+        self.receive_buffer = b""
+        self.selector.register(self.connection.sock, selectors.EVENT_READ | selectors.EVENT_WRITE,
+                               self.on_connection_events)
+
+    def connect_options(self):
+        """Get the options appended to CONNECT and RESUME."""
+        return "|zlib|zdict" if USE_COMPRESSION else ""
+
+    def try_reconnect(self):
+        """Try to resume the dropped session, at most once per RECONNECT_INTERVAL seconds."""
+        if self.reconnect_deadline is None or self.connected:
+            return
+        now = time.time()
+        if now >= self.reconnect_deadline:
+            self.reconnect_deadline = None
+            self.session_token = None
+            self.set_status("Could not reconnect to the server.", COLOR_STATUS_ERROR)
+            self.current_scene = "login"
+            return
+        if now < self.next_reconnect_attempt:
+            return
+        self.next_reconnect_attempt = now + RECONNECT_INTERVAL
+
+        try:
+            self.open_connection((self.server_ip, int(self.server_port)))
+            self.connected = True
+            # Ask for the events we missed since the last one we applied.
+            # The deadline stays until the server answers, a failed attempt is retried.
+            resume_msg = f"RESUME|{self.session_token}|{self.last_seq}|{self.player_name}{self.connect_options()}\n"
+            self.send_message(resume_msg)
+            self.log_message("Resuming session...")
+        except Exception as e:
+            self.log_message(f"Reconnect attempt failed: {e}")
+            self.cleanup_connection()
+
+    def start_udp(self):
+        """Open the UDP side channel, the handshake is sent from update_network."""
+        self.close_udp()
+        if not USE_UDP or not self.session_token:
+            return
+        try:
+            self.udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp_sock.connect((self.server_ip, int(self.server_port)))
+            self.udp_sock.setblocking(False)
+        except OSError as e:
+            self.log_message(f"UDP not available, using TCP: {e}")
+            self.close_udp()
+            return
+        self.udp_hello_attempts = 0
+        self.next_udp_hello = 0
+        self.udp_last_received = -1
+        self.selector.register(self.udp_sock, selectors.EVENT_READ, self.on_datagram_events)
+
+    def try_udp_handshake(self):
+        """Send the UDP handshake until the server answers or we give up and stay on TCP."""
+        if self.udp_sock is None or self.udp_ready or time.time() < self.next_udp_hello:
+            return
+        if self.udp_hello_attempts >= UDP_HELLO_ATTEMPTS:
+            self.log_message("No answer over UDP, scribbles stay on TCP.")
+            self.close_udp()
+            return
+        self.udp_hello_attempts += 1
+        self.next_udp_hello = time.time() + UDP_HELLO_INTERVAL
+        try:
+            self.udp_sock.send(f"HELLO|{self.session_token}".encode('utf-8'))
+        except OSError:
+            pass
+
+    def on_datagram_events(self, udp_sock, events):
+        """Read the scribble datagrams that arrived, dropping ones that arrive out of order."""
+        while self.udp_sock is udp_sock:
+            try:
+                data = udp_sock.recv(BUFFER_SIZE).decode('utf-8').strip()
+            except BlockingIOError:
+                break
+            except OSError:
+                self.close_udp()
+                break
+            if data == "HELLO_ACK":
+                self.message_queue.append(("UDP_READY", None))
+                continue
+            try:
+                seq, message = data.split('|', 1)
+                seq = int(seq)
+            except ValueError:
+                continue
+            if seq > self.udp_last_received:
+                self.udp_last_received = seq
+                self.message_queue.append(("MESSAGE", message))
+
+    def close_udp(self):
+        """Close the UDP side channel and go back to TCP for scribbles."""
+        udp_sock, self.udp_sock = self.udp_sock, None
+        self.udp_ready = False
+        if udp_sock:
+            try:
+                self.selector.unregister(udp_sock)
+            except (KeyError, ValueError):
+                pass
+            try:
+                udp_sock.close()
+            except OSError:
+                pass
+
+    def send_scribble_update(self, message):
+        """Send a scribble update over UDP when it is set up, otherwise over TCP.
+        Scribble points are dropped rather than queued behind a congested connection."""
+        if not self.udp_ready:
+            if self.connection and len(self.connection.outgoing) > SCRIBBLE_BACKLOG_BYTES:
+                return False
+            return self.send_message(message)
+        self.udp_seq += 1
+        try:
+            self.udp_sock.send(f"{self.udp_seq}|{message.strip()}".encode('utf-8'))
+            return True
+        except BlockingIOError:
+            return False
+        except OSError:
+            self.close_udp()
+            return self.send_message(message)
+
+    def update_network(self):
+        """Handle everything that arrived from the server and retry pending connections.
+        Call this once per frame, it never waits on the network."""
+        self.poll_network()
+        self.process_queue()
+        self.try_reconnect()
+        self.try_udp_handshake()
+        if self.close_deadline is not None and time.time() >= self.close_deadline:
+            self.close_deadline = None
+            self.on_closing()
+
+    def poll_network(self, timeout=0):
+        """Read and send whatever the sockets allow, waiting up to timeout seconds for one to be ready.
+        Returns True if any socket was ready."""
+        if not self.selector.get_map():
+            return False
+        ready = self.selector.select(timeout=timeout)
+        for key, events in ready:
+            key.data(key.fileobj, events)
+        return bool(ready)
+
+    def on_connection_events(self, sock, events):
+        """Finish connecting, read what arrived and send what is queued."""
+        connection = self.connection
+        if connection is None or connection.sock is not sock:
+            return
+        try:
+            if connection.connecting:
+                if not events & selectors.EVENT_WRITE:
+                    return
+                connection.finish_connect()
+            if events & selectors.EVENT_READ:
+                self.receive_buffer = self.unpack_messages(self.receive_buffer + connection.receive())
+            connection.flush()
+        except ConnectionRefusedError:
+            self.message_queue.append(("DISCONNECT", "Connection refused. Server offline?"))
+            return
+        except ConnectionResetError:
+            self.message_queue.append(("DISCONNECT", "Connection reset."))
+            return
+        except ConnectionError as e:
+            self.message_queue.append(("DISCONNECT", str(e)))
+            return
+        except OSError as e:
+            self.message_queue.append(("DISCONNECT", f"Network error: {e}"))
+            return
+        self.watch_connection()
+
+    def watch_connection(self):
+        """Only wait for the socket to turn writable while there is something to send."""
+        connection = self.connection
+        events = selectors.EVENT_READ
+        if connection.connecting or connection.outgoing:
+            events |= selectors.EVENT_WRITE
+        if self.selector.get_key(connection.sock).events != events:
+            self.selector.modify(connection.sock, events, self.on_connection_events)
+
+    def finish_sending(self, timeout):
+        """Wait up to timeout seconds for queued messages to go out, used when closing."""
+        deadline = time.time() + timeout
+        while self.connection and self.connection.outgoing and time.time() < deadline:
+            try:
+                if select.select([], [self.connection.sock], [], max(0, deadline - time.time()))[1]:
+                    self.connection.flush()
+            except OSError:
+                return
+
+    def unpack_messages(self, buffer):
+        """Queue every complete message in buffer and return the incomplete rest.
+        A Z|length line is followed by length bytes of zlib-compressed messages, primed with
+        the preset dictionary if the server supports it."""
+        while True:
+            end = buffer.find(b'\n')
+            if end < 0:
+                return buffer
+            line = buffer[:end]
+            if line.startswith(b"Z|"):
+                size = int(line[2:])
+                if len(buffer) < end + 1 + size:
+                    return buffer
+                # A compressed frame always holds complete messages
+                self.unpack_messages(inflate(buffer[end + 1:end + 1 + size]))
+                buffer = buffer[end + 1 + size:]
+                continue
+            buffer = buffer[end + 1:]
+            message = line.decode('utf-8').strip()
+            if message:
+                self.message_queue.append(("MESSAGE", message))
+
+    def process_queue(self):
+        """Process messages in the queue."""
+        while self.message_queue:
+            msg_type, data = self.message_queue.popleft()
+            self.needs_redraw = True
+            if msg_type == "MESSAGE":
+                self.handle_server_message(data)
+            elif msg_type == "DISCONNECT":
+                self.handle_disconnection(data)
+            elif msg_type == "UDP_READY" and self.udp_sock and not self.udp_ready:
+                # Both directions work, tell the server to relay scribbles over UDP
+                self.udp_ready = True
+                self.send_message("UDP_ENABLE\n")
+                self.log_message("Scribbles switched to UDP.")
+
+    def register_commands(self):
+        """Fill the command table with the handlers of server messages."""
+        self.commands.register("SYNC", self.handle_sync, int)
+        self.commands.register("WELCOME", self.handle_welcome, int, str, int, str)
+        self.commands.register("RESUMED", self.handle_resumed, int, str, int, str)
+        self.commands.register_parser("UPDATE_BOARD", self.handle_update_board, ast.literal_eval)
+        self.commands.register_parser("UPDATE_PLAYERS", self.handle_update_players, ast.literal_eval)
+        self.commands.register("PLAYER_JOINED", self.handle_player_joined, int, str, str)
+        self.commands.register("PLAYER_LEFT", self.handle_player_left, int)
+        self.commands.register("LEADERBOARD", self.handle_leaderboard, str)
+        self.commands.register_parser("UPDATE_LOCKS", self.handle_update_locks, ast.literal_eval)
+        self.commands.register("LOCK_GRANTED", self.handle_lock_granted, int, int)
+        self.commands.register("LOCK_DENIED", self.handle_lock_denied, int, int)
+        self.commands.register("LOCK_QUEUED", self.handle_lock_queued, int, int, int)
+        self.commands.register("SQUARE_LOCKED", self.handle_square_locked, int, int, int)
+        self.commands.register("PLAYER_SCRIBBLE", self.handle_player_scribble, int, int, int, int, int)
+        self.commands.register("STROKES", self.handle_strokes, str)
+        self.commands.register("SQUARE_UNLOCKED", self.handle_square_unlocked, int, int)
+        self.commands.register("INFO", self.handle_info, str)
+        self.commands.register("ERROR", self.handle_error, str)
+        self.commands.register("QUEUED", self.handle_queued, int, int)
+        self.commands.register("THROTTLED", self.handle_throttled, str)
+        self.commands.register("GAME_OVER", self.handle_game_over, str)
+        self.commands.register("NEXT_ROUND", self.handle_next_round, int)
+        self.commands.register("LOBBY_UPDATE", self.handle_lobby_update, int)
+        self.commands.register("NEW_ROUND", self.handle_new_round, int, int)
+        self.commands.register("TIMER_UPDATE", self.handle_timer_update, int)
+        self.commands.register("BOARD_HASH", self.handle_board_hash, str)
+        self.commands.register("BOARD_ROWS", self.handle_board_rows, str)
+
+    def handle_server_message(self, message):
+        """Handle messages received from the server."""
+
+        # Sequenced event, remember how far we got and handle the event itself
+        if message.startswith("SEQ|"):
+            _, seq, message = message.split('|', 2)
+            self.last_seq = int(seq)
+
+        # Only print non-scribble messages to reduce terminal spam
+        if not message.startswith("PLAYER_SCRIBBLE"):
+            print(f"Received: {message}")
+
+        try:
+            self.commands.dispatch(message)
+        except Exception as e:
+            self.log_message(f"Error processing msg '{message}': {e}")
+            import traceback
+
+            traceback.print_exc()
+
+    def handle_sync(self, seq):
+        """Start of a full state resync."""
+        self.last_seq = seq
+
+    def handle_welcome(self, player_id, color, grid_size, token):
+        """We joined the game."""
+        self.my_player_id = player_id
+        self.my_color_str = color
+        self.my_color_tuple = self.hex_to_rgb(self.my_color_str)
+        self.grid_size = grid_size
+        self.session_token = token or None
+        self.reconnect_deadline = None
+        self.log_message(f"Connected! Your color: {self.my_color_str}")
+        self.current_scene = "game"
+        self.board = [[0] * self.grid_size for _ in range(self.grid_size)]
+        self.row_hashes = [0] * self.grid_size
+        self.set_status("Game started! Click white squares.", COLOR_STATUS_INFO)
+        self.start_udp()
+        self.on_welcome()
+
+    def handle_resumed(self, player_id, color, grid_size, token):
+        """Our dropped session was resumed, the missed events follow."""
+        self.my_player_id = player_id
+        self.my_color_str = color
+        self.my_color_tuple = self.hex_to_rgb(self.my_color_str)
+        self.session_token = token
+        self.reconnect_deadline = None
+        self.log_message("Session resumed.")
+        self.set_status("Reconnected!", COLOR_STATUS_SUCCESS)
+        self.start_udp()
+
+    def handle_update_board(self, new_board):
+        """Update the board, clearing scribbles and strokes on newly claimed squares."""
+        # Our row hashes are updated square by square, unless the board changed size
+        incremental = len(self.board) == len(self.row_hashes) == len(new_board)
+        # Check for newly claimed squares and clear their scribbles
+        if self.board:
+            for r in range(self.grid_size):
+                for c in range(self.grid_size):
+                    old_id, new_id = self.board[r][c], new_board[r][c]
+                    if old_id == new_id:
+                        continue
+                    if incremental:
+                        self.row_hashes[r] ^= square_hash(r, c, old_id) ^ square_hash(r, c, new_id)
+                    # If a square was empty and is now claimed
+                    if old_id == 0:
+                        # Clear any scribbles for this square
+                        if (r, c) in self.other_players_scribbles:
+                            del self.other_players_scribbles[(r, c)]
+                        # A predicted stroke on a square someone else claimed is rolled back
+                        if self.pending_lock_request == (r, c) and PREDICT_LOCKS:
+                            self.rollback_lock(r, c)
+                        # If this was our scribble square, reset it
+                        if self.scribble_square == (r, c):
+                            self.reset_scribble_state()
+
+        if not incremental:
+            self.row_hashes = [row_hash(r, row) for r, row in enumerate(new_board)]
+        self.board = new_board
+        self.scores = Counter(pid for row in new_board for pid in row if pid)
+
+    def handle_board_hash(self, server_hash):
+        """Check our board against the server's hash, and ask for the rows that differ.
+        A single mismatch can be a claim still on its way, so it has to repeat first."""
+        if not self.board or board_hash(self.row_hashes) == int(server_hash, 16):
+            self.hash_mismatches = 0
+            return
+        self.hash_mismatches += 1
+        if self.hash_mismatches >= HASH_MISMATCH_LIMIT:
+            self.hash_mismatches = 0
+            self.log_message("Board out of sync, asking for the rows that differ.")
+            self.send_message(f"RESYNC_ROWS|{','.join(f'{h:x}' for h in self.row_hashes)}\n")
+
+    def handle_board_rows(self, payload):
+        """Replace the rows the server sent after a resync request."""
+        new_board = [row[:] for row in self.board]
+        for part in payload.split(';'):
+            r, _, row = part.partition(':')
+            new_board[int(r)] = [int(player_id) for player_id in row.split(',')]
+        self.handle_update_board(new_board)
+
+    def handle_update_players(self, players):
+        """Replace the player list."""
+        self.players = players
+
+    def handle_player_joined(self, player_id, color, name):
+        """Add a player that joined."""
+        self.players[player_id] = {'name': name, 'color': color}
+
+    def handle_player_left(self, player_id):
+        """Remove a player that left."""
+        self.players.pop(player_id, None)
+
+    def handle_leaderboard(self, leaders):
+        """The leading players changed order."""
+        self.leaders = [int(pid) for pid in leaders.split(',') if pid]
+
+    def handle_update_locks(self, locks):
+        """Replace all locks, sent on a full resync."""
+        self.locked_squares = locks
+
+    def handle_lock_granted(self, r, c):
+        """The server granted our lock request."""
+        if self.queued_square == (r, c):
+            # Our turn came while the mouse is up, scribbling starts with the next press in the square
+            self.queued_square = None
+            self.locked_squares[(r, c)] = self.my_player_id
+            self.set_status(f"Your turn! Scribble in ({r},{c}).", COLOR_STATUS_SUCCESS)
+            return
+        if self.pending_lock_request == (r, c) and PREDICT_LOCKS:
+            print(f"Predicted lock confirmed for ({r},{c})")
+            self.confirm_lock(r, c)
+        elif self.pending_lock_request == (r, c):
+            print(f"Lock granted for ({r},{c})")
+            self.is_scribbling = True
+            self.scribble_square = (r, c)
+            self.locked_squares[(r, c)] = self.my_player_id
+            self.set_status(f"Scribbling in ({r},{c})...", COLOR_STATUS_INFO)
+        else:
+            print(f"WARN: LOCK_GRANTED for unexpected square ({r},{c})")
+        self.pending_lock_request = None
+
+    def handle_lock_denied(self, r, c):
+        """The server denied our lock request."""
+        if self.queued_square == (r, c):
+            self.queued_square = None
+            self.set_status(f"Square ({r},{c}) was claimed before your turn.", COLOR_STATUS_ERROR)
+            return
+        if self.pending_lock_request == (r, c):
+            self.set_status(f"Lock denied for ({r},{c}). Busy?", COLOR_STATUS_ERROR)
+            self.log_message(f"Lock denied for square ({r},{c}).")
+            self.pending_lock_request = None
+            if PREDICT_LOCKS:
+                self.rollback_lock(r, c)
+
+    def handle_lock_queued(self, r, c, place):
+        """We are waiting in line for a square."""
+        if self.queued_square == (r, c):
+            self.set_status(f"Waiting for ({r},{c}), number {place} in line.", COLOR_STATUS_INFO)
+
+    def queue_for_lock(self, r, c):
+        """Wait in line for a square another player holds."""
+        self.queued_square = (r, c)
+        self.set_status(f"Waiting for ({r},{c})...", COLOR_STATUS_INFO)
+        self.send_message(f"LOCK_QUEUE|{r}|{c}\n")
+
+    def cancel_queued_lock(self):
+        """Leave the line we wait in."""
+        r, c = self.queued_square
+        self.queued_square = None
+        self.send_message(f"LOCK_CANCEL|{r}|{c}\n")
+
+    def handle_square_locked(self, r, c, player_id):
+        """Someone locked a square."""
+        self.locked_squares[(r, c)] = player_id
+        if self.pending_lock_request == (r, c) and player_id != self.my_player_id:
+            self.set_status(f"Square ({r},{c}) locked by other player.", COLOR_STATUS_INFO)
+            self.pending_lock_request = None
+            if PREDICT_LOCKS:
+                self.rollback_lock(r, c)
+
+    def handle_player_scribble(self, r, c, player_id, x, y):
+        """Add a scribble point from another player."""
+        if (r, c) not in self.other_players_scribbles:
+            self.other_players_scribbles[(r, c)] = {'player_id': player_id,
+                                                    'points': deque(maxlen=MAX_SCRIBBLE_POINTS)}
+        self.other_players_scribbles[(r, c)]['points'].append((x, y))
+
+    def handle_strokes(self, strokes):
+        """Strokes in progress when we joined, as r,c,player_id,x,y,x,y,... separated by semicolons."""
+        for stroke in strokes.split(';'):
+            r, c, player_id, *coords = map(int, stroke.split(','))
+            if player_id == self.my_player_id:
+                continue
+            points = deque(zip(coords[::2], coords[1::2]), maxlen=MAX_SCRIBBLE_POINTS)
+            self.other_players_scribbles[(r, c)] = {'player_id': player_id, 'points': points}
+
+    def handle_square_unlocked(self, r, c):
+        """A lock was released or ran out."""
+        if (r, c) in self.locked_squares:
+            del self.locked_squares[(r, c)]
+        # Clear any scribbles for this square when unlocked
+        if (r, c) in self.other_players_scribbles:
+            del self.other_players_scribbles[(r, c)]
+        # Our own lock ran out because we stopped scribbling
+        if self.scribble_square == (r, c) and self.pending_lock_request != (r, c):
+            self.reset_scribble_state()
+            self.set_status(f"Lock on ({r},{c}) expired.", COLOR_STATUS_ERROR)
+        if self.pending_lock_request == (r, c) and not PREDICT_LOCKS:
+            self.set_status(f"Square ({r},{c}) unlocked.", COLOR_STATUS_INFO)
+            self.pending_lock_request = None
+            # Clear any scribble points if we were waiting for this square
+            self.clear_pending_scribble()
+
+    def handle_info(self, text):
+        """Show an information message."""
+        self.log_message(f"Info: {text}")
+
+    def handle_error(self, text):
+        """Show an error from the server."""
+        self.set_status(f"Server Error: {text}", COLOR_STATUS_ERROR)
+        self.log_message(f"Error: {text}")
+
+    def handle_queued(self, position, seconds):
+        """The game is full and we wait in line for a slot."""
+        wait = f", about {seconds}s" if seconds >= 0 else ""
+        self.set_status(f"Game is full. You are number {position} in line{wait}...", COLOR_STATUS_INFO)
+
+    def handle_throttled(self, command):
+        """The server is dropping some of our messages."""
+        self.set_status("Slow down! The server is dropping some of your moves.", COLOR_STATUS_ERROR)
+        self.log_message(f"Throttled: {command}")
+
+    def handle_game_over(self, text):
+        """Show the result and shut down after a while."""
+        self.game_over = True
+        self.is_scribbling = False
+        self.game_over_message = text
+        self.set_status(f"{self.game_over_message}", COLOR_STATUS_SUCCESS)
+        self.log_message(f"--- {self.game_over_message} ---")
+
+        # Close after a while, unless the server announces another round
+        print(f"Client will shut down in {GAME_OVER_CLOSE_DELAY} seconds...")
+        self.close_deadline = time.time() + GAME_OVER_CLOSE_DELAY
+
+    def handle_next_round(self, seconds):
+        """Another round follows on the same connection, so stay open."""
+        self.close_deadline = None
+        self.handle_lobby_update(seconds)
+
+    def handle_lobby_update(self, seconds):
+        """Count down to the next round."""
+        self.game_over = True
+        self.is_scribbling = False
+        self.set_status(f"{self.game_over_message or 'Round over.'} Next round in {seconds}s.", COLOR_STATUS_SUCCESS)
+
+    def handle_new_round(self, round_number, timer_duration):
+        """The next round started on an empty board, with the same players."""
+        self.game_over = False
+        self.game_over_message = ""
+        self.close_deadline = None
+        self.board = [[0] * self.grid_size for _ in range(self.grid_size)]
+        self.row_hashes = [0] * self.grid_size
+        self.scores.clear()
+        self.leaders = []
+        self.locked_squares = {}
+        self.other_players_scribbles = {}
+        self.pending_lock_request = None
+        self.queued_square = None
+        self.reset_scribble_state()
+        self.clear_pending_scribble()
+        self.remaining_time = timer_duration
+        self.log_message(f"--- Round {round_number} ---")
+        self.set_status(f"Round {round_number} started! Click white squares.", COLOR_STATUS_INFO)
+
+    def handle_timer_update(self, remaining_time):
+        """Update the remaining time."""
+        self.remaining_time = remaining_time
+        print(f"Timer updated: {self.remaining_time} seconds remaining")
+
+    def handle_disconnection(self, reason):
+        """Handle disconnection from the server.
+        During a game we keep the screen and try to resume the session."""
+        if self.connected:
+            self.connected = False
+            self.log_message(f"Disconnected: {reason}")
+            self.cleanup_connection()
+            if self.session_token and self.current_scene == "game" and not self.game_over:
+                self.set_status("Connection lost. Reconnecting...", COLOR_STATUS_ERROR)
+                # A failed reconnect attempt keeps the deadline of the first drop
+                if self.reconnect_deadline is None:
+                    self.reconnect_deadline = time.time() + RECONNECT_WINDOW
+                    self.next_reconnect_attempt = 0
+            else:
+                self.set_status(f"Disconnected: {reason}", COLOR_STATUS_ERROR)
+                self.current_scene = "login"
+
+    def cleanup_connection(self):
+        """Clean up the connection."""
+        self.connected = False
+        if self.connection:
+            try:
+                self.selector.unregister(self.connection.sock)
+                self.connection.close()
+            except Exception as e:
+                print(f"Error closing socket: {e}")
+            self.connection = None
+        self.receive_buffer = b""
+        self.close_udp()
+        self.my_player_id = -1
+        self.is_scribbling = False
+        self.pending_lock_request = None
+        # The server takes us out of every line when we drop
+        self.queued_square = None
+
+    def send_message(self, message):
+        """Queue a message to the server and send it as far as the socket allows without waiting."""
+        if not self.connected or not self.connection:
+            self.log_message("Cannot send message: not connected.")
+            return False
+        try:
+            # Make sure the message ends with a newline
+            if not message.endswith('\n'):
+                message += '\n'
+            self.connection.send(message.encode('utf-8'))
+            self.watch_connection()
+            return True
+        except Exception as e:
+            self.log_message(f"Error sending message: {e}")
+            self.handle_disconnection(f"Send error: {e}")
+            return False
+
+    def set_status(self, text, color):
+        """Set the status text and color."""
+        self.status_text = text
+        self.status_color = color
+        self.needs_redraw = True
+
+    def log_message(self, message):
+        """Log a message to the console and store it."""
+        print(f"LOG: {message}")
+        if not hasattr(self, '_log_messages'):
+            self._log_messages = []
+        self._log_messages.append(message)
+        if len(self._log_messages) > 10:
+            self._log_messages.pop(0)
+
+
+    # === Hooks overridden by the UI layer ===
+    def on_welcome(self):
+        """Called once the server has welcomed us into the game."""
+        pass
+
+    def confirm_lock(self, r, c):
+        """Keep the predicted stroke once the server grants the lock."""
+        self.pending_lock_request = None
+        self.locked_squares[(r, c)] = self.my_player_id
+
+    def rollback_lock(self, r, c):
+        """Throw away the predicted stroke when the lock is denied."""
+        self.pending_lock_request = None
+        if self.scribble_square == (r, c):
+            self.reset_scribble_state()
+
+    def reset_scribble_state(self):
+        """Resets the scribble-related state."""
+        self.is_scribbling = False
+        self.scribble_square = None
+
+    def clear_pending_scribble(self):
+        """Forget the points collected while waiting for a lock."""
+        pass
+
+    def on_closing(self):
+        """Disconnect from the server."""
+        print("Closing client...")
+        if self.connected:
+            self.send_message("DISCONNECT\n")
+            self.finish_sending(0.1)
+        self.connected = False
+        self.cleanup_connection()
@@ -0,0 +1,72 @@
+import json
+import os
+import pygame
+
+# Resolved font paths are kept here so later startups skip the system font scan
+FONT_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "deny_conquer", "fonts.json")
+
+_font_paths = None
+_fonts = {}
+
+
+# helper function for drawing rects
+def draw_rect_alpha(surface, color_rgb, alpha, rect):
+    """ Draw a rectangle with alpha transparency onto a surface.
+        To allow player to scribble and see the trail."""
+
+    shape_surf = pygame.Surface(pygame.Rect(rect).size, pygame.SRCALPHA)
+    pygame.draw.rect(shape_surf, color_rgb + (alpha,), shape_surf.get_rect())
+    surface.blit(shape_surf, rect)
+
+
+def _load_font_paths():
+    """Load the resolved font paths from the cache file."""
+    try:
+        with open(FONT_CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_font_paths():
+    """Write the resolved font paths to the cache file."""
+    try:
+        os.makedirs(os.path.dirname(FONT_CACHE_FILE), exist_ok=True)
+        with open(FONT_CACHE_FILE, "w") as f:
+            json.dump(_font_paths, f)
+    except OSError as e:
+        print(f"Could not save font cache: {e}")
+
+
+def resolve_font(names, bold=False):
+    """Find the font file for a comma separated list of font names.
+    Returns (path, fake_bold), path is None for pygame's default font.
+    The system fonts are only scanned the first time a font is resolved on this machine."""
+    global _font_paths
+    if _font_paths is None:
+        _font_paths = _load_font_paths()
+
+    key = f"{names}|{'bold' if bold else 'regular'}"
+    entry = _font_paths.get(key)
+    if entry is not None and (entry[0] is None or os.path.exists(entry[0])):
+        return entry[0], entry[1]
+
+    # This scans the system fonts, which is slow
+    path = pygame.font.match_font(names, bold=bold)
+    # Without a bold variant of the font, pygame has to draw it bold itself
+    fake_bold = bold and (path is None or path == pygame.font.match_font(names))
+    _font_paths[key] = [path, fake_bold]
+    _save_font_paths()
+    return path, fake_bold
+
+
+def get_font(names, size, bold=False):
+    """Get a font by a comma separated list of font names, loading it on first use."""
+    key = (names, size, bold)
+    if key not in _fonts:
+        path, fake_bold = resolve_font(names, bold)
+        font = pygame.font.Font(path, size)
+        if fake_bold:
+            font.set_bold(True)
+        _fonts[key] = font
+    return _fonts[key]
@@ -1,5 +1,8 @@
+import time
 import pygame
 from .constants import *
+from .drawing import draw_rect_alpha
+from .strokes import StrokeSimplifier
 
 
 class GridComponent:
@@ -10,6 +13,9 @@ class GridComponent:
         self.client = game_client
         self.scribble_points = []
         self.scribble_coverage_pixels = set()
+        self.stroke = StrokeSimplifier(SCRIBBLE_MIN_DISTANCE, SCRIBBLE_TOLERANCE)  # Points worth sending
+        self.unconfirmed_messages = []  # Messages held back until our predicted lock is granted
+        self.rollback_flashes = {}  # (row, col) -> time the rollback cue ends
         self.calculate_square_size()
 
     def calculate_square_size(self):
@@ -54,9 +60,10 @@ class GridComponent:
             if (r_curr, c_curr) == self.client.scribble_square:
                 self.scribble_points.append(pos)
                 
-                # Send scribble update to server with correct format
-                r, c = self.client.scribble_square
-                self.client.send_message(f"SCRIBBLE_UPDATE|{r}|{c}|{pos[0]}|{pos[1]}\n")
+                # Send scribble update to server with correct format, leaving out points
+                # that do not change how the stroke looks
+                for x, y in self.stroke.add(pos):
+                    self.send_scribble_point(x, y)
                 
                 radius = 5  
                 #  Calculate coverage pixels
@@ -155,6 +162,15 @@ class GridComponent:
 
             draw_rect_alpha(screen, lock_color_rgb, alpha, square_rect)
 
+        # Flash squares where a predicted lock was rolled back, fading out
+        now = time.time()
+        for (r, c), end_time in list(self.rollback_flashes.items()):
+            if now >= end_time:
+                del self.rollback_flashes[(r, c)]
+                continue
+            alpha = int(ALPHA_ROLLBACK * (end_time - now) / ROLLBACK_FLASH_TIME)
+            draw_rect_alpha(screen, COLOR_ROLLBACK, alpha, self.grid_to_screen_rect(r, c))
+
     def handle_mouse_down(self, pos):
         """Handle mouse press events such as starting scribbling."""
         
@@ -162,13 +178,26 @@ class GridComponent:
             return
         if self.client.is_scribbling:
             return  # Should not happen if logic correct
+        if self.client.pending_lock_request is not None:
+            # A predicted stroke is still waiting for the server's answer
+            self.client.set_status("Waiting for the server...", COLOR_STATUS_INFO)
+            return
     
         r, c = self.coords_to_grid(pos[0], pos[1])
+        if self.client.queued_square not in (None, (r, c)):
+            # Clicking somewhere else leaves the line
+            self.client.cancel_queued_lock()
         if r is not None:  # Click was inside grid
             is_white = self.client.board[r][c] == 0
             is_locked = (r, c) in self.client.locked_squares
     
-            if is_white and not is_locked:
+            if is_white and self.client.locked_squares.get((r, c)) == self.client.my_player_id:
+                # We still hold this lock, e.g. after resuming a dropped session
+                self.client.is_scribbling = True
+                self.client.scribble_square = (r, c)
+                self.scribble_points = [pos]
+                self.client.set_status(f"Scribbling in ({r},{c})...", COLOR_STATUS_INFO)
+            elif is_white and not is_locked:
                 self.client.set_status(f"Requesting lock for ({r},{c})...", COLOR_STATUS_INFO)
                 self.client.pending_lock_request = (r, c)
                 
@@ -176,8 +205,18 @@ class GridComponent:
                 
                 # Start collecting scribble points immediately
                 self.scribble_points = [pos]
+                if PREDICT_LOCKS:
+                    # Scribble right away, the lock is confirmed or rolled back when the server answers
+                    self.client.is_scribbling = True
+                    self.client.scribble_square = (r, c)
+                    self.client.set_status(f"Scribbling in ({r},{c})...", COLOR_STATUS_INFO)
             elif not is_white:
                 self.client.set_status(f"Square ({r},{c}) already taken.", COLOR_STATUS_INFO)
+            elif is_locked and self.client.queued_square == (r, c):
+                self.client.set_status(f"Still waiting for ({r},{c})...", COLOR_STATUS_INFO)
+            elif is_locked and QUEUE_LOCKS:
+                # The server hands us the lock when the players ahead of us are done
+                self.client.queue_for_lock(r, c)
             elif is_locked:
                 locker_id = self.client.locked_squares.get((r, c))
                 locker_name = self.client.players.get(locker_id, {}).get('name', f'P{locker_id}')
@@ -188,21 +227,24 @@ class GridComponent:
         if self.client.is_scribbling and self.client.scribble_square is not None:
             r, c = self.client.scribble_square
             print(f"Released mouse in ({r},{c})")
+            for x, y in self.stroke.flush():
+                self.send_scribble_point(x, y)
     
             coverage = 0
             if self.total_pixels_in_square > 0:
                 coverage = len(self.scribble_coverage_pixels) / self.total_pixels_in_square
             self.client.log_message(
-                f"Square ({r},{c}): Covered ~{len(self.scribble_coverage_pixels)} pixels, Coverage ~{coverage:.2%}"
+                f"Square ({r},{c}): Covered ~{len(self.scribble_coverage_pixels)} pixels, Coverage ~{coverage:.2%}, "
+                f"sent {self.stroke.sent} of {self.stroke.received} points"
             )
     
             if coverage >= TARGET_COVERAGE:
                 self.client.log_message(f"Attempting claim ({r},{c})")
-                self.client.send_message(f"CLAIM_ATTEMPT|{r}|{c}\n")
+                self.send_scribble(f"CLAIM_ATTEMPT|{r}|{c}\n")
                 self.client.set_status(f"Attempting claim for ({r},{c})...", COLOR_STATUS_SUCCESS)
             else:
                 self.client.log_message(f"Releasing lock ({r},{c}) - Low coverage")
-                self.client.send_message(f"RELEASE_LOCK|{r}|{c}\n")
+                self.send_scribble(f"RELEASE_LOCK|{r}|{c}\n")
                 self.client.set_status(f"Claim failed for ({r},{c}) - <50% coverage.", COLOR_STATUS_INFO)
     
             # Always reset scribble state after processing
@@ -215,9 +257,42 @@ class GridComponent:
             # Clear scribble points if lock request is cancelled
             self.reset_scribble_state()
 
+    def send_scribble_point(self, x, y):
+        """Send a point of our stroke."""
+        r, c = self.client.scribble_square
+        self.send_scribble(f"SCRIBBLE_UPDATE|{r}|{c}|{x}|{y}\n")
+
+    def send_scribble(self, message):
+        """Send a message about our stroke, holding it back while the lock is still unconfirmed."""
+        if self.client.pending_lock_request is not None:
+            self.unconfirmed_messages.append(message)
+        elif message.startswith("SCRIBBLE_UPDATE"):
+            self.client.send_scribble_update(message)
+        else:
+            self.client.send_message(message)
+
+    def confirm_lock(self, r, c):
+        """Keep the predicted stroke once the server grants the lock."""
+        self.client.pending_lock_request = None
+        self.client.locked_squares[(r, c)] = self.client.my_player_id
+        # Send what was scribbled, and the claim or release if the mouse is already up,
+        # the same way they would have gone without the wait
+        messages, self.unconfirmed_messages = self.unconfirmed_messages, []
+        for message in messages:
+            self.send_scribble(message)
+
+    def rollback_lock(self, r, c):
+        """Throw away the predicted stroke when the lock is denied, and flash the square."""
+        self.client.pending_lock_request = None
+        self.unconfirmed_messages = []
+        if self.client.scribble_square == (r, c):
+            self.reset_scribble_state()
+        self.rollback_flashes[(r, c)] = time.time() + ROLLBACK_FLASH_TIME
+
     def reset_scribble_state(self):
         """Resets the scribble-related state."""
         self.client.is_scribbling = False
         self.client.scribble_square = None
         self.scribble_points = []
         self.scribble_coverage_pixels.clear()
+        self.stroke.reset()
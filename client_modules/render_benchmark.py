@@ -0,0 +1,233 @@
+"""
+Rendering benchmark for the pygame client.
+Draws the game scene headless with SDL's dummy video driver, for synthetic boards with
+a given number of players, locked squares and other players' strokes, and measures
+the time per frame and what each frame allocates: new surfaces, rendered text and the
+peak Python memory.
+
+Run the standard scenarios, or one of your own:
+    python benchmark_render.py
+    python benchmark_render.py --grid-size 64 --players 256 --locks 200 --scribbles 100 --points 512
+"""
+import os
+
+# Must be set before pygame opens a window
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import contextlib
+import io
+import random
+import time
+import tracemalloc
+from collections import deque
+import pygame
+from . import drawing
+from .constants import *
+
+# Frames drawn before measuring, so fonts and caches are loaded
+WARMUP_FRAMES = 20
+SCENARIOS = [
+    {'name': "Small room", 'grid_size': 8, 'players': 4, 'claimed': 0.5, 'locks': 2, 'scribbles': 2, 'points': 100},
+    {'name': "Massive room", 'grid_size': 64, 'players': 256, 'claimed': 0.5, 'locks': 64, 'scribbles': 32, 'points': 200},
+    {'name': "Massive room, busy", 'grid_size': 64, 'players': 256, 'claimed': 0.3, 'locks': 256, 'scribbles': 256,
+     'points': MAX_SCRIBBLE_POINTS},
+]
+
+
+class AllocationCounter:
+    """Counts the surfaces and text renders of the frames drawn while it is installed.
+    Surfaces are counted by swapping pygame.Surface for a counting subclass, text by
+    wrapping the cached fonts."""
+    def __init__(self):
+        self.surfaces = 0
+        self.renders = 0
+
+    @contextlib.contextmanager
+    def installed(self):
+        counter = self
+
+        class CountingSurface(pygame.Surface):
+            def __init__(self, *args, **kwargs):
+                counter.surfaces += 1
+                super().__init__(*args, **kwargs)
+
+        class CountingFont:
+            def __init__(self, font):
+                self.font = font
+
+            def render(self, *args, **kwargs):
+                counter.renders += 1
+                return self.font.render(*args, **kwargs)
+
+            def __getattr__(self, name):
+                return getattr(self.font, name)
+
+        original_surface = pygame.Surface
+        original_fonts = dict(drawing._fonts)
+        pygame.Surface = CountingSurface
+        for key, font in original_fonts.items():
+            drawing._fonts[key] = CountingFont(font)
+        try:
+            yield self
+        finally:
+            pygame.Surface = original_surface
+            drawing._fonts.clear()
+            drawing._fonts.update(original_fonts)
+
+
+def random_stroke(grid, rng, r, c, points):
+    """A random walk of points inside square (r, c), like a player scribbling."""
+    rect = grid.grid_to_screen_rect(r, c)
+    step = max(2, rect.width // 8)
+    x, y = rect.center
+    stroke = deque(maxlen=MAX_SCRIBBLE_POINTS)
+    for _ in range(points):
+        x = min(max(x + rng.randint(-step, step), rect.left), rect.right - 1)
+        y = min(max(y + rng.randint(-step, step), rect.top), rect.bottom - 1)
+        stroke.append((x, y))
+    return stroke
+
+
+def load_scenario(client, scenario, seed=0):
+    """Fill a client with a synthetic game: a partly claimed board, players, locks and strokes."""
+    rng = random.Random(seed)
+    grid_size = scenario['grid_size']
+    client.grid_size = grid_size
+    client.grid.calculate_square_size()
+    player_ids = list(range(1, scenario['players'] + 1))
+    client.players = {
+        pid: {'name': f"Player_{pid}", 'color': f"#{rng.randrange(0x1000000):06x}"} for pid in player_ids
+    }
+    client.my_player_id = player_ids[0]
+    client.my_color_tuple = client.hex_to_rgb(client.players[client.my_player_id]['color'])
+
+    squares = [(r, c) for r in range(grid_size) for c in range(grid_size)]
+    rng.shuffle(squares)
+    claimed_count = int(len(squares) * scenario['claimed'])
+    claimed, free = squares[:claimed_count], squares[claimed_count:]
+    client.board = [[0] * grid_size for _ in range(grid_size)]
+    for r, c in claimed:
+        client.board[r][c] = rng.choice(player_ids)
+    client.scores.clear()
+    client.scores.update(pid for row in client.board for pid in row if pid)
+    client.leaders = [pid for pid, _ in client.scores.most_common(10)]
+
+    locked = free[:scenario['locks']]
+    client.locked_squares = {square: rng.choice(player_ids) for square in locked}
+    client.other_players_scribbles = {
+        (r, c): {'player_id': client.locked_squares[(r, c)],
+                 'points': random_stroke(client.grid, rng, r, c, scenario['points'])}
+        for r, c in locked[:scenario['scribbles']]
+    }
+
+    client.connected = True
+    client.current_scene = "game"
+    client.remaining_time = 120
+    client.set_status("Benchmark", COLOR_STATUS_INFO)
+
+
+def draw_frame(client):
+    """Draw and show one frame of the game scene."""
+    client.draw_game()
+    pygame.display.flip()
+
+
+def run_scenario(client, scenario, frames=300):
+    """Draw the scenario's scene for a number of frames and return the measurements."""
+    load_scenario(client, scenario)
+    for _ in range(WARMUP_FRAMES):
+        draw_frame(client)
+
+    frame_times = []
+    for i in range(frames):
+        # The timer changes every second in a real game, make its text change too
+        client.remaining_time = 120 - i % 120
+        start = time.perf_counter()
+        draw_frame(client)
+        frame_times.append(time.perf_counter() - start)
+
+    # Counting slows drawing down, so allocations are measured in their own passes
+    counter = AllocationCounter()
+    with counter.installed():
+        for _ in range(frames):
+            draw_frame(client)
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(frames):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            draw_frame(client)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'scenario': scenario,
+        'frames': frames,
+        'frame_ms': percentiles([t * 1000 for t in frame_times]),
+        'surfaces_per_frame': counter.surfaces / frames,
+        'renders_per_frame': counter.renders / frames,
+        'peak_kb_per_frame': percentiles([peak / 1024 for peak in peaks]),
+    }
+
+
+def percentiles(values):
+    """Get the median, 90th, 99th percentile and max of a list of numbers."""
+    values = sorted(values)
+    if not values:
+        return {'p50': 0, 'p90': 0, 'p99': 0, 'max': 0}
+    return {
+        'p50': values[len(values) // 2],
+        'p90': values[min(len(values) - 1, int(len(values) * 0.9))],
+        'p99': values[min(len(values) - 1, int(len(values) * 0.99))],
+        'max': values[-1],
+    }
+
+
+def format_percentiles(values):
+    """Format percentiles from percentiles."""
+    return ', '.join(f"{name} {value:.2f}" for name, value in values.items())
+
+
+def print_results(results):
+    """Print the results of run_scenario."""
+    scenario = results['scenario']
+    print(f"{scenario['name']}: {scenario['grid_size']}x{scenario['grid_size']} board, "
+          f"{scenario['players']} players, {scenario['locks']} locks, "
+          f"{scenario['scribbles']} strokes of {scenario['points']} points")
+    print(f"  Frame time (ms): {format_percentiles(results['frame_ms'])}")
+    print(f"  Per frame: {results['surfaces_per_frame']:.1f} surfaces, {results['renders_per_frame']:.1f} text renders")
+    print(f"  Peak Python memory per frame (KB): {format_percentiles(results['peak_kb_per_frame'])}")
+
+
+def main(client_class):
+    """Run the benchmark from the command line, drawing with client_class's scene."""
+    parser = argparse.ArgumentParser(description="Benchmark drawing the Deny & Conquer client.")
+    parser.add_argument("--frames", type=int, default=300, help="Frames measured per scenario")
+    parser.add_argument("--grid-size", type=int, help="Run one scenario with this board size instead of the standard ones")
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--claimed", type=float, default=0.5, help="Share of squares already claimed")
+    parser.add_argument("--locks", type=int, default=2, help="Locked squares")
+    parser.add_argument("--scribbles", type=int, default=2, help="Locked squares with another player's stroke")
+    parser.add_argument("--points", type=int, default=100, help="Points per stroke")
+    args = parser.parse_args()
+
+    if args.grid_size:
+        scenarios = [{
+            'name': "Custom", 'grid_size': args.grid_size, 'players': args.players, 'claimed': args.claimed,
+            'locks': args.locks, 'scribbles': min(args.scribbles, args.locks), 'points': args.points,
+        }]
+    else:
+        scenarios = SCENARIOS
+
+    # Keep the client's own output out of the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        client = client_class()
+    print(f"Video driver: {pygame.display.get_driver()}")
+    for scenario in scenarios:
+        print_results(run_scenario(client, scenario, args.frames))
+    pygame.quit()
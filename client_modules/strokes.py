@@ -0,0 +1,68 @@
+import math
+
+
+def point_segment_distance(p, a, b):
+    """Distance from point p to the segment from a to b."""
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return math.hypot(p[0] - a[0], p[1] - a[1])
+    t = max(0.0, min(1.0, ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / length_sq))
+    return math.hypot(p[0] - (a[0] + t * dx), p[1] - (a[1] + t * dy))
+
+
+class StrokeSimplifier:
+    """
+    Picks which points of a stroke are sent over the network while it is being drawn.
+    Points closer than min_distance to the previous point are skipped, and points on a
+    straight run are held back until one of them is more than tolerance away from the
+    line to the newest point, like Ramer-Douglas-Peucker done as the stroke comes in.
+    Only the corners are sent. The local stroke and its coverage keep every point.
+    """
+    def __init__(self, min_distance, tolerance, max_run=16):
+        self.min_distance = min_distance
+        self.tolerance = tolerance
+        self.max_run = max_run  # Longest run held back before its end is sent anyway
+        self.reset()
+
+    def reset(self):
+        """Start a new stroke."""
+        self.anchor = None  # Last point sent
+        self.run = []  # Points after the anchor that have not been sent yet
+        self.received = 0
+        self.sent = 0
+
+    def add(self, point):
+        """Add a point of the stroke and return the points to send now."""
+        self.received += 1
+        if self.anchor is None:
+            return self._send([point])
+        last = self.run[-1] if self.run else self.anchor
+        if math.hypot(point[0] - last[0], point[1] - last[1]) < self.min_distance:
+            return []
+
+        self.run.append(point)
+        # The run still fits on a line from the anchor to its newest point
+        if len(self.run) <= self.max_run and all(
+            point_segment_distance(p, self.anchor, point) <= self.tolerance for p in self.run[:-1]
+        ):
+            return []
+        # Everything before this point fit on a line ending at the previous point,
+        # so that point is the corner to send, and a new run starts from it
+        corner = self.run[-2]
+        self.run = [point]
+        return self._send([corner])
+
+    def flush(self):
+        """Return the held back end of the stroke, when the stroke ends."""
+        if not self.run:
+            return []
+        end, self.run = self.run[-1], []
+        return self._send([end])
+
+    def _send(self, points):
+        """Record points as sent."""
+        if points:
+            self.anchor = points[-1]
+            self.sent += len(points)
+        return points
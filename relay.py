@@ -0,0 +1,5 @@
+from server_modules.spectator_relay import main
+
+# Relay a running game to many spectators.
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,43 @@
+import argparse
 from server_modules import GameServer
 
+# Grid size and player limit of a massive room
+MASSIVE_GRID_SIZE = 64
+MASSIVE_MAX_PLAYERS = 256
+
 # Start the game server and listen for incoming connections.
 if __name__ == "__main__":
-    server = GameServer()
-    server.start()
+    parser = argparse.ArgumentParser(description="Run a Deny & Conquer server.")
+    parser.add_argument("--port", type=int, default=65433)
+    parser.add_argument("--grid-size", type=int, default=None)
+    parser.add_argument("--max-players", type=int, default=None)
+    parser.add_argument("--massive", action="store_true",
+                        help=f"Massive room: {MASSIVE_MAX_PLAYERS} players on a {MASSIVE_GRID_SIZE}x{MASSIVE_GRID_SIZE} board")
+    parser.add_argument("--handoff", metavar="PATH",
+                        help="Unix socket where a new server process can take the game over")
+    parser.add_argument("--takeover", action="store_true",
+                        help="Take the game over from the server waiting on --handoff")
+    parser.add_argument("--admin-port", type=int, default=None,
+                        help="Loopback port for profiling commands sent with admin.py")
+    parser.add_argument("--profile-dir", default="profiles", help="Directory for profiling results")
+    parser.add_argument("--shared-board", metavar="NAME", nargs='?', const="",
+                        help="Publish the board to shared memory for local readers, named deny_conquer_PORT by default")
+    parser.add_argument("--rounds", action="store_true",
+                        help="Play round after round with the same players instead of shutting down after a game")
+    parser.add_argument("--lobby-time", type=int, default=10, help="Seconds between rounds with --rounds")
+    parser.add_argument("--max-waiting", type=int, default=32,
+                        help="New players that can wait in line for a slot while the game is full")
+    parser.add_argument("--max-spectators", type=int, default=16,
+                        help="Spectators watching directly, more have to watch through relay.py")
+    args = parser.parse_args()
+    if args.takeover and not args.handoff:
+        parser.error("--takeover needs --handoff")
+
+    grid_size = args.grid_size or (MASSIVE_GRID_SIZE if args.massive else 8)
+    max_players = args.max_players or (MASSIVE_MAX_PLAYERS if args.massive else 4)
+    server = GameServer(port=args.port, grid_size=grid_size, max_players=max_players, handoff_path=args.handoff,
+                        admin_port=args.admin_port, profile_dir=args.profile_dir,
+                        shared_board=args.shared_board or (f"deny_conquer_{args.port}" if args.shared_board == "" else None),
+                        rounds=args.rounds, lobby_duration=args.lobby_time, max_waiting=args.max_waiting,
+                        max_spectators=args.max_spectators)
+    server.start(takeover=args.takeover)
@@ -7,5 +7,6 @@ from .game_server import GameServer
 from .board import GameBoard
 from .broadcaster import Broadcaster
 from .player_manager import PlayerManager
+from .simulation import GameSimulator
 
-__all__ = ['GameServer', 'GameBoard', 'Broadcaster', 'PlayerManager']
+__all__ = ['GameServer', 'GameBoard', 'Broadcaster', 'PlayerManager', 'GameSimulator']
@@ -0,0 +1,267 @@
+"""
+Admission control for new connections.
+The accept loop reads the first message of every new connection itself, before a thread
+or an outbox is spent on it. Players resuming a session are let in right away, and up to
+max_spectators spectators, more are sent to a spectator relay. New players are let in
+while a player slot is free, otherwise they wait in a line of bounded length and are let
+in first come first served whenever a player leaves. Connections that do not fit in the
+line, or whose first message is not CONNECT, RESUME or SPECTATE, are turned away.
+
+While waiting, a player is sent their place in line and an estimate of the wait:
+    QUEUED|position|seconds
+seconds is -1 until a player has left, which the estimate is based on.
+"""
+import selectors
+import socket
+import time
+from collections import deque
+
+# New players that can wait in line for a slot
+MAX_WAITING = 32
+# Spectators watching the game server directly, larger audiences go through a spectator relay
+MAX_SPECTATORS = 16
+# Connections that have not sent their first message yet
+MAX_PENDING = 256
+# Seconds a new connection gets to send its first message
+HELLO_TIMEOUT = 10
+# Bytes a waiting connection may send before it is let in
+MAX_WAITING_BUFFER = 4096
+# Recent departures the wait estimate is based on
+DEPARTURE_HISTORY = 10
+
+
+class PendingConnection:
+    """A connection held by the accept loop, with the data it sent so far."""
+    __slots__ = ('addr', 'buffer', 'since', 'waiting')
+
+    def __init__(self, addr, buffer=""):
+        self.addr = addr
+        self.buffer = buffer
+        self.since = time.time()
+        self.waiting = False
+
+
+class AdmissionQueue:
+    """Holds new connections until they may be served, and the line of players waiting for a slot.
+    Only the accept loop uses it, other threads only call slot_freed and wake."""
+    def __init__(self, player_manager, max_waiting=MAX_WAITING, max_spectators=MAX_SPECTATORS):
+        self.player_manager = player_manager
+        self.max_waiting = max_waiting
+        self.max_spectators = max_spectators
+        self.selector = selectors.DefaultSelector()
+        self.pending = {}  # Socket -> PendingConnection
+        self.waiting = deque()  # Sockets of new players waiting for a slot, first in line first
+        self.ready = []  # Pending sockets whose first message has already arrived
+        self.departures = deque(maxlen=DEPARTURE_HISTORY)  # Times players left
+        self.listening = None
+        # Written to by other threads to wake the accept loop up
+        self.wakeup, self.waker = socket.socketpair()
+        self.wakeup.setblocking(False)
+        self.waker.setblocking(False)
+        self.selector.register(self.wakeup, selectors.EVENT_READ)
+
+    def poll(self, server_socket, timeout):
+        """Wait up to timeout seconds for new connections and messages, and let in whoever may come in.
+        Returns the connections to serve, as (socket, address, unread data)."""
+        if self.listening is not server_socket:
+            if self.listening is not None:
+                self.selector.unregister(self.listening)
+            self.selector.register(server_socket, selectors.EVENT_READ)
+            self.listening = server_socket
+
+        admitted = []
+        for key, _ in self.selector.select(timeout if not self.ready else 0):
+            if key.fileobj is server_socket:
+                self.accept(server_socket)
+            elif key.fileobj is self.wakeup:
+                self.drain_wakeup()
+            else:
+                self.receive(key.fileobj)
+        ready, self.ready = self.ready, []
+        for sock in ready:
+            if sock in self.pending:
+                self.admit(sock, admitted)
+        self.drop_idle()
+        self.promote(admitted)
+        return admitted
+
+    def accept(self, server_socket):
+        """Accept a connection and wait for its first message, unless too many are waiting already."""
+        sock, addr = server_socket.accept()
+        print(f"Accepted connection from {addr}")
+        if len(self.pending) - len(self.waiting) >= MAX_PENDING:
+            self.refuse(sock, "ERROR|Server is busy, try again later.\n")
+            return
+        self.add(sock, addr)
+
+    def add(self, sock, addr, buffer=""):
+        """Hold on to a connection until its first message says what it wants."""
+        sock.setblocking(False)
+        self.pending[sock] = PendingConnection(addr, buffer)
+        self.selector.register(sock, selectors.EVENT_READ)
+        if '\n' in buffer:
+            self.ready.append(sock)
+
+    def receive(self, sock):
+        """Read from a held connection."""
+        entry = self.pending.get(sock)
+        if entry is None:
+            # Dropped earlier in the same round
+            return
+        try:
+            data = sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self.drop(sock)
+            return
+        had_message = '\n' in entry.buffer
+        entry.buffer += data.decode('utf-8', errors='replace')
+        if entry.waiting:
+            # Kept for when the player gets in, within limits
+            if len(entry.buffer) > MAX_WAITING_BUFFER:
+                self.drop(sock)
+        elif not had_message and '\n' in entry.buffer:
+            self.ready.append(sock)
+
+    def admit(self, sock, admitted):
+        """Act on the first message of a connection: let it in, put it in line or turn it away."""
+        entry = self.pending[sock]
+        command = entry.buffer.split('\n', 1)[0].split('|', 1)[0].strip()
+        if command == "RESUME":
+            # Resuming players keep their slot, the connection thread checks the session
+            admitted.append(self.release(sock))
+        elif command == "SPECTATE":
+            if self.player_manager.reserve_spectator(sock, self.max_spectators):
+                admitted.append(self.release(sock))
+            else:
+                self.drop(sock, "ERROR|Too many spectators, watch through a spectator relay.\n")
+        elif command != "CONNECT":
+            self.drop(sock, "ERROR|Invalid connection message.\n")
+        elif self.player_manager.game_over():
+            self.drop(sock, "ERROR|The game is over.\n")
+        elif not self.waiting and self.player_manager.reserve_slot(sock):
+            admitted.append(self.release(sock))
+        elif len(self.waiting) < self.max_waiting:
+            entry.waiting = True
+            self.waiting.append(sock)
+            print(f"Server full, {entry.addr} waits in line at place {len(self.waiting)}")
+            self.announce(sock, len(self.waiting))
+        else:
+            self.drop(sock, "ERROR|Server is full.\n")
+
+    def promote(self, admitted):
+        """Let players in from the front of the line while there are free slots.
+        Once the game is over, nobody in line gets in any more."""
+        if self.waiting and self.player_manager.game_over():
+            for sock in list(self.waiting):
+                self.pending[sock].waiting = False
+                self.drop(sock, "ERROR|The game is over.\n")
+            self.waiting.clear()
+            return
+        promoted = False
+        while self.waiting and self.player_manager.reserve_slot(self.waiting[0]):
+            sock = self.waiting.popleft()
+            admitted.append(self.release(sock))
+            promoted = True
+        if promoted:
+            self.announce_all()
+
+    def announce(self, sock, position):
+        """Tell a waiting player their place in line and the estimated wait."""
+        message = f"QUEUED|{position}|{self.estimate_wait(position)}\n"
+        try:
+            sock.send(message.encode('utf-8'))
+        except OSError:
+            self.drop(sock)
+
+    def announce_all(self):
+        """Tell everyone in line their new place."""
+        for position, sock in enumerate(list(self.waiting), 1):
+            if sock in self.pending:
+                self.announce(sock, position)
+
+    def estimate_wait(self, position):
+        """Estimate the seconds until the player at position gets in, from how often players
+        left lately. Returns -1 if no one has left yet."""
+        if not self.departures:
+            return -1
+        interval = (time.time() - self.departures[0]) / len(self.departures)
+        return max(1, round(interval * position))
+
+    def release(self, sock):
+        """Stop holding a connection so a connection thread can serve it.
+        Returns the socket, its address and the unread data."""
+        entry = self.pending.pop(sock)
+        self.selector.unregister(sock)
+        sock.setblocking(True)
+        return sock, entry.addr, entry.buffer
+
+    def drop(self, sock, message=None):
+        """Close a held connection, telling the client why if there is a message."""
+        entry = self.pending.pop(sock)
+        self.selector.unregister(sock)
+        if entry.waiting:
+            self.waiting.remove(sock)
+            self.announce_all()
+        self.refuse(sock, message)
+
+    def refuse(self, sock, message=None):
+        """Close a connection that will not be served."""
+        try:
+            if message:
+                sock.send(message.encode('utf-8'))
+            sock.close()
+        except OSError:
+            pass
+
+    def drop_idle(self):
+        """Close connections that did not say what they want in time."""
+        deadline = time.time() - HELLO_TIMEOUT
+        for sock, entry in list(self.pending.items()):
+            if not entry.waiting and entry.since < deadline and '\n' not in entry.buffer:
+                print(f"Connection from {entry.addr} sent nothing, closing it")
+                self.drop(sock)
+
+    def slot_freed(self):
+        """Called when a player left the game for good, to let the next one in line in."""
+        self.departures.append(time.time())
+        self.wake()
+
+    def wake(self):
+        """Wake the accept loop up to check the line."""
+        try:
+            self.waker.send(b'x')
+        except OSError:
+            # Full, the accept loop wakes up anyway
+            pass
+
+    def drain_wakeup(self):
+        """Read the wake-up bytes."""
+        try:
+            while self.wakeup.recv(4096):
+                pass
+        except OSError:
+            pass
+
+    def release_all(self):
+        """Let go of every held connection, to hand them to a new server process.
+        Returns (socket, unread data) for each, the ones in line first."""
+        socks = list(self.waiting) + [sock for sock in self.pending if sock not in self.waiting]
+        self.waiting.clear()
+        self.ready = []
+        released = []
+        for sock in socks:
+            sock, _, buffer = self.release(sock)
+            released.append((sock, buffer))
+        return released
+
+    def close(self):
+        """Close every held connection."""
+        self.waiting.clear()
+        for sock in list(self.pending):
+            self.selector.unregister(sock)
+            self.refuse(sock)
+        self.pending.clear()
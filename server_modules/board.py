@@ -1,20 +1,34 @@
 import threading
-from collections import defaultdict
+from collections import deque
+from shared_modules.board_hash import board_hash, row_hash, square_hash
+from .leaderboard import Leaderboard
+from .timing_wheel import TimingWheel
+
+# Seconds a lock lasts without scribble traffic from its holder
+LOCK_LEASE_DURATION = 5
 
 class GameBoard:
     """
     The GameBoard class is a 2D array of player IDs, where 0 represents an empty square.
     The board is also responsible for keeping track of which squares are locked by which players.
+    Every lock has a lease that runs out unless the holder keeps scribbling in the square,
+    unless lease_duration is None.
     """
-    def __init__(self, grid_size):
+    def __init__(self, grid_size, lease_duration=LOCK_LEASE_DURATION):
         """
         Initialize the game board with given grid size.
         """
         self.grid_size = grid_size
         self.board = [[0] * grid_size for _ in range(grid_size)]
         self.locks = {}
+        self.waiters = {}  # (row, col) -> deque of player IDs waiting for the lock, first in line first
+        self.lease_duration = lease_duration
+        self.leases = TimingWheel()
         self.lock = threading.Lock()
         self.claimed_squares = 0  # New counter for claimed squares
+        self.version = 0  # Incremented whenever a square is claimed
+        self.row_hashes = [0] * grid_size  # Updated on every claim, see board_hash.py
+        self.leaderboard = Leaderboard()
 
     def try_lock(self, r, c, player_id):
         """
@@ -26,9 +40,76 @@ class GameBoard:
                 and self.board[r][c] == 0 and (r, c) not in self.locks):
                 # Lock the square
                 self.locks[(r, c)] = player_id
+                if self.lease_duration:
+                    self.leases.schedule((r, c), self.lease_duration)
                 return True
             return False
 
+    def queue_lock(self, r, c, player_id):
+        """
+        Lock the given square for the given player, or put them in line for it if another player holds it.
+        A player waits for one square at a time, joining a line leaves the previous one.
+        Returns 0 if the lock was granted, the place in line if waiting, or None if the square is claimed.
+        """
+        with self.lock:
+            if not (0 <= r < self.grid_size and 0 <= c < self.grid_size) or self.board[r][c] != 0:
+                return None
+            holder = self.locks.get((r, c))
+            if holder is None:
+                self.locks[(r, c)] = player_id
+                if self.lease_duration:
+                    self.leases.schedule((r, c), self.lease_duration)
+                return 0
+            if holder == player_id:
+                return 0
+            line = self.waiters.get((r, c))
+            if line is None or player_id not in line:
+                self._cancel_waits(player_id)
+                line = self.waiters.setdefault((r, c), deque())
+                line.append(player_id)
+            return line.index(player_id) + 1
+
+    def cancel_wait(self, r, c, player_id):
+        """
+        Take the given player out of the line for the given square
+        """
+        with self.lock:
+            line = self.waiters.get((r, c))
+            if line and player_id in line:
+                line.remove(player_id)
+                if not line:
+                    del self.waiters[(r, c)]
+
+    def cancel_waits(self, player_id):
+        """
+        Take the given player out of every line, e.g. when they disconnect
+        """
+        with self.lock:
+            self._cancel_waits(player_id)
+
+    def _cancel_waits(self, player_id):
+        """Take the player out of every line. The caller holds the lock."""
+        for key in [key for key, line in self.waiters.items() if player_id in line]:
+            self.waiters[key].remove(player_id)
+            if not self.waiters[key]:
+                del self.waiters[key]
+
+    def _pass_lock(self, key):
+        """
+        Give a released lock to the first player waiting for the square. The caller holds the lock.
+        Returns the ID of that player, or 0 if nobody was waiting and the square is free.
+        """
+        line = self.waiters.get(key)
+        if not line:
+            return 0
+        player_id = line.popleft()
+        if not line:
+            del self.waiters[key]
+        self.locks[key] = player_id
+        if self.lease_duration:
+            self.leases.schedule(key, self.lease_duration)
+        return player_id
+
     def claim(self, r, c, player_id):
         """
         Claim the given square for the given player if it is locked by them
@@ -39,32 +120,156 @@ class GameBoard:
                 self.board[r][c] = player_id
                 # Release the square
                 del self.locks[(r, c)]
+                self.leases.cancel((r, c))
                 self.claimed_squares += 1  # Increment the counter
+                self.version += 1
+                self.row_hashes[r] ^= square_hash(r, c, player_id)
+                self.leaderboard.record_claim(player_id)
                 return True
             return False
 
+    def take_waiters(self, r, c):
+        """
+        Empty the line for the given square, e.g. once it is claimed.
+        Returns the IDs of the players that were waiting.
+        """
+        with self.lock:
+            return list(self.waiters.pop((r, c), ()))
+
     def release_lock(self, r, c, player_id):
         """
-        Release the given square if it is locked by the given player
+        Release the given square if it is locked by the given player.
+        The lock passes to the first player waiting for the square, if any.
+        Returns None if the player did not hold the lock, otherwise the ID of
+        the player that got the lock next, or 0 if the square is now free.
         """
         with self.lock:
             # Check if the square is locked by the player
             if self.locks.get((r, c)) == player_id:
                 # Release the square
                 del self.locks[(r, c)]
+                self.leases.cancel((r, c))
+                return self._pass_lock((r, c))
+            return None
+
+    def renew_lock(self, r, c, player_id, duration=None):
+        """
+        Extend the lease on the given square if it is locked by the given player
+        """
+        with self.lock:
+            if self.locks.get((r, c)) == player_id:
+                self.leases.renew((r, c), duration or self.lease_duration)
                 return True
             return False
 
+    def renew_all_locks(self, player_id, duration):
+        """
+        Extend the leases on all squares locked by the given player
+        """
+        with self.lock:
+            for key, pid in self.locks.items():
+                if pid == player_id:
+                    self.leases.renew(key, duration)
+
+    def expire_leases(self):
+        """
+        Release the locks whose lease has run out, passing them to the players waiting for them.
+        Returns the list of (row, col, player_id, next_player_id) that were released,
+        next_player_id is 0 if nobody was waiting.
+        """
+        with self.lock:
+            expired = []
+            for key in self.leases.advance():
+                player_id = self.locks.pop(key, None)
+                if player_id is not None:
+                    expired.append((key[0], key[1], player_id, self._pass_lock(key)))
+            return expired
+
     def release_all_locks(self, player_id):
         """
-        Release all squares locked by the given player
+        Release all squares locked by the given player and take them out of every line.
+        Returns the list of (row, col, next_player_id) released, next_player_id is
+        the player waiting for the square that got the lock, or 0.
         """
         with self.lock:
+            self._cancel_waits(player_id)
             # Find all locked squares by the player
             to_release = [(r, c) for (r, c), pid in self.locks.items() if pid == player_id]
+            released = []
             for key in to_release:
                 # Release the locked square
                 del self.locks[key]
+                self.leases.cancel(key)
+                released.append((key[0], key[1], self._pass_lock(key)))
+            return released
+
+    def get_hash(self):
+        """
+        Get the hash of the board, sent to clients so they can check their copy
+        """
+        with self.lock:
+            return board_hash(self.row_hashes)
+
+    def rows_differing(self, row_hashes):
+        """
+        Get a copy of every row whose hash is not the given one, as {row: [player IDs]}.
+        Every row differs if the number of hashes does not match the board.
+        """
+        with self.lock:
+            if len(row_hashes) != self.grid_size:
+                row_hashes = [None] * self.grid_size
+            return {r: list(self.board[r]) for r, h in enumerate(row_hashes) if h != self.row_hashes[r]}
+
+    def export_state(self):
+        """
+        Get the board, locks and claim counts for a new server process
+        """
+        with self.lock:
+            return {
+                'board': self.board,
+                'locks': [[r, c, player_id] for (r, c), player_id in self.locks.items()],
+                'waiters': [[r, c, list(line)] for (r, c), line in self.waiters.items()],
+                'claimed_squares': self.claimed_squares,
+                'version': self.version,
+            }
+
+    def import_state(self, state):
+        """
+        Restore the board handed over by the previous server process.
+        Locks get a fresh lease and the leaderboard is rebuilt from the claimed squares.
+        """
+        with self.lock:
+            self.board = state['board']
+            self.grid_size = len(self.board)
+            self.claimed_squares = state['claimed_squares']
+            self.version = state['version']
+            self.row_hashes = [row_hash(r, row) for r, row in enumerate(self.board)]
+            for r, c, player_id in state['locks']:
+                self.locks[(r, c)] = player_id
+                if self.lease_duration:
+                    self.leases.schedule((r, c), self.lease_duration)
+            for r, c, line in state.get('waiters', []):
+                self.waiters[(r, c)] = deque(line)
+            for row in self.board:
+                for player_id in row:
+                    if player_id:
+                        self.leaderboard.record_claim(player_id)
+
+    def reset(self):
+        """
+        Clear the board for a new round, reusing its rows.
+        The version keeps counting up, so snapshots of the old board are not mistaken for the new one.
+        """
+        with self.lock:
+            for row in self.board:
+                row[:] = [0] * self.grid_size
+            self.row_hashes[:] = [0] * self.grid_size
+            self.locks.clear()
+            self.waiters.clear()
+            self.leases.clear()
+            self.claimed_squares = 0
+            self.version += 1
+            self.leaderboard.reset()
 
     def is_full(self):
         """
@@ -77,31 +282,18 @@ class GameBoard:
         """
         Calculate the winner of the game
         """
-        with self.lock:
-            # Calculate score for each player
-            score_map = defaultdict(int)
-            # Count the number of squares claimed by each player
-            for r in range(self.grid_size):
-                for c in range(self.grid_size):
-                    # Get the player ID of the square
-                    pid = self.board[r][c]
-                    if pid:
-                        score_map[pid] += 1 # Increment the score
-
-            if not score_map:
-                return "Game Over! No squares claimed."
+        # The leaderboard already knows the player(s) with the highest score
+        max_score, winners = self.leaderboard.winners()
+        if not winners:
+            return "Game Over! No squares claimed."
 
-            # Find the player(s) with the highest score
-            max_score = max(score_map.values())
-            winners = [pid for pid, score in score_map.items() if score == max_score]
+        # Get the names of the winner(s)
+        players = player_manager.get_players()
+        winner_names = [players.get(pid, {}).get('name', f"Player_{pid}") for pid in winners]
 
-            # Get the names of the winner(s)
-            players = player_manager.get_players()
-            winner_names = [players[pid]['name'] for pid in winners]
-
-            if len(winner_names) == 1:
-                return f"Game Over! {winner_names[0]} wins with {max_score} squares!"
-            return f"Game Over! It's a tie between {', '.join(winner_names)} with {max_score} squares!"
+        if len(winner_names) == 1:
+            return f"Game Over! {winner_names[0]} wins with {max_score} squares!"
+        return f"Game Over! It's a tie between {', '.join(winner_names)} with {max_score} squares!"
 
     def get_board(self):
         """
@@ -116,22 +308,3 @@ class GameBoard:
         """
         with self.lock:
             return dict(self.locks)
-
-    def is_locked_by(self, row, col, player_id):
-        """Check if a square is locked by a specific player."""
-        return (row, col) in self.locks and self.locks[(row, col)] == player_id
-    
-    def is_square_available(self, row, col):
-        """Check if a square is available (not claimed and not locked)."""
-        return (0 <= row < self.grid_size and 
-                0 <= col < self.grid_size and 
-                self.board[row][col] == 0 and  
-                (row, col) not in self.locks)
-    
-    def lock_square(self, row, col, player_id):
-        """Lock a square for a player."""
-        if self.is_square_available(row, col):
-            self.locks[(row, col)] = player_id
-            return True
-        return False
-
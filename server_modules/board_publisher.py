@@ -0,0 +1,190 @@
+"""
+Shared-memory publication of the board for local observer processes.
+The server copies the board, the lock map and the board version into a shared memory
+block whenever they change, and readers in other processes take snapshots from it at
+any rate without a connection to the server.
+
+Writes are guarded by a sequence counter like a seqlock: the writer makes the counter
+odd, writes, then makes it even again. A reader copies the data between two reads of
+the counter and retries if they differ or are odd.
+
+Layout, all little-endian:
+    0   uint64  sequence counter, odd while a write is in progress
+    8   uint64  board version, incremented on every claim
+    16  uint32  grid size N
+    20  uint32  number of locks
+    24  4 bytes magic b'DCB1'
+    32  int32[N*N]  board, player ID per square row by row, 0 if unclaimed
+    ..  int32[N*N*3]  locks as (row, col, player ID)
+
+Watch a running server's board with:
+    python watch_board.py --name deny_conquer_65433
+"""
+import argparse
+import os
+import struct
+import threading
+import time
+from array import array
+from multiprocessing import resource_tracker, shared_memory
+
+HEADER = struct.Struct('<QQII4s4x')
+SEQ = struct.Struct('<Q')
+MAGIC = b'DCB1'
+# Seconds between checks for board changes
+PUBLISH_INTERVAL = 0.05
+# Attempts a reader makes before giving up on a block that is being written
+READ_ATTEMPTS = 1000
+
+
+def untrack(shm):
+    """Keep this process's resource tracker from removing the block when the process exits.
+    Only POSIX systems track shared memory, Windows frees it with its last handle."""
+    if os.name == 'posix':
+        resource_tracker.unregister(shm._name, 'shared_memory')
+
+
+def block_size(grid_size):
+    """Bytes needed for a board of the given size."""
+    return HEADER.size + 4 * grid_size * grid_size * 4
+
+
+class BoardPublisher:
+    """Publishes a GameBoard into shared memory from its own thread, whenever it changed."""
+    def __init__(self, board, name, interval=PUBLISH_INTERVAL):
+        """Create the shared memory block, or reuse the one a previous server process left."""
+        self.board = board
+        self.name = name
+        self.interval = interval
+        size = block_size(board.grid_size)
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left by the server process this one took over from, readers stay attached
+            self.shm = shared_memory.SharedMemory(name=name)
+            if self.shm.size < size:
+                self.shm.close()
+                raise ValueError(f"Shared memory {name} is too small for a {board.grid_size}x{board.grid_size} board")
+        self.seq = SEQ.unpack_from(self.shm.buf, 0)[0] & ~1
+        self.published = None
+        self.running = False
+
+    def start(self):
+        """Publish the board now and then whenever it changes."""
+        self.running = True
+        threading.Thread(target=self.run, daemon=True).start()
+        print(f"Publishing the board to shared memory {self.name}")
+
+    def run(self):
+        """Check the board for changes until stopped."""
+        while self.running:
+            self.publish()
+            time.sleep(self.interval)
+
+    def publish(self):
+        """Write the board to shared memory if it changed since the last time."""
+        with self.board.lock:
+            state = (self.board.version, self.board.grid_size, dict(self.board.locks))
+            if state == self.published:
+                return
+            cells = array('i', [player_id for row in self.board.board for player_id in row])
+        version, grid_size, locks = state
+        lock_entries = array('i', [value for (r, c), player_id in locks.items() for value in (r, c, player_id)])
+
+        buf = self.shm.buf
+        board_end = HEADER.size + 4 * len(cells)
+        # Odd while writing, so readers know to retry
+        self.seq += 1
+        SEQ.pack_into(buf, 0, self.seq)
+        buf[HEADER.size:board_end] = cells.tobytes()
+        buf[board_end:board_end + 4 * len(lock_entries)] = lock_entries.tobytes()
+        HEADER.pack_into(buf, 0, self.seq, version, grid_size, len(locks), MAGIC)
+        self.seq += 1
+        SEQ.pack_into(buf, 0, self.seq)
+        self.published = state
+
+    def close(self, unlink=True):
+        """Stop publishing, and remove the block unless another server process takes it over."""
+        self.running = False
+        self.shm.close()
+        if unlink:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+        else:
+            untrack(self.shm)
+
+
+class BoardReader:
+    """Takes consistent snapshots of a board published by BoardPublisher."""
+    def __init__(self, name):
+        """Attach to the shared memory block of a running server."""
+        self.shm = shared_memory.SharedMemory(name=name)
+        # Only the server removes the block
+        untrack(self.shm)
+
+    def read(self, reader):
+        """
+        Call reader with the header fields and a memoryview of the board and locks,
+        straight from shared memory without copying, until a call saw no write.
+        Returns what the last call of reader returned.
+        """
+        buf = self.shm.buf
+        for _ in range(READ_ATTEMPTS):
+            seq, version, grid_size, lock_count, magic = HEADER.unpack_from(buf, 0)
+            if seq & 1 or magic != MAGIC:
+                time.sleep(0)
+                continue
+            data = buf[HEADER.size:block_size(grid_size)].cast('i')
+            try:
+                result = reader(version, grid_size, lock_count, data)
+            finally:
+                data.release()
+            if SEQ.unpack_from(buf, 0)[0] == seq:
+                return result
+        raise TimeoutError("The board kept changing while being read")
+
+    def snapshot(self):
+        """Get a copy of the board as {'version', 'board', 'locks'}."""
+        def copy(version, grid_size, lock_count, data):
+            cells = data[:grid_size * grid_size].tolist()
+            entries = data[grid_size * grid_size:grid_size * grid_size + 3 * lock_count].tolist()
+            return {
+                'version': version,
+                'board': [cells[r * grid_size:(r + 1) * grid_size] for r in range(grid_size)],
+                'locks': {(entries[i], entries[i + 1]): entries[i + 2] for i in range(0, len(entries), 3)},
+            }
+        return self.read(copy)
+
+    def close(self):
+        """Detach from the block."""
+        self.shm.close()
+
+
+def main():
+    """Print a summary of a published board whenever it changes."""
+    parser = argparse.ArgumentParser(description="Watch the board of a local Deny & Conquer server.")
+    parser.add_argument("--name", default="deny_conquer_65433", help="Shared memory name given to the server")
+    parser.add_argument("--interval", type=float, default=0.5, help="Seconds between snapshots")
+    args = parser.parse_args()
+
+    reader = BoardReader(args.name)
+    last_version = None
+    try:
+        while True:
+            state = reader.snapshot()
+            claimed = sum(1 for row in state['board'] for player_id in row if player_id)
+            summary = (state['version'], claimed, len(state['locks']))
+            if summary != last_version:
+                print(f"Version {state['version']}: {claimed} squares claimed, {len(state['locks'])} locked")
+                last_version = summary
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,272 @@
+import threading
+import time
+from collections import deque
+from .compression import Payload
+from .outbox import Outbox
+from .stroke_store import StrokeStore
+
+# Number of sequenced events kept for clients that resume a dropped session
+EVENT_LOG_SIZE = 4096
+# Average bytes queued per client before scribble relaying is slowed down
+BACKLOG_LOW = 32 * 1024
+# Slowest scribble relay rate, as a fraction of the normal rate
+MIN_RELAY_SCALE = 0.1
+# Pixels a scribble point must be from the last one relayed for the same stroke,
+# raised as the relay slows down under backlog
+RELAY_MIN_DISTANCE = 3
+
+
 class Broadcaster:
-    """ The Broadcaster class is responsible 
+    """ The Broadcaster class is responsible
         for broadcasting messages to all connected clients. """
     def __init__(self, player_manager, board):
         """ Initialize the broadcaster with a player manager and board. """
         self.player_manager = player_manager
         self.board = board
+        # Every state event gets a sequence number so reconnecting clients can catch up
+        self.seq = 0
+        self.event_log = deque(maxlen=EVENT_LOG_SIZE)
+        self.seq_lock = threading.Lock()
+        # Outgoing queue of every connected client
+        self.outboxes = {}
+        self.relay_scale_value = 1.0
+        self.udp_channel = None  # Set by the game server when UDP is available
+        # Serialized snapshots, reused until the board or player list version changes
+        self.board_snapshot = (None, "", None)
+        self.players_snapshot = (None, "", None)
+        self.relay_scale_updated = 0
+        # Version of the last leaderboard sent, so it is only sent when it changes
+        self.leaderboard_version = 0
+        self.leaderboard_lock = threading.Lock()
+        self.last_relayed = {}  # Player ID -> (row, col, x, y) of the last scribble point relayed
+        # Strokes in progress, sent to clients that join in the middle of one
+        self.strokes = StrokeStore()
 
-    def broadcast(self, message, sender_socket=None, exclude_sender=False):
-        """ Broadcast a message to all connected clients. """
-        encoded = message.encode('utf-8')
-        # Send the message to all connected clients
-        for sock in list(self.player_manager.clients.keys()):
-            # Exclude the sender 
-            if exclude_sender and sock == sender_socket:
-                continue
-            try:
-                sock.sendall(encoded)
-            except:
-                pass 
+    def open_outbox(self, sock, compress=False):
+        """ Start queueing outgoing messages for a client.
+            compress is the compression the client negotiated, 'zlib' or 'zdict', or False. """
+        self.outboxes[sock] = Outbox(sock, compress=compress)
+
+    def close_outbox(self, sock):
+        """ Stop sending to a client. """
+        outbox = self.outboxes.pop(sock, None)
+        if outbox:
+            outbox.close()
+
+    def detach_outboxes(self, timeout):
+        """ Flush and stop every outbox before the sockets are handed to a new server process. """
+        deadline = time.time() + timeout
+        for sock, outbox in list(self.outboxes.items()):
+            if not outbox.detach(max(0, deadline - time.time())):
+                print("A client's queued messages did not drain before the handoff.")
+        self.outboxes.clear()
+
+    def export_state(self):
+        """ Get the event sequence for a new server process. The caller holds seq_lock. """
+        return {
+            'seq': self.seq,
+            'event_log': list(self.event_log),
+        }
+
+    def import_state(self, state):
+        """ Continue the event sequence of the previous server process.
+            The leaderboard is rebuilt, so it is sent again on the next change. """
+        with self.seq_lock:
+            self.seq = state['seq']
+            self.event_log.extend(tuple(event) for event in state['event_log'])
+
+    def reset_round(self):
+        """ Forget the strokes of the round that ended. """
+        self.strokes.clear()
+        self.last_relayed.clear()
+
+    def send(self, sock, message):
+        """ Send a message to a single client, in order with its broadcasts. """
+        self.send_payload(sock, Payload(message.encode('utf-8')))
+
+    def send_payload(self, sock, payload):
+        """ Send encoded messages to a single client, compressed if it negotiated it. """
+        outbox = self.outboxes.get(sock)
+        if outbox:
+            outbox.send(payload.for_client(outbox.compress))
+
+    def relay_scale(self):
+        """ How fast scribbles should be relayed, from 1 down to MIN_RELAY_SCALE
+            as the clients' outgoing queues grow. Recomputed at most every 0.1 seconds. """
+        now = time.monotonic()
+        if now - self.relay_scale_updated >= 0.1:
+            outboxes = list(self.outboxes.values())
+            backlog = sum(outbox.queued_bytes for outbox in outboxes) / max(1, len(outboxes))
+            self.relay_scale_value = 1.0 if backlog <= BACKLOG_LOW else max(MIN_RELAY_SCALE, BACKLOG_LOW / backlog)
+            self.relay_scale_updated = now
+        return self.relay_scale_value
+
+    def broadcast(self, message, sender_socket=None, exclude_sender=False, sequenced=True):
+        """ Broadcast a message to all connected clients.
+            Sequenced messages are prefixed with SEQ|n| and kept in the event log. """
+        with self.seq_lock:
+            if sequenced:
+                self.seq += 1
+                message = f"SEQ|{self.seq}|{message}"
+                self.event_log.append((self.seq, message))
+            # Encoded once, and compressed at most once per kind of compression, for all recipients
+            payload = Payload(message.encode('utf-8'))
+            # Queue the message for all connected clients and spectators
+            for sock in list(self.player_manager.clients) + list(self.player_manager.spectators):
+                # Exclude the sender
+                if exclude_sender and sock == sender_socket:
+                    continue
+                outbox = self.outboxes.get(sock)
+                if outbox:
+                    outbox.send(payload.for_client(outbox.compress))
+
+    def replay_since(self, last_seq):
+        """ Get the logged events after last_seq.
+            Returns None if some of them have already been dropped from the log. """
+        if last_seq > self.seq:
+            return None
+        if last_seq == self.seq:
+            return []
+        if not self.event_log or self.event_log[0][0] > last_seq + 1:
+            return None
+        return [message for seq, message in self.event_log if seq > last_seq]
+
+    def attach_client(self, sock, register, last_seq=None):
+        """ Register a client and bring it up to date, with no broadcast in between.
+            A resuming client with last_seq gets the events it missed, or the full state
+            if they are gone from the log. A new client gets the full state.
+            register can return False to turn the client away, then this returns False. """
+        with self.seq_lock:
+            missed = self.replay_since(last_seq) if last_seq is not None else None
+            if register() is False:
+                return False
+            if missed is None:
+                for payload in self.full_state():
+                    self.send_payload(sock, payload)
+            elif missed:
+                self.send(sock, ''.join(missed))
+            return True
+
+    def full_state(self):
+        """ Get the full players, board and lock state as of the current sequence number,
+            as payloads for the joining client. The caller holds seq_lock. """
+        self.get_players_snapshot()
+        self.get_board_snapshot()
+        state = [
+            Payload(f"SYNC|{self.seq}\n".encode('utf-8')),
+            self.players_snapshot[2],
+            self.board_snapshot[2],
+            Payload(f"UPDATE_LOCKS|{repr(self.board.get_locks())}\n".encode('utf-8')),
+            Payload(f"LEADERBOARD|{','.join(map(str, self.board.leaderboard.leaders()[1]))}\n".encode('utf-8')),
+        ]
+        strokes = self.strokes.message(self.board.get_locks())
+        if strokes:
+            state.append(Payload(strokes.encode('utf-8')))
+        return state
+
+    def get_board_snapshot(self):
+        """ Get the UPDATE_BOARD message, serialized at most once per board version. """
+        version = self.board.version
+        if self.board_snapshot[0] != version:
+            message = f"UPDATE_BOARD|{repr(self.board.get_board())}\n"
+            self.board_snapshot = (version, message, Payload(message.encode('utf-8')))
+        return self.board_snapshot[1]
+
+    def get_players_snapshot(self):
+        """ Get the UPDATE_PLAYERS message, serialized at most once per player list version. """
+        version = self.player_manager.players_version
+        if self.players_snapshot[0] != version:
+            message = f"UPDATE_PLAYERS|{repr(self.player_manager.get_players())}\n"
+            self.players_snapshot = (version, message, Payload(message.encode('utf-8')))
+        return self.players_snapshot[1]
 
     def broadcast_board(self):
         """ Broadcast the current state of the board. """
-        board_repr = repr(self.board.get_board())
-        self.broadcast(f"UPDATE_BOARD|{board_repr}\n")
-
-    def broadcast_players(self):
-        """ Broadcast the current list of players. """
-        players = repr(self.player_manager.get_players())
-        self.broadcast(f"UPDATE_PLAYERS|{players}\n")
-
-    def broadcast_scores(self):
-        """ Broadcast the current scores. """
-        board_data = self.board.get_board()
-        # Count the number of squares claimed by each player
-        score_map = {}
-        for row in board_data:
-            for pid in row:
-                if pid != 0:
-                    score_map[pid] = score_map.get(pid, 0) + 1 # Increment the score 
-        self.broadcast(f"UPDATE_SCORES|{repr(score_map)}\n")
+        self.broadcast(self.get_board_snapshot())
+
+    def broadcast_player_joined(self, info, sock):
+        """ Tell everyone but the new player that a player joined. """
+        self.broadcast(f"PLAYER_JOINED|{info['id']}|{info['color']}|{info['name']}\n",
+                       sender_socket=sock, exclude_sender=True)
+
+    def broadcast_player_left(self, player_id):
+        """ Tell everyone that a player left. """
+        self.last_relayed.pop(player_id, None)
+        self.broadcast(f"PLAYER_LEFT|{player_id}\n")
+
+    def broadcast_leaderboard(self):
+        """ Broadcast the IDs of the leading players, best first, if they changed since the last time.
+            Clients count the scores themselves from the board. """
+        with self.leaderboard_lock:
+            version, leaders = self.board.leaderboard.leaders()
+            if version == self.leaderboard_version:
+                return
+            self.leaderboard_version = version
+            self.broadcast(f"LEADERBOARD|{','.join(map(str, leaders))}\n")
+
+    def broadcast_scribble(self, r, c, player_id, x, y):
+        """ Relay a scribble point to everyone but the player drawing it.
+            Scribbles are not sequenced, and go over UDP to clients that enabled it.
+            Points close to the previous one are decimated. """
+        # Drop points too close to the last one relayed to show up on other screens
+        last = self.last_relayed.get(player_id)
+        if last and last[:2] == (r, c):
+            min_distance = RELAY_MIN_DISTANCE / self.relay_scale()
+            if (x - last[2]) ** 2 + (y - last[3]) ** 2 < min_distance ** 2:
+                return
+        self.last_relayed[player_id] = (r, c, x, y)
+        self.strokes.add(r, c, player_id, x, y)
+
+        message = f"PLAYER_SCRIBBLE|{r}|{c}|{player_id}|{x}|{y}\n"
+        encoded = message.encode('utf-8')
+        for sock, info in list(self.player_manager.clients.items()):
+            if info['id'] == player_id:
+                continue
+            if self.udp_channel and info.get('udp_enabled'):
+                self.udp_channel.send(info['udp_addr'], message)
+                continue
+            outbox = self.outboxes.get(sock)
+            if outbox:
+                outbox.send(encoded)
+        for sock in list(self.player_manager.spectators):
+            outbox = self.outboxes.get(sock)
+            if outbox:
+                outbox.send(encoded)
+
+    def broadcast_board_hash(self):
+        """ Send the hash of the board, so clients can check their copy.
+            Not sequenced, the next hash supersedes it. """
+        self.broadcast(f"BOARD_HASH|{self.board.get_hash():x}\n", sequenced=False)
+
+    def send_board_rows(self, sock, row_hashes):
+        """ Send a client the rows of the board whose hash differs from its copy, in order
+            with the broadcasts so no claim sent after the rows is overwritten by them.
+            Format: BOARD_ROWS|r:player_id,player_id,...;r:... """
+        with self.seq_lock:
+            rows = self.board.rows_differing(row_hashes)
+            if rows:
+                payload = ';'.join(f"{r}:{','.join(map(str, row))}" for r, row in rows.items())
+                self.send(sock, f"BOARD_ROWS|{payload}\n")
 
     def broadcast_lock(self, r, c, player_id):
         """ Broadcast that a square has been locked. """
         self.broadcast(f"SQUARE_LOCKED|{r}|{c}|{player_id}\n")
 
+    def send_to_player(self, player_id, message):
+        """ Send a message to a single player, if they are connected. """
+        sock = self.player_manager.get_socket(player_id)
+        if sock is not None:
+            self.send(sock, message)
+
+    def broadcast_release(self, r, c, next_player_id=0):
+        """ Broadcast that a lock was released. If a player waiting for the square got
+            the lock, grant it to them and tell everyone the square is locked again. """
+        self.broadcast_unlock(r, c)
+        if next_player_id:
+            self.send_to_player(next_player_id, f"LOCK_GRANTED|{r}|{c}\n")
+            self.broadcast_lock(r, c, next_player_id)
+
     def broadcast_unlock(self, r, c):
         """Broadcast that a square has been unlocked."""
+        self.strokes.discard(r, c)
         self.broadcast(f"SQUARE_UNLOCKED|{r}|{c}\n")
-
@@ -0,0 +1,42 @@
+from shared_modules.compression import deflate
+
+# Messages shorter than this are sent as they are, compressing them is not worth it
+COMPRESS_THRESHOLD = 512
+# With the preset dictionary, messages this long already shrink by more than the frame header
+DICT_COMPRESS_THRESHOLD = 48
+
+
+def negotiate(options):
+    """Get the compression asked for in the options of CONNECT or RESUME:
+    'zdict' for frames primed with the preset dictionary, 'zlib' for plain ones, or False."""
+    if 'zdict' in options:
+        return 'zdict'
+    return 'zlib' if 'zlib' in options else False
+
+
+def pack(data, zdict=False):
+    """Compress encoded messages into a frame: Z|length followed by length bytes of zlib data."""
+    packed = deflate(data, zdict)
+    return f"Z|{len(packed)}\n".encode('utf-8') + packed
+
+
+class Payload:
+    """
+    Encoded messages on their way to one or more clients.
+    The compressed frame is made the first time a client that negotiated compression needs it,
+    and reused for every other client that negotiated the same compression.
+    """
+    def __init__(self, data):
+        self.data = data
+        self.packed = {}  # Whether the frame uses the preset dictionary -> frame
+
+    def for_client(self, compress):
+        """Get the bytes to send to a client, compressed if it asked for it and the data is large enough."""
+        zdict = compress == 'zdict'
+        threshold = DICT_COMPRESS_THRESHOLD if zdict else COMPRESS_THRESHOLD
+        if not compress or len(self.data) < threshold:
+            return self.data
+        packed = self.packed.get(zdict)
+        if packed is None:
+            packed = self.packed[zdict] = pack(self.data, zdict)
+        return packed
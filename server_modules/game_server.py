@@ -1,18 +1,42 @@
+import os
 import socket
 import threading
 import sys
 import time
+from .admission import MAX_SPECTATORS, MAX_WAITING, AdmissionQueue
 from .board import GameBoard
+from .board_publisher import BoardPublisher
 from .broadcaster import Broadcaster
+from .handoff import handoff_supported, receive_handoff, send_handoff
 from .player_manager import PlayerManager
+from .profiling import ProfilingConsole
+from .udp_channel import UdpChannel
+
+# Seconds the clients' queued messages get to drain before their sockets are handed off
+OUTBOX_DRAIN_TIMEOUT = 5
+# Seconds the connection and background threads get to stop before a handoff is given up
+PARK_TIMEOUT = 10
+# Seconds between the end of a round and the start of the next one
+LOBBY_DURATION = 10
+# Seconds the result stays up after the last game before the server shuts down
+SHUTDOWN_DELAY = 20
 
 class GameServer:
     """The GameServer class is responsible for
     starting and stopping the game server."""
 
-    def __init__(self, host='0.0.0.0', port=65433, grid_size=8, max_players=4):
+    def __init__(self, host='0.0.0.0', port=65433, grid_size=8, max_players=4, handoff_path=None,
+                 admin_port=None, profile_dir='profiles', shared_board=None, rounds=False,
+                 lobby_duration=LOBBY_DURATION, max_waiting=MAX_WAITING, max_spectators=MAX_SPECTATORS):
         """
         Initialize the GameServer instance with given parameters.
+        With rounds, the server starts a new round lobby_duration seconds after a game ends
+        instead of shutting down, keeping the players connected.
+        Up to max_waiting new players wait in line while the game is full, and up to
+        max_spectators spectators watch directly, more have to use a spectator relay.
+        handoff_path is a Unix socket where a new server process can take the game over.
+        admin_port is a loopback port for profiling commands, whose results go to profile_dir.
+        shared_board is the name of a shared memory block the board is published to.
         """
         self.host = host
         self.port = port
@@ -27,73 +51,278 @@ class GameServer:
         # Create the player manager and board and reference to the game server
         self.player_manager = PlayerManager(max_players)
         self.player_manager.set_game_server(self)  
+        # New connections are held here until they may be served
+        self.admission = AdmissionQueue(self.player_manager, max_waiting, max_spectators)
+        self.player_manager.admission = self.admission
         self.board = GameBoard(grid_size)
         # Create the broadcaster
         self.broadcaster = Broadcaster(self.player_manager, self.board)
+        # Optional UDP channel for scribble traffic
+        self.udp_channel = UdpChannel(host, port, self.player_manager, self.board, self.broadcaster)
         self.game_active = True
+        self.running = True  # Cleared to stop accepting connections and shut down, the game may end earlier
+        self.stop_time = None  # When the server shuts down after the game ended
         self.timer_duration = 120  # Timer duration in seconds (2 minutes)
         self.timer_start_time = None  # To track when the timer starts
         self.timer_started = False  # To track if timer has been started
+        # Continuous play
+        self.rounds = rounds
+        self.lobby_duration = lobby_duration
+        self.round = 1
+        self.in_lobby = False  # Between the end of a round and the start of the next one
+        self.lobby_deadline = None  # When the next round starts
+        self.round_lock = threading.Lock()
+        # Hot restart
+        self.handoff_path = handoff_path if handoff_path and handoff_supported() else None
+        if handoff_path and not self.handoff_path:
+            print("Handing off to a new server process is not supported on this platform.")
+        self.handing_off = False
+        self.accepting = threading.Event()  # Cleared once the accept loop stopped for a handoff
+        self.handoff_failed = threading.Event()
+        self.background_threads = []
+        self.profiling_console = ProfilingConsole(self, admin_port, profile_dir) if admin_port else None
+        self.shared_board = shared_board
+        self.board_publisher = None
 
-    def start(self):
+    def start(self, takeover=False):
         """
         Start the game server and listen for incoming connections.
+        With takeover, the game is taken over from the server process listening on handoff_path.
         """
         try:
-            # Bind the socket to the host and port
-            self.server_socket.bind((self.host, self.port))
+            if takeover:
+                self.take_over()
+            else:
+                # Bind the socket to the host and port
+                self.server_socket.bind((self.host, self.port))
 
-            # Listen for incoming connections
-            self.server_socket.listen()
+                # Listen for incoming connections
+                self.server_socket.listen()
+                if self.udp_channel.start():
+                    self.broadcaster.udp_channel = self.udp_channel
             print(f"Deny & Conquer Server listening on {self.host}:{self.port}")
             print(f"Grid Size: {self.grid_size}x{self.grid_size}, Max Players: {self.max_players}")
 
-            # Start a thread to broadcast the timer
-            timer_thread = threading.Thread(target=self.broadcast_timer, daemon=True)
-            timer_thread.start()
+            self.start_background_threads()
+            if self.shared_board:
+                # Created after a takeover, which may change the grid size
+                self.board_publisher = BoardPublisher(self.board, self.shared_board)
+                self.board_publisher.start()
+            if self.profiling_console:
+                self.profiling_console.start()
+            if self.handoff_path:
+                threading.Thread(target=self.listen_for_handoff, daemon=True).start()
 
-            # Start accepting connections
-            while self.game_active:
-                try:
-                    # Accept a connection
-                    client_socket, addr = self.server_socket.accept()
-                    print(f"Accepted connection from {addr}")
-
-                    # Start a new thread to handle the client
-                    client_thread = threading.Thread(
-                        target=self.player_manager.handle_client,
-                        args=(client_socket, addr, self.board, self.broadcaster, self.check_game_over),
-                        daemon=True,
-                    )
-                    client_thread.start()
-
-                except KeyboardInterrupt:
-                    print("\nCtrl+C detected. Shutting down server...")
-                    self.game_active = False
+            while self.running:
+                self.accept_connections()
+                if not self.handing_off:
                     break
-                except Exception as e:
-                    print(f"Error accepting connection: {e}")
+                # The handoff thread exits the process, unless the handoff fails
+                self.handoff_failed.wait()
+                self.handoff_failed.clear()
+        except KeyboardInterrupt:
+            print("\nCtrl+C detected. Shutting down server...")
+            self.game_active = False
+            self.running = False
         finally:
             # Shut down the server when we're done
             self.shutdown()
 
+    def start_background_threads(self):
+        """
+        Start the threads that broadcast the timer and release locks whose lease ran out.
+        A thread still running after a failed handoff carries on instead of being started again.
+        """
+        targets = [self.broadcast_timer, self.expire_leases]
+        if self.in_lobby:
+            targets.append(self.run_lobby)
+        self.background_threads = [thread for thread in self.background_threads if thread.is_alive()]
+        running = {thread.name for thread in self.background_threads}
+        for target in targets:
+            if target.__name__ not in running:
+                thread = threading.Thread(target=target, name=target.__name__, daemon=True)
+                self.background_threads.append(thread)
+                thread.start()
+
+    def accept_connections(self):
+        """
+        Accept connections until the server stops or starts handing off.
+        A connection only gets a thread once the admission queue lets it in.
+        """
+        self.accepting.set()
+        try:
+            while self.running and not self.handing_off:
+                try:
+                    # Wait for connections and first messages, waking up now and then to notice a handoff
+                    for client_socket, addr, buffer in self.admission.poll(self.server_socket, 1):
+                        # Start a new thread to handle the client
+                        client_thread = threading.Thread(
+                            target=self.player_manager.handle_client,
+                            args=(client_socket, addr, self.board, self.broadcaster, self.check_game_over, buffer),
+                            daemon=True,
+                        )
+                        client_thread.start()
+
+                except Exception as e:
+                    print(f"Error accepting connection: {e}")
+        finally:
+            self.accepting.clear()
+
+    def listen_for_handoff(self):
+        """
+        Wait for a new server process to connect on handoff_path and hand the game to it.
+        """
+        if os.path.exists(self.handoff_path):
+            os.unlink(self.handoff_path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.handoff_path)
+        listener.listen(1)
+        print(f"Waiting for a new server process on {self.handoff_path}")
+        while True:
+            conn, _ = listener.accept()
+            try:
+                self.hand_off(conn)
+            finally:
+                conn.close()
+
+    def hand_off(self, conn):
+        """
+        Stop serving, send the sockets and the room state to the new server process on conn
+        and exit once it took over. If the handoff fails, carry on serving.
+        """
+        print("New server process connected, handing off the game...")
+        self.handing_off = True
+        while self.accepting.is_set():
+            time.sleep(0.1)
+        # Connections still waiting to be let in go along with the parked ones
+        held = self.admission.release_all()
+        with self.player_manager.lock:
+            self.player_manager.parked.extend(held)
+        # A thread stuck in a blocking call must not stall the game for good
+        deadline = time.time() + PARK_TIMEOUT
+        parked = self.player_manager.park_connections(PARK_TIMEOUT)
+        for thread in self.background_threads:
+            thread.join(max(0, deadline - time.time()))
+        if not parked or any(thread.is_alive() for thread in self.background_threads):
+            print("Handoff failed: threads did not stop in time, carrying on.")
+            self.player_manager.unpark_connections(self.board, self.broadcaster, self.check_game_over)
+            self.handing_off = False
+            self.start_background_threads()
+            self.handoff_failed.set()
+            return
+
+        with self.broadcaster.seq_lock:
+            players, client_sockets = self.player_manager.export_state(self.broadcaster)
+            state = {
+                'server': {
+                    'game_active': self.game_active,
+                    'timer_elapsed': time.time() - self.timer_start_time if self.timer_started else None,
+                    'round': self.round,
+                    'in_lobby': self.in_lobby,
+                    'lobby_in': max(0, self.lobby_deadline - time.time()) if self.in_lobby else None,
+                    'stop_in': max(0, self.stop_time - time.time()) if self.stop_time is not None else None,
+                },
+                'board': self.board.export_state(),
+                'broadcaster': self.broadcaster.export_state(),
+                'players': players,
+                'udp': self.udp_channel.export_state() if self.udp_channel.sock else None,
+            }
+        self.broadcaster.detach_outboxes(OUTBOX_DRAIN_TIMEOUT)
+        sockets = [self.server_socket] + ([self.udp_channel.sock] if self.udp_channel.sock else []) + client_sockets
+
+        try:
+            handed_off = send_handoff(conn, state, sockets)
+        except OSError as e:
+            print(f"Handoff failed: {e}")
+            handed_off = False
+        if handed_off:
+            if self.board_publisher:
+                # The new process publishes to the same block
+                self.board_publisher.close(unlink=False)
+            print("The new server process took over the game.", flush=True)
+            os._exit(0)
+
+        # Take the connections back
+        print("Handoff failed, carrying on.")
+        self.player_manager.import_state(players, client_sockets, self.board, self.broadcaster, self.check_game_over)
+        self.handing_off = False
+        self.start_background_threads()
+        self.handoff_failed.set()
+
+    def take_over(self):
+        """
+        Take the listening socket, the client sockets and the room state over from the
+        server process listening on handoff_path.
+        """
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(self.handoff_path)
+        print(f"Taking the game over from {self.handoff_path}...")
+        state, fds = receive_handoff(conn)
+        sockets = [socket.socket(fileno=fd) for fd in fds]
+
+        self.server_socket.close()
+        self.server_socket = sockets.pop(0)
+        self.host, self.port = self.server_socket.getsockname()[:2]
+        self.game_active = state['server']['game_active']
+        if state['server']['timer_elapsed'] is not None:
+            self.timer_start_time = time.time() - state['server']['timer_elapsed']
+            self.timer_started = True
+        self.round = state['server'].get('round', 1)
+        self.in_lobby = state['server'].get('in_lobby', False)
+        if self.in_lobby:
+            lobby_in = state['server'].get('lobby_in')
+            self.lobby_deadline = time.time() + (self.lobby_duration if lobby_in is None else lobby_in)
+        if not self.game_active:
+            # The old process's shutdown timer died with it
+            stop_in = state['server'].get('stop_in')
+            self.schedule_stop(SHUTDOWN_DELAY if stop_in is None else stop_in)
+        self.board.import_state(state['board'])
+        self.grid_size = self.board.grid_size
+        self.broadcaster.import_state(state['broadcaster'])
+
+        udp_socket = sockets.pop(0) if state['udp'] is not None else None
+        self.player_manager.import_state(state['players'], sockets, self.board, self.broadcaster,
+                                         self.check_game_over)
+        if udp_socket is not None and self.udp_channel.start(udp_socket):
+            self.udp_channel.import_state(state['udp'])
+            self.broadcaster.udp_channel = self.udp_channel
+
+        conn.sendall(b'OK')
+        conn.close()
+        print(f"Took over {len(self.player_manager.clients)} players and "
+              f"{len(self.player_manager.spectators)} spectators.")
+
     def broadcast_timer(self):
         """
         Broadcast the remaining time to all clients at regular intervals.
         """
-        while self.game_active:
+        while self.game_active and not self.handing_off:
             if self.timer_start_time is not None:
                 elapsed_time = time.time() - self.timer_start_time
                 remaining_time = max(0, self.timer_duration - int(elapsed_time))
-                self.broadcaster.broadcast(f"TIMER_UPDATE|{remaining_time}\n")
+                # Timer updates are superseded every second, so they are not kept for resuming clients
+                self.broadcaster.broadcast(f"TIMER_UPDATE|{remaining_time}\n", sequenced=False)
+                # The heartbeat carries the board hash, clients whose board differs ask for the rows
+                self.broadcaster.broadcast_board_hash()
 
                 # End the game if the timer reaches 0
                 if remaining_time == 0:
                     self.check_game_over()
-                    break
+                    if not self.rounds:
+                        break
 
             time.sleep(1)  # Broadcast every second
 
+    def expire_leases(self):
+        """
+        Release locks held by players that stopped scribbling and tell everyone.
+        """
+        while self.game_active and not self.handing_off:
+            for r, c, player_id, next_player_id in self.board.expire_leases():
+                print(f"Lock on ({r},{c}) held by player {player_id} expired.")
+                self.broadcaster.broadcast_release(r, c, next_player_id)
+            time.sleep(self.board.leases.tick)
+
     def check_game_over(self):
         """
         Check if the game is over and broadcast the result if so.
@@ -102,13 +331,78 @@ class GameServer:
         2. The timer has reached zero
         """
         if self.board.is_full() or (self.timer_started and time.time() - self.timer_start_time >= self.timer_duration):
-            self.game_active = False
+            with self.round_lock:
+                # Claims and the timer can both end the game, only the first one counts
+                if not self.game_active or self.in_lobby:
+                    return
+                if self.rounds:
+                    self.in_lobby = True
+                    self.lobby_deadline = time.time() + self.lobby_duration
+                    # Only the lobby countdown is sent until the next round starts
+                    self.timer_start_time = None
+                    self.timer_started = False
+                else:
+                    self.game_active = False
             result_msg = self.board.calculate_winner(self.player_manager)
             print(result_msg)
             self.broadcaster.broadcast(f"GAME_OVER|{result_msg}\n")
-            # Schedule server shutdown after 30 seconds
-            print("Server will shut down in 30 seconds...")
-            threading.Timer(20, self.shutdown).start()
+            if self.rounds:
+                # Players stay connected and play again on the same board
+                self.broadcaster.broadcast(f"NEXT_ROUND|{self.lobby_duration}\n")
+                print(f"Next round in {self.lobby_duration} seconds...")
+                lobby = threading.Thread(target=self.run_lobby, name='run_lobby', daemon=True)
+                self.background_threads.append(lobby)
+                lobby.start()
+                return
+            # Schedule server shutdown, so players can see the result first
+            print(f"Server will shut down in {SHUTDOWN_DELAY} seconds...")
+            self.schedule_stop(SHUTDOWN_DELAY)
+
+    def run_lobby(self):
+        """
+        Count down to the next round and start it, unless the server hands off first.
+        A lobby that goes on after a handoff keeps its deadline.
+        """
+        deadline = self.lobby_deadline
+        while self.game_active and not self.handing_off:
+            remaining = int(deadline - time.time() + 0.999)
+            if remaining <= 0:
+                self.start_round()
+                return
+            # Not kept for resuming clients, the next update supersedes it
+            self.broadcaster.broadcast(f"LOBBY_UPDATE|{remaining}\n", sequenced=False)
+            time.sleep(min(1, max(0, deadline - time.time())))
+
+    def start_round(self):
+        """
+        Clear the board in place and start the next round with the same players.
+        Locks stay refused until every client was told about the new round.
+        """
+        self.board.reset()
+        self.broadcaster.reset_round()
+        self.round += 1
+        self.timer_start_time = None
+        self.timer_started = False
+        self.broadcaster.broadcast(f"NEW_ROUND|{self.round}|{self.timer_duration}\n")
+        self.broadcaster.broadcast_board()
+        self.broadcaster.broadcast_leaderboard()
+        self.in_lobby = False
+        print(f"Round {self.round} started.")
+
+    def schedule_stop(self, delay):
+        """
+        Stop the server after delay seconds.
+        """
+        self.stop_time = time.time() + delay
+        timer = threading.Timer(delay, self.stop)
+        timer.daemon = True
+        timer.start()
+
+    def stop(self):
+        """
+        Stop accepting connections, start() then shuts the server down.
+        """
+        self.running = False
 
     def shutdown(self):
         """
@@ -116,8 +410,13 @@ class GameServer:
         """
         print("Shutting down server...")
         self.game_active = False
+        self.running = False
         self.broadcaster.broadcast("INFO|Server is shutting down.\n")
         self.player_manager.disconnect_all()
+        self.admission.close()
+        self.udp_channel.close()
         self.server_socket.close()
+        if self.board_publisher:
+            self.board_publisher.close()
         print("Server shut down.")
         sys.exit(0)
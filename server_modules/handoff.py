@@ -0,0 +1,67 @@
+"""
+Handoff of a running game from one server process to the next.
+The old process sends the listening socket, the UDP socket, every client socket and the
+serialized room state over a Unix socket, and the new process carries on with them, so
+clients stay connected through a restart.
+
+File descriptors go over the Unix socket with SCM_RIGHTS, in batches because the kernel
+limits how many fit in one message.
+"""
+import json
+import socket
+import struct
+
+# File descriptors sent in one message
+FDS_PER_MESSAGE = 200
+# Seconds either process waits for the other before giving the handoff up
+HANDOFF_TIMEOUT = 30
+HEADER = struct.Struct('!QI')  # State length, number of file descriptors
+
+
+def handoff_supported():
+    """Check that this platform can pass sockets between processes."""
+    return hasattr(socket, 'send_fds') and hasattr(socket, 'AF_UNIX')
+
+
+def send_handoff(conn, state, sockets):
+    """Send the sockets and the state to the new process and wait until it took over.
+    Returns True once the new process acknowledged the handoff. Raises OSError if the
+    new process stalls for HANDOFF_TIMEOUT seconds or goes away."""
+    conn.settimeout(HANDOFF_TIMEOUT)
+    data = json.dumps(state).encode('utf-8')
+    fds = [sock.fileno() for sock in sockets]
+    conn.sendall(HEADER.pack(len(data), len(fds)))
+    for i in range(0, len(fds), FDS_PER_MESSAGE):
+        socket.send_fds(conn, [b'F'], fds[i:i + FDS_PER_MESSAGE])
+        # One byte back per batch, so batches are never merged into one read
+        recv_exactly(conn, 1)
+    conn.sendall(data)
+    return recv_exactly(conn, 2) == b'OK'
+
+
+def receive_handoff(conn):
+    """Receive the state and the sockets sent by send_handoff.
+    Returns the state and the file descriptors, in the order they were sent.
+    Raises OSError if the old process stalls for HANDOFF_TIMEOUT seconds or goes away."""
+    conn.settimeout(HANDOFF_TIMEOUT)
+    length, count = HEADER.unpack(recv_exactly(conn, HEADER.size))
+    fds = []
+    while len(fds) < count:
+        _, batch, _, _ = socket.recv_fds(conn, 1, min(FDS_PER_MESSAGE, count - len(fds)))
+        if not batch:
+            raise ConnectionError("Handoff ended before all sockets arrived")
+        fds.extend(batch)
+        conn.sendall(b'F')
+    state = json.loads(recv_exactly(conn, length).decode('utf-8'))
+    return state, fds
+
+
+def recv_exactly(conn, size):
+    """Read exactly size bytes."""
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Handoff connection closed")
+        data += chunk
+    return data
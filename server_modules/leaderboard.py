@@ -0,0 +1,79 @@
+import threading
+
+# Number of leading players sent to clients
+LEADERBOARD_SIZE = 10
+
+
+class Leaderboard:
+    """
+    Players ordered by score, kept up to date one claim at a time.
+    Scores only ever go up by one, so a claim moves the player to the front of its old
+    score group by a single swap, which keeps every update O(1).
+    Players with the same score are in no particular order.
+    """
+    def __init__(self, size=LEADERBOARD_SIZE):
+        self.size = size
+        self.order = []  # Player IDs, highest score first
+        self.position = {}  # Player ID -> index in order
+        self.scores = {}  # Player ID -> claimed squares
+        self.group_start = {}  # Score -> index of the first player with that score
+        self.version = 0  # Incremented whenever the leading players or their order change
+        self.lock = threading.Lock()
+
+    def record_claim(self, player_id):
+        """Add one claimed square to the player's score."""
+        with self.lock:
+            added = player_id not in self.scores
+            if added:
+                # New players start at the end with no squares
+                self.scores[player_id] = 0
+                self.position[player_id] = len(self.order)
+                self.order.append(player_id)
+                self.group_start.setdefault(0, len(self.order) - 1)
+
+            score = self.scores[player_id]
+            old_index = self.position[player_id]
+            new_index = self.group_start[score]
+            # Swap with the first player of the old score group, which puts the player
+            # right behind everyone that already has the new score
+            other = self.order[new_index]
+            self.order[old_index], self.order[new_index] = other, player_id
+            self.position[other], self.position[player_id] = old_index, new_index
+
+            # The old group now starts one later, or is gone
+            if new_index + 1 < len(self.order) and self.scores[self.order[new_index + 1]] == score:
+                self.group_start[score] = new_index + 1
+            else:
+                del self.group_start[score]
+            self.scores[player_id] = score + 1
+            self.group_start.setdefault(score + 1, new_index)
+
+            if new_index < self.size and (added or new_index != old_index):
+                self.version += 1
+
+    def reset(self):
+        """Forget every score for a new round. The version keeps counting up."""
+        with self.lock:
+            self.order.clear()
+            self.position.clear()
+            self.scores.clear()
+            self.group_start.clear()
+            self.version += 1
+
+    def leaders(self):
+        """Get the version and the IDs of the leading players, best first."""
+        with self.lock:
+            return self.version, self.order[:self.size]
+
+    def winners(self):
+        """Get the top score and the players that have it. Only looks at the tied players."""
+        with self.lock:
+            if not self.order:
+                return 0, []
+            top_score = self.scores[self.order[0]]
+            winners = []
+            for player_id in self.order:
+                if self.scores[player_id] != top_score:
+                    break
+                winners.append(player_id)
+            return top_score, winners
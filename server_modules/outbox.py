@@ -0,0 +1,85 @@
+import threading
+from collections import deque
+
+# A client that falls this far behind is disconnected instead of slowing everyone down
+MAX_QUEUED_BYTES = 1024 * 1024
+
+
+class Outbox:
+    """
+    The Outbox class queues outgoing data for one client and sends it from its own thread,
+    so a slow client never blocks the thread that is broadcasting.
+    """
+    def __init__(self, sock, max_bytes=MAX_QUEUED_BYTES, compress=False):
+        """Start the sending thread for the given socket.
+        compress is the compression the client negotiated, 'zlib' or 'zdict', or False."""
+        self.sock = sock
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.queue = deque()
+        self.queued_bytes = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def send(self, data):
+        """Queue bytes to send. Returns False if the outbox is closed or overflowed."""
+        with self.condition:
+            if self.closed:
+                return False
+            if self.queued_bytes + len(data) > self.max_bytes:
+                print(f"Client is {self.queued_bytes} bytes behind, disconnecting it.")
+                self._close()
+                return False
+            self.queue.append(data)
+            self.queued_bytes += len(data)
+            self.condition.notify()
+            return True
+
+    def run(self):
+        """Send queued data until the outbox is closed."""
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                data = b''.join(self.queue)
+                self.queue.clear()
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                self.close()
+                return
+            with self.condition:
+                self.queued_bytes -= len(data)
+                self.condition.notify_all()
+
+    def close(self):
+        """Stop sending and drop anything still queued."""
+        with self.condition:
+            self._close()
+
+    def detach(self, timeout):
+        """Send what is queued, then stop without touching the socket, which is handed
+        to another process. Returns False if the queue did not drain in time."""
+        with self.condition:
+            drained = self.condition.wait_for(lambda: self.closed or self.queued_bytes == 0, timeout)
+            self.closed = True
+            self.queue.clear()
+            self.condition.notify_all()
+            return drained
+
+    def _close(self):
+        """Close the outbox, the caller holds the condition."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self.condition.notify()
+        # Wake up the client's reader thread so it runs the disconnect
+        try:
+            self.sock.shutdown(2)
+        except OSError:
+            pass
@@ -1,8 +1,48 @@
+import colorsys
+import contextlib
+import secrets
+import select
 import threading
 import time
+from shared_modules.commands import CommandTable
+from .compression import negotiate
+from .rate_limiter import RateLimiter
 
 # List of player colors to choose from
 PLAYER_COLORS = ['#FF0000', '#0000FF', '#00FF00', '#FFA500', '#800080', '#FFFF00', '#00FFFF', '#FF00FF']
+# Hue step between generated colors, the golden ratio keeps neighbouring IDs far apart
+GOLDEN_RATIO = 0.618033988749895
+
+# Seconds a dropped player keeps their session and locks before they are removed
+SESSION_GRACE_PERIOD = 30
+# Seconds a connection thread waits for data before checking if the server is handing off
+POLL_INTERVAL = 0.5
+
+
+def player_color(player_id):
+    """Get the color of a player. The first players get PLAYER_COLORS, later ones
+    a generated color, so large rooms do not repeat colors."""
+    if player_id <= len(PLAYER_COLORS):
+        return PLAYER_COLORS[player_id - 1]
+    n = player_id - len(PLAYER_COLORS)
+    # Spread the hues around the wheel and cycle through a few shades
+    hue = (n * GOLDEN_RATIO) % 1.0
+    saturation = (0.9, 0.6, 0.75)[n % 3]
+    value = (0.85, 0.65, 0.5)[(n // 3) % 3]
+    r, g, b = colorsys.hsv_to_rgb(hue, saturation, value)
+    return f"#{int(r * 255):02X}{int(g * 255):02X}{int(b * 255):02X}"
+
+
+class Request:
+    """The client a command came from, and the game objects its handler works on."""
+    __slots__ = ('sock', 'player_id', 'board', 'broadcaster', 'on_game_over')
+
+    def __init__(self, sock, player_id, board, broadcaster, on_game_over):
+        self.sock = sock
+        self.player_id = player_id
+        self.board = board
+        self.broadcaster = broadcaster
+        self.on_game_over = on_game_over
 
 
 class PlayerManager:
@@ -13,199 +53,651 @@ class PlayerManager:
         """Initialize the PlayerManager instance with given max_players."""
         self.max_players = max_players
         self.clients = {}
+        self.player_sockets = {}  # Player ID -> socket of connected players
+        self.players = {}  # Player ID -> name and color of everyone in the game, including dropped players
+        self.sessions = {}  # Session token -> player info
+        self.detached = {}  # Session token -> (player info, grace timer) for dropped players
+        self.spectators = {}  # Socket -> name of read-only connections, such as a spectator relay
+        self.reserved = set()  # Sockets let in to join, each holding a player slot until it joins
+        self.reserved_spectators = set()  # Sockets let in to watch, until they are watching
         self.lock = threading.Lock()
         self.next_player_id = 1
+        self.players_version = 0  # Incremented whenever a player joins or leaves
         self.game_server = None  # Reference to game server for timer control
+        self.admission = None  # Told when player slots free up
+        self.commands = CommandTable()
+        self.register_commands()
+        # Set while the server hands its connections to a new process
+        self.handing_off = False
+        self.parked = []  # (socket, unread data) of connections waiting to be handed off
+        self.connection_threads = 0
+        self.threads_done = threading.Condition()
 
     def set_game_server(self, game_server):
         """Set reference to game server instance."""
         self.game_server = game_server
 
-    def handle_client(self, client_socket, addr, board, broadcaster, on_game_over):
-        """Handle a new client connection."""
-        player_id, player_name, player_color = None, None, None
+    def wait_for_data(self, client_socket, buffer):
+        """Wait until the socket has data. Returns False if the server started handing off,
+        then the connection and its unread data are parked for the new process."""
+        while not self.handing_off:
+            if select.select([client_socket], [], [], POLL_INTERVAL)[0]:
+                return True
+        with self.lock:
+            self.parked.append((client_socket, buffer))
+        return False
+
+    def handle_client(self, client_socket, addr, board, broadcaster, on_game_over, buffer="", info=None):
+        """Handle a client connection.
+        A connection taken over from another server process passes its player info and unread data."""
+        handed_off = False
+        with self.connection_thread():
+            try:
+                if info is None:
+                    info, buffer, handed_off = self.greet_client(client_socket, buffer, board, broadcaster)
+                if info is None:
+                    return
+                handed_off = self.receive_commands(client_socket, info, buffer, board, broadcaster, on_game_over)
+
+            except Exception as e:
+                print(f"Exception with {addr}: {e}")
+            finally:
+                # A dropped connection keeps the session so the client can resume it
+                if not handed_off:
+                    self.disconnect(client_socket, board, broadcaster, resumable=True)
+                self.release_slot(client_socket)
 
+    def reserve_slot(self, client_socket):
+        """Hold a player slot for a connection about to join. Returns False if none is free."""
+        with self.lock:
+            if len(self.clients) + len(self.detached) + len(self.reserved) >= self.max_players:
+                return False
+            self.reserved.add(client_socket)
+            return True
+
+    def reserve_spectator(self, client_socket, max_spectators):
+        """Hold a spectator place for a connection about to watch. Returns False if there are
+        max_spectators already."""
+        with self.lock:
+            if len(self.spectators) + len(self.reserved_spectators) >= max_spectators:
+                return False
+            self.reserved_spectators.add(client_socket)
+            return True
+
+    def release_slot(self, client_socket):
+        """Give up the slot held for a connection that did not join."""
+        with self.lock:
+            self.reserved_spectators.discard(client_socket)
+            if client_socket not in self.reserved:
+                return
+            self.reserved.discard(client_socket)
+        if self.admission:
+            self.admission.wake()
+
+    @contextlib.contextmanager
+    def connection_thread(self):
+        """Count a running connection thread, so a handoff can wait for all of them to park."""
+        with self.threads_done:
+            self.connection_threads += 1
         try:
-            # Check if the server is full
+            yield
+        finally:
+            with self.threads_done:
+                self.connection_threads -= 1
+                self.threads_done.notify_all()
+
+    def park_connections(self, timeout=None):
+        """Start handing off and wait for every connection thread to park its connection.
+        Returns False if some did not stop in time."""
+        self.handing_off = True
+        with self.threads_done:
+            return self.threads_done.wait_for(lambda: self.connection_threads == 0, timeout)
+
+    def unpark_connections(self, board, broadcaster, on_game_over):
+        """Stop handing off and serve the parked connections again, after a handoff that was
+        given up before anything was sent. Threads that did not park carry on by themselves."""
+        with self.lock:
+            self.handing_off = False
+            parked, self.parked = self.parked, []
+            connections = [(sock, buffer, self.clients.get(sock), self.spectators.get(sock)) for sock, buffer in parked]
+
+        for sock, buffer, info, spectator in connections:
+            if info is not None:
+                target, args = self.handle_client, (sock, None, board, broadcaster, on_game_over, buffer, info)
+            elif spectator is not None:
+                target, args = self.serve_spectator, (sock, spectator, broadcaster)
+            elif self.admission:
+                self.admission.add(sock, None, buffer)
+                continue
+            else:
+                target, args = self.handle_client, (sock, None, board, broadcaster, on_game_over, buffer)
+            threading.Thread(target=target, args=args, daemon=True).start()
+
+    def greet_client(self, client_socket, buffer, board, broadcaster):
+        """Wait for the CONNECT, RESUME or SPECTATE message and act on it.
+        Returns the player info or None, the unread data, and whether the connection was handed off."""
+        while '\n' not in buffer:
+            if not self.wait_for_data(client_socket, buffer):
+                return None, buffer, True
+            data = client_socket.recv(4096)
+            if not data:
+                return None, buffer, False
+            buffer += data.decode('utf-8')
+        message, buffer = buffer.split('\n', 1)
+        message = message.strip()
+
+        if message.startswith("CONNECT|"):
+            # Format: CONNECT|name, optionally followed by |zlib or |zdict to receive compressed frames
+            parts = message.split('|')
+            info = self.join_game(client_socket, parts[1].strip(), board, broadcaster,
+                                  compress=negotiate(parts[2:]))
+        elif message.startswith("RESUME|"):
+            info = self.resume_session(client_socket, message, board, broadcaster)
+        elif message.startswith("SPECTATE|"):
+            name = message.split('|', 1)[1].strip() or "Spectator"
+            return None, "", self.watch_game(client_socket, name, broadcaster)
+        else:
+            client_socket.sendall(b"ERROR|Invalid connection message.\n")
+            return None, buffer, False
+        return info, buffer, False
+
+    def receive_commands(self, client_socket, info, buffer, board, broadcaster, on_game_over):
+        """Receive and process a player's messages until the connection drops.
+        Returns True if the connection was handed off instead."""
+        player_id = info['id']
+        limiter = info['limiter']
+        while True:
+            # Process the message
+            while '\n' in buffer:
+                message, buffer = buffer.split('\n', 1)
+                message = message.strip()
+                if self.check_rate_limit(message, limiter, client_socket, broadcaster):
+                    self.process_message(message, client_socket, player_id, board, broadcaster, on_game_over)
+
+            # Receive a message
+            if not self.wait_for_data(client_socket, buffer):
+                return True
+            data = client_socket.recv(4096)
+            if not data:
+                return False
+            buffer += data.decode('utf-8')
+
+    def check_rate_limit(self, message, limiter, client_socket, broadcaster):
+        """Check a message against the client's rate limits.
+        Scribbles are limited harder while the outgoing queues are backed up."""
+        command = message.split('|', 1)[0]
+        rate_scale = broadcaster.relay_scale() if command == "SCRIBBLE_UPDATE" else 1.0
+        if limiter.allow(command, rate_scale):
+            return True
+
+        if command in ("LOCK_REQUEST", "LOCK_QUEUE"):
+            # Answer the request so the client does not wait for it, or wait in a line it is not in
+            r, c = (message.split('|') + ['', ''])[1:3]
+            broadcaster.send(client_socket, f"LOCK_DENIED|{r}|{c}\n")
+        if limiter.should_notify(command):
+            broadcaster.send(client_socket, f"THROTTLED|{command}\n")
+        return False
+
+    def join_game(self, client_socket, player_name, board, broadcaster, compress=False):
+        """Add a new player to the game. Returns the player info, or None if the server is full.
+        The new player gets the full state, everyone else only hears that they joined."""
+        info = None
+
+        def register():
+            nonlocal info
             with self.lock:
-                if len(self.clients) >= self.max_players:
+                # Check if the server is full, counting players that may still resume
+                # and the slots held for others about to join
+                others_joining = len(self.reserved) - (client_socket in self.reserved)
+                if len(self.clients) + len(self.detached) + others_joining >= self.max_players:
                     client_socket.sendall(b"ERROR|Server is full.\n")
-                    return
+                    return False
+                self.reserved.discard(client_socket)
 
-                # Assign a player ID and color
+                # Assign a player ID, color and session token
                 player_id = self.next_player_id
                 self.next_player_id += 1
-                player_color = PLAYER_COLORS[(player_id - 1) % len(PLAYER_COLORS)]
+                color = player_color(player_id)
+                token = secrets.token_hex(16)
+                info = {
+                    'id': player_id, 'name': player_name or f"Player_{player_id}", 'color': color,
+                    'token': token, 'limiter': RateLimiter(), 'socket': client_socket,
+                }
+                self.sessions[token] = info
 
-            # Wait for CONNECT message
-            data = client_socket.recv(4096).decode('utf-8').strip()
-            if not data.startswith("CONNECT|"):
-                client_socket.sendall(b"ERROR|Invalid connection message.\n")
-                return
+                welcome_msg = f"WELCOME|{player_id}|{color}|{board.grid_size}|{token}\n"
+                broadcaster.open_outbox(client_socket, compress)
+                broadcaster.send(client_socket, welcome_msg)
+                # Add the player to the clients dictionary
+                self.clients[client_socket] = info
+                self.player_sockets[player_id] = client_socket
+                self.players[player_id] = {'name': info['name'], 'color': color}
+                self.players_version += 1
+            return True
+
+        if not broadcaster.attach_client(client_socket, register):
+            return None
+        broadcaster.broadcast_player_joined(info, client_socket)
+        broadcaster.broadcast(
+            f"INFO|{info['name']} joined the game.\n", sender_socket=client_socket, exclude_sender=True
+        )
+        return info
+
+    def resume_session(self, client_socket, message, board, broadcaster):
+        """Reattach a reconnecting client to its session.
+        Format: RESUME|token|last_seq|name, optionally followed by |zlib or |zdict.
+        Joins as a new player if the session has expired."""
+        parts = message.split('|')
+        token = parts[1] if len(parts) > 1 else ""
+        last_seq = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else None
+        player_name = parts[3].strip() if len(parts) > 3 else ""
+        compress = negotiate(parts[4:])
 
-            player_name = data.split('|', 1)[1].strip() or f"Player_{player_id}"
+        old_socket = None
+        with self.lock:
+            info = self.sessions.get(token)
+            if info is not None:
+                if token in self.detached:
+                    # Stop the grace period timer
+                    _, timer = self.detached.pop(token)
+                    timer.cancel()
+                else:
+                    # The old connection has not noticed it is dead yet, take it over
+                    if self.clients.get(info['socket']) is info:
+                        old_socket = info['socket']
+                        del self.clients[old_socket]
+                        self.player_sockets.pop(info['id'], None)
+
+        if info is None:
+            print(f"Session expired, joining {player_name or 'client'} as a new player.")
+            return self.join_game(client_socket, player_name, board, broadcaster, compress)
+
+        if old_socket is not None:
+            broadcaster.close_outbox(old_socket)
+            try:
+                old_socket.close()
+            except:
+                pass
 
+        # The client sets up its UDP channel again
+        info['udp_enabled'] = False
+        resumed_msg = f"RESUMED|{info['id']}|{info['color']}|{board.grid_size}|{token}\n"
+        broadcaster.open_outbox(client_socket, compress)
+        broadcaster.send(client_socket, resumed_msg)
+
+        def register():
             with self.lock:
-                # Add the player to the clients dictionary
-                self.clients[client_socket] = {'id': player_id, 'name': player_name, 'color': player_color}
-
-            welcome_msg = f"WELCOME|{player_id}|{player_color}|{board.grid_size}\n"
-            client_socket.sendall(welcome_msg.encode('utf-8'))
-            # Broadcast the current state of the board
-            broadcaster.broadcast_players()
-            broadcaster.broadcast_board()
-            broadcaster.broadcast(
-                f"INFO|{player_name} joined the game.\n", sender_socket=client_socket, exclude_sender=True
-            )
-
-            # Receive and process messages
-            buffer = ""
-            while True:
-                # Receive a message
-                data = client_socket.recv(4096)
-                if not data:
+                info['socket'] = client_socket
+                self.clients[client_socket] = info
+                self.player_sockets[info['id']] = client_socket
+
+        # Send only the events the client missed, or the full state if they are gone from the log
+        broadcaster.attach_client(client_socket, register, last_seq)
+        print(f"Player {info['name']} (ID: {info['id']}) resumed their session.")
+        broadcaster.broadcast(
+            f"INFO|{info['name']} reconnected.\n", sender_socket=client_socket, exclude_sender=True
+        )
+        return info
+
+    def watch_game(self, client_socket, name, broadcaster, attach=True):
+        """Stream the game to a spectator until it disconnects.
+        Spectators do not count towards max_players and anything they send is ignored.
+        Returns True if the connection was handed off instead."""
+        def register():
+            with self.lock:
+                self.spectators[client_socket] = name
+                self.reserved_spectators.discard(client_socket)
+
+        if attach:
+            broadcaster.open_outbox(client_socket)
+            broadcaster.attach_client(client_socket, register)
+            print(f"{name} is watching the game.")
+        try:
+            while self.wait_for_data(client_socket, ""):
+                if not client_socket.recv(4096):
                     break
+            else:
+                return True
+        except OSError:
+            pass
+        with self.lock:
+            self.spectators.pop(client_socket, None)
+        broadcaster.close_outbox(client_socket)
+        client_socket.close()
+        print(f"{name} stopped watching.")
+        return False
 
-                # Process the message
-                buffer += data.decode('utf-8')
-                while '\n' in buffer:
-                    message, buffer = buffer.split('\n', 1)
-                    self.process_message(message.strip(), client_socket, player_id, board, broadcaster, on_game_over)
-        
-        except Exception as e:
-            print(f"Exception with {addr}: {e}")
-        finally:
-            self.disconnect(client_socket, board, broadcaster)
+    def register_commands(self):
+        """Fill the command table with the handlers of client commands."""
+        self.commands.register("CLAIM_ATTEMPT", self.handle_claim, int, int)
+        self.commands.register("SCRIBBLE_UPDATE", self.handle_scribble, int, int, int, int)
+        self.commands.register("RELEASE_LOCK", self.handle_release, int, int)
+        self.commands.register("UDP_ENABLE", self.handle_udp_enable)
+        self.commands.register("DISCONNECT", self.handle_disconnect)
+        self.commands.register("RESYNC_ROWS", self.handle_resync_rows, str)
+        self.commands.register("LOCK_QUEUE", self.handle_lock_queue, int, int)
+        self.commands.register("LOCK_CANCEL", self.handle_lock_cancel, int, int)
+        # Older clients separated the square with commas or spaces
+        self.commands.register("LOCK_REQUEST", self.handle_lock_request, int, int, separator=r'[|,\s]+')
 
-    
     def process_message(self, message, client_socket, player_id, board, broadcaster, on_game_over):
         """Process a message from a client."""
+        request = Request(client_socket, player_id, board, broadcaster, on_game_over)
         try:
-            parts = message.split('|', 1)
-            command = parts[0]
-            payload = parts[1] if len(parts) > 1 else ""
-    
-            # Handle a CLAIM_ATTEMPT command
-            if command == "CLAIM_ATTEMPT":
-                r, c = map(int, payload.split('|'))
-                # Attempt to claim the specified cell for the player
-                success = board.claim(r, c, player_id)
-                if success:
-                    # Broadcast the updated board and scores to all clients
-                    broadcaster.broadcast_board()
-                    broadcaster.broadcast_scores()
-                    # Check if the game is over and handle it if necessary
-                    on_game_over()
-    
-            # Handle a SCRIBBLE_UPDATE command
-            elif command == "SCRIBBLE_UPDATE":
-                # Format: SCRIBBLE_UPDATE|row|col|x|y
-                try:
-                    parts = payload.split('|')
-                    if len(parts) >= 3:
-                        r, c = int(parts[0]), int(parts[1])
-                        x, y = int(parts[2]), int(parts[3])
-                        
-                        # Check if the player has a lock on this square
-                        if (r, c) in board.locks and board.locks[(r, c)] == player_id:
-                            # Broadcast the scribble update to all clients
-                            broadcaster.broadcast(f"PLAYER_SCRIBBLE|{r}|{c}|{player_id}|{x}|{y}\n")
-                        else:
-                            client_socket.sendall(f"ERROR|You don't have a lock on square ({r},{c}).\n".encode('utf-8'))
-                except Exception as e:
-                    print(f"Error processing SCRIBBLE_UPDATE: {e}")
-                    client_socket.sendall(f"ERROR|Invalid scribble format: {e}\n".encode('utf-8'))
-                
-            # Handle a RELEASE_LOCK command
-            elif command == "RELEASE_LOCK":
-                r, c = map(int, payload.split('|'))
-                # Release the lock on the specified cell for the player
-                board.release_lock(r, c, player_id)
-                # Broadcast the unlock to all other clients
-                broadcaster.broadcast_unlock(r, c)
-    
-            # Handle a DISCONNECT command
-            elif command == "DISCONNECT":
-                # Disconnect the client and clean up resources
-                self.disconnect(client_socket, board, broadcaster)
-    
-            # Handle a LOCK_REQUEST command
-            elif command == "LOCK_REQUEST":
-                try:
-                    # Add debug print to see what's coming in
-                    print(f"LOCK_REQUEST payload: '{payload}'")
-                    
-                    # Split the payload and handle potential empty parts
-                    parts = payload.split('|')
-                    if len(parts) >= 2:
-                        r, c = int(parts[0]), int(parts[1])
-                    else:
-                        # Try direct parsing if there's only one part (might be comma-separated)
-                        if ',' in payload:
-                            r, c = map(int, payload.split(','))
-                        else:
-                            # Try parsing as a single value
-                            parts = payload.strip()
-                            r, c = int(parts.split()[0]), int(parts.split()[1])
-                    
-                    print(f"Player {player_id} requesting lock for ({r},{c})")
-                    
-                    # Start timer on first lock request if not already started
-                    if self.game_server and not self.game_server.timer_started:
-                        self.game_server.timer_start_time = time.time()
-                        self.game_server.timer_started = True
-                        print("Game timer started!")
-                    
-                    # Check if the square is available (not claimed and not locked)
-                    if board.is_square_available(r, c):
-                        # Lock the square for this player
-                        board.lock_square(r, c, player_id)
-                        
-                        # Send confirmation to the requesting client
-                        client_socket.sendall(f"LOCK_GRANTED|{r}|{c}\n".encode('utf-8'))
-                        
-                        # Broadcast to all clients that the square is locked
-                        broadcaster.broadcast(f"SQUARE_LOCKED|{r}|{c}|{player_id}\n")
-                        print(f"Lock granted to player {player_id} for ({r},{c})")
-                    else:
-                        # Square is not available
-                        client_socket.sendall(f"LOCK_DENIED|{r}|{c}\n".encode('utf-8'))
-                        print(f"Lock denied to player {player_id} for ({r},{c})")
-                except Exception as e:
-                    print(f"Error processing LOCK_REQUEST: {e}, payload: '{payload}'")
-                    client_socket.sendall(f"ERROR|Invalid lock request format: {e}\n".encode('utf-8'))
-    
+            self.commands.dispatch(message, request)
+        except ValueError as e:
+            print(f"Error processing message from player {player_id}: {e}")
+            broadcaster.send(client_socket, f"ERROR|{e}\n")
         except Exception as e:
             print(f"Error processing message '{message}' from player {player_id}: {e}")
-            client_socket.sendall(f"ERROR|Invalid message format: {e}\n".encode('utf-8'))
 
-    def disconnect(self, sock, board, broadcaster):
-        """Disconnect a client."""
+    def handle_claim(self, request, r, c):
+        """Claim a square the player has locked."""
+        if self.game_closed():
+            return
+        if request.board.claim(r, c, request.player_id):
+            request.broadcaster.strokes.discard(r, c)
+            # Nobody gets the square after this player any more
+            for waiter in request.board.take_waiters(r, c):
+                request.broadcaster.send_to_player(waiter, f"LOCK_DENIED|{r}|{c}\n")
+            # Broadcast the updated board, and the leaders if their order changed
+            request.broadcaster.broadcast_board()
+            request.broadcaster.broadcast_leaderboard()
+            # Check if the game is over and handle it if necessary
+            request.on_game_over()
+
+    def handle_scribble(self, request, r, c, x, y):
+        """Relay a scribble point in a square the player has locked."""
+        # Scribbling keeps the lease of the lock alive
+        if request.board.renew_lock(r, c, request.player_id):
+            request.broadcaster.broadcast_scribble(r, c, request.player_id, x, y)
+        else:
+            request.broadcaster.send(request.sock, f"ERROR|You don't have a lock on square ({r},{c}).\n")
+
+    def handle_release(self, request, r, c):
+        """Release a lock without claiming the square."""
+        next_player_id = request.board.release_lock(r, c, request.player_id)
+        # Broadcast the unlock to all other clients, and the lock of the next player in line
+        if next_player_id is not None:
+            request.broadcaster.broadcast_release(r, c, next_player_id)
+
+    def handle_resync_rows(self, request, hashes):
+        """Send the rows that differ from the client's board, given the hash of each of its rows."""
+        row_hashes = [int(h, 16) for h in hashes.split(',')] if hashes else []
+        request.broadcaster.send_board_rows(request.sock, row_hashes)
+
+    def handle_udp_enable(self, request):
+        """Switch the player's scribbles to UDP, the client's UDP channel works both ways."""
+        info = self.clients.get(request.sock)
+        if info is not None and info.get('udp_addr'):
+            info['udp_enabled'] = True
+            print(f"Player {request.player_id} switched scribbles to UDP.")
+
+    def handle_disconnect(self, request):
+        """Disconnect the client and clean up resources."""
+        self.disconnect(request.sock, request.board, request.broadcaster)
+
+    def handle_lock_request(self, request, r, c):
+        """Lock a square for the player if it is available (not claimed and not locked)."""
+        print(f"Player {request.player_id} requesting lock for ({r},{c})")
+        if self.game_closed():
+            request.broadcaster.send(request.sock, f"LOCK_DENIED|{r}|{c}\n")
+            return
+        self.start_timer()
+
+        if request.board.try_lock(r, c, request.player_id):
+            self.grant_lock(request, r, c)
+        else:
+            request.broadcaster.send(request.sock, f"LOCK_DENIED|{r}|{c}\n")
+            print(f"Lock denied to player {request.player_id} for ({r},{c})")
+
+    def handle_lock_queue(self, request, r, c):
+        """Lock a square for the player, or put them in line for it if another player holds it.
+        The lock is granted as soon as the players ahead of them are done with the square."""
+        print(f"Player {request.player_id} queueing for lock on ({r},{c})")
+        if self.game_closed():
+            request.broadcaster.send(request.sock, f"LOCK_DENIED|{r}|{c}\n")
+            return
+        self.start_timer()
+
+        place = request.board.queue_lock(r, c, request.player_id)
+        if place == 0:
+            self.grant_lock(request, r, c)
+        elif place is None:
+            request.broadcaster.send(request.sock, f"LOCK_DENIED|{r}|{c}\n")
+        else:
+            request.broadcaster.send(request.sock, f"LOCK_QUEUED|{r}|{c}|{place}\n")
+            print(f"Player {request.player_id} is number {place} in line for ({r},{c})")
+
+    def handle_lock_cancel(self, request, r, c):
+        """Take the player out of the line for a square."""
+        request.board.cancel_wait(r, c, request.player_id)
+
+    def grant_lock(self, request, r, c):
+        """Send confirmation to the requesting client, then tell everyone the square is locked."""
+        request.broadcaster.send(request.sock, f"LOCK_GRANTED|{r}|{c}\n")
+        request.broadcaster.broadcast(f"SQUARE_LOCKED|{r}|{c}|{request.player_id}\n")
+        print(f"Lock granted to player {request.player_id} for ({r},{c})")
+
+    def game_over(self):
+        """Check if the game ended and the server is only showing the result before it shuts down."""
+        return self.game_server is not None and not self.game_server.game_active
+
+    def game_closed(self):
+        """Check if locks and claims are refused: a round ended and the next one has not
+        started yet, or the game is over."""
+        return self.game_over() or (self.game_server is not None and self.game_server.in_lobby)
+
+    def start_timer(self):
+        """Start the game timer on the first lock request if not already started."""
+        if self.game_server and not self.game_server.timer_started:
+            self.game_server.timer_start_time = time.time()
+            self.game_server.timer_started = True
+            print("Game timer started!")
+
+    def disconnect(self, sock, board, broadcaster, resumable=False):
+        """Disconnect a client.
+        If resumable, the player's session and locks are kept for SESSION_GRACE_PERIOD seconds."""
+        detached = False
         with self.lock:
             # Check if the socket is actually in the dictionary of connected clients
-            if sock in self.clients:
-                # Get the information about the client that we're disconnecting
-                info = self.clients.pop(sock)
-                print(f"Player {info['name']} (ID: {info['id']}) disconnected.")
-                # Release all of the locks that the player held
-                board.release_all_locks(info['id'])
-                # Broadcast a message to all connected clients about the disconnect
-                broadcaster.broadcast(f"INFO|{info['name']} left the game.\n")
-                # Broadcast the updated state of the players to all connected clients
-                broadcaster.broadcast_players()
+            info = self.clients.pop(sock, None)
+            if info is not None:
+                if self.player_sockets.get(info['id']) is sock:
+                    del self.player_sockets[info['id']]
+                if broadcaster:
+                    broadcaster.close_outbox(sock)
+                if resumable:
+                    # Keep the session until the grace period runs out
+                    self.detach_session(info, SESSION_GRACE_PERIOD, board, broadcaster)
+                    detached = True
+                    # The player's locks have to outlive the grace period, their places in line do not
+                    board.renew_all_locks(info['id'], SESSION_GRACE_PERIOD)
+                    board.cancel_waits(info['id'])
+                else:
+                    self.sessions.pop(info['token'], None)
+                    self.players.pop(info['id'], None)
+                    self.players_version += 1
         try:
             sock.close()
         except:
             pass
 
+        if info is None:
+            return
+        if detached:
+            print(f"Player {info['name']} (ID: {info['id']}) lost connection, keeping session.")
+            broadcaster.broadcast(f"INFO|{info['name']} lost connection.\n")
+        else:
+            print(f"Player {info['name']} (ID: {info['id']}) disconnected.")
+            self.remove_player(info, board, broadcaster)
+
+    def export_state(self, broadcaster):
+        """Get the players, sessions and parked connections for a new server process,
+        with the sockets they refer to by index. The connection threads must be parked."""
+        sockets = []
+
+        def add_socket(sock):
+            sockets.append(sock)
+            return len(sockets) - 1
+
+        with self.lock:
+            parked = dict(self.parked)
+            sessions = []
+            for token, info in self.sessions.items():
+                entry = {key: info[key] for key in ('id', 'name', 'color', 'token')}
+                entry['udp_addr'] = info.get('udp_addr')
+                entry['udp_enabled'] = info.get('udp_enabled', False)
+                sock = info.get('socket')
+                if token in self.detached:
+                    self.detached[token][1].cancel()
+                    entry['grace'] = max(0, info['expires'] - time.time())
+                elif self.clients.get(sock) is info and sock in parked:
+                    entry['socket'] = add_socket(sock)
+                    entry['buffer'] = parked.pop(sock)
+                    outbox = broadcaster.outboxes.get(sock)
+                    entry['compress'] = outbox.compress if outbox else False
+                else:
+                    # The connection was not parked, the client has to resume its session
+                    entry['grace'] = SESSION_GRACE_PERIOD
+                sessions.append(entry)
+            spectators = [
+                {'socket': add_socket(sock), 'name': name}
+                for sock, name in self.spectators.items() if parked.pop(sock, None) is not None
+            ]
+            # Connections that had not joined yet
+            pending = [{'socket': add_socket(sock), 'buffer': buffer} for sock, buffer in parked.items()]
+            state = {
+                'next_player_id': self.next_player_id,
+                'players_version': self.players_version,
+                'sessions': sessions,
+                'spectators': spectators,
+                'pending': pending,
+            }
+        return state, sockets
+
+    def import_state(self, state, sockets, board, broadcaster, on_game_over):
+        """Restore the players and sessions handed over by the previous server process,
+        and serve their connections again. Replaces any players already here, so a server
+        whose handoff failed can take its own connections back."""
+        connections = []
+        with self.lock:
+            for _, timer in self.detached.values():
+                timer.cancel()
+            for collection in (self.clients, self.player_sockets, self.spectators, self.sessions, self.detached,
+                               self.players):
+                collection.clear()
+            self.parked = []
+            self.reserved.clear()
+            self.reserved_spectators.clear()
+            self.handing_off = False
+            self.next_player_id = state['next_player_id']
+            self.players_version = state['players_version']
+            for entry in state['sessions']:
+                info = {key: entry[key] for key in ('id', 'name', 'color', 'token', 'udp_enabled')}
+                info['limiter'] = RateLimiter()
+                if entry['udp_addr']:
+                    info['udp_addr'] = tuple(entry['udp_addr'])
+                self.sessions[info['token']] = info
+                self.players[info['id']] = {'name': info['name'], 'color': info['color']}
+                if 'socket' in entry:
+                    sock = sockets[entry['socket']]
+                    info['socket'] = sock
+                    self.clients[sock] = info
+                    self.player_sockets[info['id']] = sock
+                    broadcaster.open_outbox(sock, entry['compress'])
+                    connections.append((sock, entry['buffer'], info))
+                else:
+                    self.detach_session(info, entry['grace'], board, broadcaster)
+            for entry in state['spectators']:
+                sock = sockets[entry['socket']]
+                self.spectators[sock] = entry['name']
+                broadcaster.open_outbox(sock)
+
+        for sock, buffer, info in connections:
+            threading.Thread(
+                target=self.handle_client, args=(sock, None, board, broadcaster, on_game_over, buffer, info),
+                daemon=True,
+            ).start()
+        for entry in state['spectators']:
+            threading.Thread(
+                target=self.serve_spectator, args=(sockets[entry['socket']], entry['name'], broadcaster),
+                daemon=True,
+            ).start()
+        for entry in state['pending']:
+            if self.admission:
+                # Admitted again, new players wait in line if the game is full
+                self.admission.add(sockets[entry['socket']], None, entry['buffer'])
+                continue
+            threading.Thread(
+                target=self.handle_client,
+                args=(sockets[entry['socket']], None, board, broadcaster, on_game_over, entry['buffer']),
+                daemon=True,
+            ).start()
+
+    def serve_spectator(self, client_socket, name, broadcaster):
+        """Keep streaming to a spectator taken over from the previous server process."""
+        with self.connection_thread():
+            self.watch_game(client_socket, name, broadcaster, attach=False)
+
+    def detach_session(self, info, grace_period, board, broadcaster):
+        """Keep a dropped player's session for grace_period seconds. The caller holds the lock."""
+        timer = threading.Timer(grace_period, self.expire_session, args=(info['token'], board, broadcaster))
+        timer.daemon = True
+        info['expires'] = time.time() + grace_period
+        self.detached[info['token']] = (info, timer)
+        timer.start()
+
+    def expire_session(self, token, board, broadcaster):
+        """Forget a dropped session whose grace period has run out."""
+        with self.lock:
+            # During a handoff the session goes to the new process with the rest of its grace period
+            if token not in self.detached or self.handing_off:
+                return
+            info, _ = self.detached.pop(token)
+            self.sessions.pop(token, None)
+            self.players.pop(info['id'], None)
+            self.players_version += 1
+        print(f"Session of player {info['name']} (ID: {info['id']}) expired.")
+        self.remove_player(info, board, broadcaster)
+
+    def remove_player(self, info, board, broadcaster):
+        """Release the player's locks and tell everyone they left."""
+        # Release all of the locks that the player held
+        for r, c, next_player_id in board.release_all_locks(info['id']):
+            broadcaster.broadcast_release(r, c, next_player_id)
+        # Broadcast a message to all connected clients about the disconnect
+        broadcaster.broadcast(f"INFO|{info['name']} left the game.\n")
+        # Tell the remaining clients to drop the player from their list
+        broadcaster.broadcast_player_left(info['id'])
+        # Let the next one in line in
+        if self.admission:
+            self.admission.slot_freed()
+
+    def get_socket(self, player_id):
+        """Get the socket of a connected player, or None."""
+        with self.lock:
+            return self.player_sockets.get(player_id)
+
     def get_players(self):
-        """Get a dictionary of all connected players."""
+        """Get a dictionary of all players, including those that may still resume."""
         with self.lock:
-            return {info['id']: {'name': info['name'], 'color': info['color']} for info in self.clients.values()}
+            return dict(self.players)
 
     def disconnect_all(self):
         """Disconnect all clients."""
         with self.lock:
-            for sock in list(self.clients):
-                self.disconnect(sock, None, None)
+            socks = list(self.clients) + list(self.spectators)
             self.clients.clear()
+            self.player_sockets.clear()
+            self.spectators.clear()
+            for _, timer in self.detached.values():
+                timer.cancel()
+            self.detached.clear()
+            self.sessions.clear()
+            self.players.clear()
+        for sock in socks:
+            try:
+                sock.close()
+            except:
+                pass
@@ -0,0 +1,349 @@
+"""
+On-demand profiling for a running Deny & Conquer server.
+The server listens for admin commands on a loopback port, and each command profiles the
+live server and writes its results to a file in the profile directory:
+
+    PROFILE|cprofile|10   Profile every client request for 10 seconds with cProfile
+    PROFILE|sample|10     Sample the stacks of all threads for 10 seconds
+    MEMORY|start          Start tracing allocations with tracemalloc
+    MEMORY|snapshot       Write an allocation snapshot, compared with the previous one
+    MEMORY|stop           Stop tracing allocations
+    TIMERS|on             Time every command, broadcast and board operation
+    TIMERS|report         Write the timings gathered so far
+    TIMERS|off            Stop timing
+
+Send them with admin.py, for example:
+    python admin.py PROFILE sample 10
+"""
+import argparse
+import cProfile
+import io
+import os
+import pstats
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from shared_modules.commands import CommandTable, CommandTimings
+
+# Seconds between stack samples
+SAMPLE_INTERVAL = 0.005
+# Longest profiling run an admin can ask for
+MAX_PROFILE_SECONDS = 300
+# Frames kept for each traced allocation
+TRACEMALLOC_FRAMES = 25
+# Seconds to keep trying to bind the admin port, which a server handing off may still hold
+BIND_TIMEOUT = 5
+# Lines of results sent back to the admin
+REPORT_LINES = 20
+# From Python 3.12 only one cProfile.Profile can be enabled at a time in the whole process,
+# so per-thread profiles would fail as soon as two threads handle a message at once
+PER_THREAD_CPROFILE = sys.version_info < (3, 12)
+# Hot paths timed by TIMERS|on
+TIMED_BROADCASTER_METHODS = ('broadcast', 'broadcast_scribble', 'broadcast_leaderboard', 'attach_client')
+TIMED_BOARD_METHODS = ('try_lock', 'queue_lock', 'claim', 'release_lock', 'renew_lock', 'renew_all_locks',
+                       'expire_leases', 'release_all_locks', 'get_board', 'get_locks', 'is_full')
+
+
+def timed(function, name, timings):
+    """Wrap function so every call adds its duration to timings under name."""
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timings(name, time.perf_counter() - start)
+    return wrapper
+
+
+def profiled(function, profiles):
+    """Wrap function so its calls are profiled, with one cProfile.Profile per thread.
+    A profiler that cannot be enabled skips the call, profiling never fails the call itself."""
+    local = threading.local()
+
+    def wrapper(*args, **kwargs):
+        profile = getattr(local, 'profile', None)
+        if profile is None:
+            profile = local.profile = cProfile.Profile()
+            profiles.append(profile)
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active
+            return function(*args, **kwargs)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            try:
+                profile.disable()
+            except ValueError:
+                pass
+    return wrapper
+
+
+def wrap_methods(obj, names, wrap):
+    """Replace methods of one object with wrapped ones. The class is left alone."""
+    for name in names:
+        setattr(obj, name, wrap(getattr(obj, name), f"{type(obj).__name__}.{name}"))
+
+
+def unwrap_methods(obj, names):
+    """Go back to the class's methods."""
+    for name in names:
+        obj.__dict__.pop(name, None)
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of every thread at a fixed interval. It only reads the frames,
+    so the server runs at full speed between samples whatever it is doing.
+    """
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()  # Folded stack, root first -> samples
+        self.samples = 0
+
+    def run(self, seconds):
+        """Sample the other threads for the given number of seconds."""
+        me = threading.get_ident()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+
+    def write(self, path):
+        """Write the stacks in the folded format read by flame graph tools."""
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top_functions(self, limit=REPORT_LINES):
+        """Get the functions most often found running, one line each."""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [f"{count / total:6.1%}  {function}" for function, count in leaves.most_common(limit)]
+
+
+class ProfilingConsole:
+    """
+    Admin console of a game server. Listens on a loopback port, takes one command per line
+    and answers with some lines of results followed by END.
+    """
+    def __init__(self, game_server, port, output_dir='profiles', host='127.0.0.1'):
+        """Set up the console for the given game server."""
+        self.game_server = game_server
+        self.address = (host, port)
+        self.output_dir = output_dir
+        self.timings = None  # CommandTimings while TIMERS is on
+        self.last_snapshot = None
+        self.profiling = threading.Lock()  # One profiling run at a time
+        self.commands = CommandTable()
+        self.commands.register("PROFILE", self.handle_profile, str, int)
+        self.commands.register("MEMORY", self.handle_memory, str)
+        self.commands.register("TIMERS", self.handle_timers, str)
+
+    def start(self):
+        """Start listening for admin connections in the background."""
+        threading.Thread(target=self.accept_admins, daemon=True).start()
+
+    def listen(self):
+        """Bind the admin port. Returns None if it stays taken."""
+        deadline = time.time() + BIND_TIMEOUT
+        while True:
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                listener.bind(self.address)
+                listener.listen()
+                return listener
+            except OSError as e:
+                listener.close()
+                if time.time() >= deadline:
+                    print(f"Admin console disabled: {e}")
+                    return None
+                time.sleep(0.5)
+
+    def accept_admins(self):
+        """Serve admin connections until the listener is closed."""
+        listener = self.listen()
+        if listener is None:
+            return
+        print(f"Admin console listening on {self.address[0]}:{listener.getsockname()[1]}")
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.serve_admin, args=(conn,), daemon=True).start()
+
+    def serve_admin(self, conn):
+        """Run the commands of one admin connection."""
+        with conn, conn.makefile('r', encoding='utf-8') as lines:
+            for line in lines:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    if not self.commands.dispatch(line, conn):
+                        self.reply(conn, [f"ERROR|Unknown command: {line}"])
+                except Exception as e:
+                    self.reply(conn, [f"ERROR|{e}"])
+
+    def reply(self, conn, lines):
+        """Send result lines to the admin."""
+        conn.sendall(''.join(f"{line}\n" for line in lines + ["END"]).encode('utf-8'))
+
+    def output_path(self, kind, extension):
+        """Get a new file name in the profile directory."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        return os.path.join(self.output_dir, f"{kind}-{stamp}.{extension}")
+
+    def handle_profile(self, conn, mode, seconds):
+        """PROFILE|cprofile|seconds or PROFILE|sample|seconds."""
+        if not 0 < seconds <= MAX_PROFILE_SECONDS:
+            raise ValueError(f"Profile for 1 to {MAX_PROFILE_SECONDS} seconds")
+        if mode not in ('cprofile', 'sample'):
+            raise ValueError(f"Unknown profiler: {mode}")
+        if not self.profiling.acquire(blocking=False):
+            raise ValueError("A profiling run is already in progress")
+        try:
+            print(f"Profiling with {mode} for {seconds} seconds...")
+            if mode == 'cprofile' and not PER_THREAD_CPROFILE:
+                lines = ["cProfile cannot profile several threads at once on this Python, sampling instead."]
+                lines += self.run_sampler(seconds)
+            elif mode == 'cprofile':
+                lines = self.run_cprofile(seconds)
+            else:
+                lines = self.run_sampler(seconds)
+        finally:
+            self.profiling.release()
+        self.reply(conn, lines)
+
+    def run_cprofile(self, seconds):
+        """Profile the handling of every client message and datagram for a while.
+        cProfile only sees the thread it runs in, so each connection thread gets its own."""
+        player_manager = self.game_server.player_manager
+        udp_channel = self.game_server.udp_channel
+        profiles = []
+        wrap_methods(player_manager, ['process_message'], lambda f, name: profiled(f, profiles))
+        wrap_methods(udp_channel, ['handle_datagram'], lambda f, name: profiled(f, profiles))
+        try:
+            time.sleep(seconds)
+        finally:
+            unwrap_methods(player_manager, ['process_message'])
+            unwrap_methods(udp_channel, ['handle_datagram'])
+        if not profiles:
+            return ["No client messages were handled."]
+
+        # A request may still be running in a connection thread, let it finish
+        time.sleep(0.1)
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        path = self.output_path('cprofile', 'prof')
+        stats.dump_stats(path)
+        text = io.StringIO()
+        stats.stream = text
+        stats.sort_stats('cumulative').print_stats(REPORT_LINES)
+        return [f"Wrote {path}"] + [line for line in text.getvalue().splitlines() if line.strip()]
+
+    def run_sampler(self, seconds):
+        """Sample every thread for a while."""
+        sampler = SamplingProfiler()
+        sampler.run(seconds)
+        path = self.output_path('samples', 'folded')
+        sampler.write(path)
+        return [f"Wrote {path} ({sampler.samples} samples)"] + sampler.top_functions()
+
+    def handle_memory(self, conn, action):
+        """MEMORY|start, MEMORY|snapshot or MEMORY|stop."""
+        if action == 'start':
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self.last_snapshot = None
+            lines = ["Tracing allocations."]
+        elif action == 'snapshot':
+            if not tracemalloc.is_tracing():
+                raise ValueError("Allocations are not traced, send MEMORY|start first")
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+            ])
+            path = self.output_path('memory', 'snapshot')
+            snapshot.dump(path)
+            current, peak = tracemalloc.get_traced_memory()
+            lines = [f"Wrote {path}", f"Traced memory: {current / 1024:.0f} KB, peak {peak / 1024:.0f} KB"]
+            lines += [str(stat) for stat in snapshot.statistics('lineno')[:REPORT_LINES]]
+            if self.last_snapshot is not None:
+                lines.append("Change since the previous snapshot:")
+                lines += [str(stat) for stat in snapshot.compare_to(self.last_snapshot, 'lineno')[:REPORT_LINES]]
+            self.last_snapshot = snapshot
+        elif action == 'stop':
+            tracemalloc.stop()
+            self.last_snapshot = None
+            lines = ["Stopped tracing allocations."]
+        else:
+            raise ValueError(f"Unknown memory action: {action}")
+        self.reply(conn, lines)
+
+    def handle_timers(self, conn, action):
+        """TIMERS|on, TIMERS|report or TIMERS|off."""
+        server = self.game_server
+        if action == 'on':
+            if self.timings is None:
+                self.timings = CommandTimings()
+                server.player_manager.commands.timing_hook = self.timings
+                wrap_methods(server.broadcaster, TIMED_BROADCASTER_METHODS,
+                             lambda f, name: timed(f, name, self.timings))
+                wrap_methods(server.board, TIMED_BOARD_METHODS, lambda f, name: timed(f, name, self.timings))
+            lines = ["Timing commands, broadcasts and board operations."]
+        elif action == 'report':
+            if self.timings is None:
+                raise ValueError("Timers are off, send TIMERS|on first")
+            lines = self.timings.report()
+            path = self.output_path('timers', 'txt')
+            with open(path, 'w') as f:
+                f.write(''.join(f"{line}\n" for line in lines))
+            lines = [f"Wrote {path}"] + lines
+        elif action == 'off':
+            if self.timings is not None:
+                server.player_manager.commands.timing_hook = None
+                unwrap_methods(server.broadcaster, TIMED_BROADCASTER_METHODS)
+                unwrap_methods(server.board, TIMED_BOARD_METHODS)
+                self.timings = None
+            lines = ["Timers off."]
+        else:
+            raise ValueError(f"Unknown timers action: {action}")
+        self.reply(conn, lines)
+
+
+def main():
+    """Send one admin command to a server and print the answer."""
+    parser = argparse.ArgumentParser(description="Profile a running Deny & Conquer server.")
+    parser.add_argument("command", nargs='+', help="For example: PROFILE sample 10")
+    parser.add_argument("--port", type=int, default=65435, help="Admin port of the server")
+    args = parser.parse_args()
+
+    with socket.create_connection(('127.0.0.1', args.port)) as conn:
+        conn.sendall(('|'.join(args.command) + "\n").encode('utf-8'))
+        with conn.makefile('r', encoding='utf-8') as lines:
+            for line in lines:
+                if line.rstrip('\n') == "END":
+                    break
+                print(line, end='')
+
+
+if __name__ == "__main__":
+    main()
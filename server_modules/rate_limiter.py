@@ -0,0 +1,60 @@
+import time
+
+# Commands are limited per class: (tokens per second, burst size)
+COMMAND_LIMITS = {
+    'scribble': (60, 120),
+    'lock': (10, 20),
+    'claim': (10, 20),
+    'resync': (0.5, 2),
+}
+COMMAND_CLASSES = {
+    'SCRIBBLE_UPDATE': 'scribble',
+    'LOCK_REQUEST': 'lock',
+    'LOCK_QUEUE': 'lock',
+    'LOCK_CANCEL': 'lock',
+    'CLAIM_ATTEMPT': 'claim',
+    'RELEASE_LOCK': 'claim',
+    'RESYNC_ROWS': 'resync',
+}
+# Seconds between THROTTLED notices for the same command class
+THROTTLE_NOTICE_INTERVAL = 1.0
+
+
+class TokenBucket:
+    """A token bucket, refilled at rate tokens per second up to burst tokens."""
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def allow(self, rate_scale=1.0):
+        """Take a token if there is one. rate_scale slows the refill down under load."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate * rate_scale)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class RateLimiter:
+    """Per-client rate limits for each command class."""
+    def __init__(self, limits=COMMAND_LIMITS):
+        self.buckets = {name: TokenBucket(rate, burst) for name, (rate, burst) in limits.items()}
+        self.last_notice = {}
+
+    def allow(self, command, rate_scale=1.0):
+        """Check if the client may run the command now. Unlimited commands are always allowed."""
+        bucket = self.buckets.get(COMMAND_CLASSES.get(command))
+        return bucket is None or bucket.allow(rate_scale)
+
+    def should_notify(self, command):
+        """Check if the client should be told it is throttled, at most once per interval per class."""
+        name = COMMAND_CLASSES.get(command)
+        now = time.monotonic()
+        if now - self.last_notice.get(name, 0) < THROTTLE_NOTICE_INTERVAL:
+            return False
+        self.last_notice[name] = now
+        return True
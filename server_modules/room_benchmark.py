@@ -0,0 +1,147 @@
+"""
+Room size benchmark for Deny & Conquer.
+Starts a server in this process, connects many bot players over loopback and measures
+how long a join takes as the room fills up, and how long a lock or claim takes to
+reach every player.
+
+Run it for a massive room:
+    python benchmark_room.py --players 256 --grid-size 64
+"""
+import argparse
+import contextlib
+import io
+import selectors
+import socket
+import threading
+import time
+from .game_server import GameServer
+from .simulation import percentiles
+
+# Seconds to wait for a message to reach every bot before giving up
+DELIVERY_TIMEOUT = 10
+
+
+def free_port():
+    """Find a free TCP port on loopback."""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class BotConnection:
+    """A bot player's socket and the bytes it received."""
+    def __init__(self, port, name):
+        self.sock = socket.create_connection(('127.0.0.1', port))
+        self.sock.sendall(f"CONNECT|{name}\n".encode('utf-8'))
+        self.buffer = b""
+        self.received = 0
+
+    def send(self, message):
+        self.sock.sendall(message.encode('utf-8'))
+
+
+def wait_for_all(bots, marker, timeout=DELIVERY_TIMEOUT):
+    """Read from the bots until each one has received marker. Returns the seconds it took."""
+    start = time.perf_counter()
+    pending = {bot.sock: bot for bot in bots}
+    selector = selectors.DefaultSelector()
+    for bot in bots:
+        selector.register(bot.sock, selectors.EVENT_READ, bot)
+    try:
+        while pending:
+            if time.perf_counter() - start > timeout:
+                raise TimeoutError(f"{len(pending)} bots did not receive {marker!r}")
+            for key, _ in selector.select(timeout=0.1):
+                bot = key.data
+                data = bot.sock.recv(1 << 20)
+                if not data:
+                    raise ConnectionError("Server closed a bot connection")
+                bot.received += len(data)
+                bot.buffer += data
+                if marker in bot.buffer:
+                    pending.pop(bot.sock, None)
+                    bot.buffer = b""
+                else:
+                    # Keep just enough to find a marker split between reads
+                    bot.buffer = bot.buffer[-len(marker):]
+    finally:
+        selector.close()
+    return time.perf_counter() - start
+
+
+def run_benchmark(players=256, grid_size=64, events=50):
+    """Fill a room with bots, then lock and claim squares, and return the timings."""
+    port = free_port()
+    server = GameServer(host='127.0.0.1', port=port, grid_size=grid_size, max_players=players)
+    threading.Thread(target=server.start, daemon=True).start()
+    time.sleep(0.2)
+
+    bots = []
+    join_times = []
+    for i in range(players):
+        start = time.perf_counter()
+        bot = BotConnection(port, f"Bot_{i + 1}")
+        # The snapshot ends with the lock table
+        wait_for_all([bot], b"UPDATE_LOCKS|")
+        join_times.append(time.perf_counter() - start)
+        bots.append(bot)
+    # Drain the join notices, the last bot is not told about itself
+    wait_for_all(bots[:-1], f"PLAYER_JOINED|{players}|".encode('utf-8'))
+
+    lock_times = []
+    claim_times = []
+    claim_bytes = []
+    for k in range(min(events, grid_size * grid_size)):
+        r, c = divmod(k, grid_size)
+        bot = bots[k % players]
+        bot.send(f"LOCK_REQUEST|{r}|{c}\n")
+        lock_times.append(wait_for_all(bots, f"SQUARE_LOCKED|{r}|{c}|".encode('utf-8')))
+        received = sum(b.received for b in bots)
+        bot.send(f"CLAIM_ATTEMPT|{r}|{c}\n")
+        claim_times.append(wait_for_all(bots, b"UPDATE_BOARD|"))
+        claim_bytes.append((sum(b.received for b in bots) - received) / players)
+
+    for bot in bots:
+        bot.sock.close()
+    return {
+        'players': players,
+        'grid_size': grid_size,
+        'join_ms': percentiles([t * 1000 for t in join_times]),
+        'last_join_ms': join_times[-1] * 1000,
+        'lock_fanout_ms': percentiles([t * 1000 for t in lock_times]),
+        'claim_fanout_ms': percentiles([t * 1000 for t in claim_times]),
+        'claim_bytes_per_player': sum(claim_bytes) / len(claim_bytes) if claim_bytes else 0,
+    }
+
+
+def print_results(results):
+    """Print the results of run_benchmark."""
+    print(f"Room: {results['players']} players on a {results['grid_size']}x{results['grid_size']} board")
+    print(f"Join (ms): {format_percentiles(results['join_ms'])}, last join {results['last_join_ms']:.1f}")
+    print(f"Lock reaching every player (ms): {format_percentiles(results['lock_fanout_ms'])}")
+    print(f"Claim reaching every player (ms): {format_percentiles(results['claim_fanout_ms'])}")
+    print(f"Bytes per player per claim: {results['claim_bytes_per_player']:.0f}")
+
+
+def format_percentiles(values):
+    """Format percentiles from simulation.percentiles."""
+    return ', '.join(f"{name} {value:.1f}" for name, value in values.items())
+
+
+def main():
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description="Benchmark a Deny & Conquer room with many players.")
+    parser.add_argument("--players", type=int, default=256)
+    parser.add_argument("--grid-size", type=int, default=64)
+    parser.add_argument("--events", type=int, default=50, help="Squares to lock and claim")
+    parser.add_argument("--verbose", action="store_true", help="Show the server's output")
+    args = parser.parse_args()
+
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        results = run_benchmark(args.players, args.grid_size, args.events)
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+In-process game simulation for Deny & Conquer.
+Plays complete games on a GameBoard with bots instead of sockets, following the
+same rules as the server: a square must be locked before it is scribbled on,
+only the lock holder can claim it, and the game ends when the board is full
+or the timer runs out.
+
+Run many games on all cores and print score and contention statistics:
+    python simulate.py --games 10000 --grid-size 8 --players 4
+"""
+import argparse
+import multiprocessing
+import random
+import statistics
+import time
+from collections import Counter
+from .board import GameBoard
+
+# Same default as TARGET_COVERAGE in the client
+DEFAULT_TARGET_COVERAGE = 0.50
+# Simulated seconds per tick
+TICK = 0.1
+
+
+class RandomStrategy:
+    """Pick any free square."""
+    name = "random"
+
+    def choose_square(self, free, bot, rng):
+        return rng.choice(free)
+
+
+class SweepStrategy:
+    """Pick the first free square in reading order, like a player going row by row."""
+    name = "sweep"
+
+    def choose_square(self, free, bot, rng):
+        return min(free)
+
+
+class NearestStrategy:
+    """Pick the free square closest to the last square the bot worked on."""
+    name = "nearest"
+
+    def choose_square(self, free, bot, rng):
+        last_r, last_c = bot.position
+        return min(free, key=lambda square: abs(square[0] - last_r) + abs(square[1] - last_c))
+
+
+STRATEGIES = {cls.name: cls for cls in (RandomStrategy, SweepStrategy, NearestStrategy)}
+
+
+class SimulatedPlayer:
+    """A bot playing in a simulated game."""
+    def __init__(self, player_id, strategy, speed, give_up_chance, grid_size, rng):
+        self.player_id = player_id
+        self.strategy = strategy
+        self.speed = speed  # Coverage gained per second of scribbling
+        self.give_up_chance = give_up_chance  # Chance per tick of releasing the mouse early
+        self.square = None
+        self.coverage = 0.0
+        self.position = (rng.randrange(grid_size), rng.randrange(grid_size))
+
+
+class GameSimulator:
+    """Plays complete games with bots, following the server's command rules."""
+    def __init__(self, grid_size=8, max_players=4, timer_duration=120,
+                 target_coverage=DEFAULT_TARGET_COVERAGE, strategies=("random",),
+                 speed=(0.4, 1.2), give_up_chance=0.02):
+        """Set up the game parameters. Bots are given the strategies in turn."""
+        self.grid_size = grid_size
+        self.max_players = max_players
+        self.timer_duration = timer_duration
+        self.target_coverage = target_coverage
+        self.strategies = [STRATEGIES[name]() for name in strategies]
+        self.speed = speed
+        self.give_up_chance = give_up_chance
+
+    def play(self, seed):
+        """Play one game and return its result."""
+        rng = random.Random(seed)
+        # Bots never stall, so lock leases are left out
+        board = GameBoard(self.grid_size, lease_duration=None)
+        bots = [
+            SimulatedPlayer(pid, self.strategies[(pid - 1) % len(self.strategies)],
+                            rng.uniform(*self.speed), self.give_up_chance, self.grid_size, rng)
+            for pid in range(1, self.max_players + 1)
+        ]
+        stats = Counter()
+        max_ticks = int(self.timer_duration / TICK)
+        ticks = 0
+        # Squares that are neither claimed nor locked, kept alongside the board
+        available = {(r, c) for r in range(self.grid_size) for c in range(self.grid_size)}
+
+        while ticks < max_ticks and not board.is_full():
+            ticks += 1
+            # Everyone picks from what the board looked like at the start of the tick,
+            # so two players can go for the same square like messages racing to the server
+            free = list(available)
+            rng.shuffle(bots)
+            for bot in bots:
+                if bot.square is None:
+                    if not free:
+                        continue
+                    square = bot.strategy.choose_square(free, bot, rng)
+                    stats['lock_requests'] += 1
+                    if board.try_lock(square[0], square[1], bot.player_id):
+                        available.discard(square)
+                        bot.square, bot.coverage, bot.position = square, 0.0, square
+                    else:
+                        stats['lock_denied'] += 1
+                    continue
+
+                r, c = bot.square
+                bot.coverage += bot.speed * TICK * rng.uniform(0.5, 1.5)
+                if bot.coverage >= self.target_coverage:
+                    stats['claim_attempts'] += 1
+                    if board.claim(r, c, bot.player_id):
+                        stats['claims'] += 1
+                    bot.square = None
+                elif rng.random() < bot.give_up_chance:
+                    # Mouse released with too little coverage
+                    board.release_lock(r, c, bot.player_id)
+                    available.add((r, c))
+                    stats['releases'] += 1
+                    bot.square = None
+
+        scores = Counter(pid for row in board.get_board() for pid in row if pid)
+        top_score = max(scores.values(), default=0)
+        winners = [bot for bot in bots if scores[bot.player_id] == top_score and top_score > 0]
+        return {
+            'duration': round(ticks * TICK, 1),
+            'scores': sorted((scores[bot.player_id] for bot in bots), reverse=True),
+            'top_score': top_score,
+            'tie': len(winners) > 1,
+            'winner_strategies': [bot.strategy.name for bot in winners],
+            'stats': dict(stats),
+        }
+
+    def run(self, games, processes=None, seed=0):
+        """Play many games on a process pool and return the summary."""
+        seeds = range(seed, seed + games)
+        start = time.perf_counter()
+        if processes == 1:
+            results = [self.play(s) for s in seeds]
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                chunksize = max(1, games // (4 * (processes or multiprocessing.cpu_count())))
+                results = pool.map(self.play, seeds, chunksize=chunksize)
+        elapsed = time.perf_counter() - start
+        return summarize(results, elapsed)
+
+
+def percentiles(values):
+    """Get the min, median, 90th percentile and max of a list of numbers."""
+    values = sorted(values)
+    if not values:
+        return {'min': 0, 'p50': 0, 'p90': 0, 'max': 0}
+    return {
+        'min': values[0],
+        'p50': values[len(values) // 2],
+        'p90': values[min(len(values) - 1, int(len(values) * 0.9))],
+        'max': values[-1],
+    }
+
+
+def summarize(results, elapsed):
+    """Combine the results of many games into score and contention statistics."""
+    games = len(results)
+    totals = Counter()
+    wins = Counter()
+    for result in results:
+        totals.update(result['stats'])
+        for name in result['winner_strategies']:
+            wins[name] += 1 / len(result['winner_strategies'])
+
+    requests = totals['lock_requests'] or 1
+    return {
+        'games': games,
+        'games_per_second': games / elapsed if elapsed else 0,
+        'duration': percentiles([r['duration'] for r in results]),
+        'top_score': percentiles([r['top_score'] for r in results]),
+        'score_spread': percentiles([r['scores'][0] - r['scores'][-1] if r['scores'] else 0 for r in results]),
+        'tie_rate': sum(r['tie'] for r in results) / games if games else 0,
+        'win_share': {name: count / games for name, count in wins.items()},
+        'lock_denied_rate': totals['lock_denied'] / requests,
+        'per_game': {key: value / games for key, value in totals.items()},
+        'mean_duration': statistics.fmean(r['duration'] for r in results) if results else 0,
+    }
+
+
+def print_summary(summary):
+    """Print a summary from GameSimulator.run."""
+    print(f"Games: {summary['games']} ({summary['games_per_second']:.0f} games/s)")
+    print(f"Game length (s): mean {summary['mean_duration']:.1f}, {summary['duration']}")
+    print(f"Winning score: {summary['top_score']}")
+    print(f"Score spread (first - last): {summary['score_spread']}")
+    print(f"Tie rate: {summary['tie_rate']:.1%}")
+    for name, share in sorted(summary['win_share'].items()):
+        print(f"Win share {name}: {share:.1%}")
+    print(f"Lock requests denied: {summary['lock_denied_rate']:.1%}")
+    for key, value in sorted(summary['per_game'].items()):
+        print(f"{key} per game: {value:.1f}")
+
+
+def main():
+    """Run a batch of simulated games from the command line."""
+    parser = argparse.ArgumentParser(description="Simulate Deny & Conquer games with bots.")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--grid-size", type=int, default=8)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--timer", type=int, default=120, help="Timer duration in seconds")
+    parser.add_argument("--coverage", type=float, default=DEFAULT_TARGET_COVERAGE, help="Target coverage to claim")
+    parser.add_argument("--strategies", default="random", help=f"Comma separated, from {', '.join(STRATEGIES)}")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    simulator = GameSimulator(
+        grid_size=args.grid_size, max_players=args.players, timer_duration=args.timer,
+        target_coverage=args.coverage, strategies=args.strategies.split(','),
+    )
+    print_summary(simulator.run(args.games, processes=args.processes, seed=args.seed))
+
+
+if __name__ == "__main__":
+    main()
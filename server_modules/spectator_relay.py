@@ -0,0 +1,275 @@
+"""
+Spectator relay for Deny & Conquer.
+Connects to the game server once as a spectator and serves the game to any number of
+spectators, so watching the game puts no load on the game server.
+
+Every chunk of events from the server is encoded once and the same bytes are queued
+for every spectator. The relay keeps its own copy of the game state, so a spectator
+that connects late gets a snapshot from the relay instead of from the server.
+
+Run it next to the server and point spectators at the relay port:
+    python relay.py --server 127.0.0.1:65433 --port 65434
+"""
+import argparse
+import ast
+import selectors
+import socket
+from collections import deque
+from .stroke_store import StrokeStore
+
+# A spectator that falls this far behind is dropped instead of holding events in memory
+MAX_QUEUED_BYTES = 1024 * 1024
+# Commands whose latest line is all a late spectator needs
+LATEST_ONLY = ('UPDATE_BOARD', 'LEADERBOARD', 'TIMER_UPDATE', 'GAME_OVER')
+
+
+class Spectator:
+    """Outgoing queue of one spectator connection. Queued buffers are shared with the other spectators."""
+    def __init__(self, sock):
+        self.sock = sock
+        self.queue = deque()
+        self.queued_bytes = 0
+        self.offset = 0  # Bytes of the first buffer already sent
+
+
+class GameMirror:
+    """Copy of the game state, kept up to date from the event stream."""
+    def __init__(self):
+        self.seq = 0
+        self.players = {}
+        self.locks = {}
+        self.latest = {}  # Command -> its latest full line
+        self.strokes = StrokeStore()
+        self.snapshot = None
+
+    def apply(self, line):
+        """Apply one line from the server."""
+        if line.startswith("SEQ|"):
+            _, seq, line = line.split('|', 2)
+            self.seq = int(seq)
+        command, _, payload = line.partition('|')
+        if command == "SYNC":
+            self.seq = int(payload)
+        elif command == "UPDATE_PLAYERS":
+            self.players = ast.literal_eval(payload)
+        elif command == "PLAYER_JOINED":
+            player_id, color, name = payload.split('|', 2)
+            self.players[int(player_id)] = {'name': name, 'color': color}
+        elif command == "PLAYER_LEFT":
+            self.players.pop(int(payload), None)
+        elif command == "NEW_ROUND":
+            # The board, locks and strokes of the last round are gone
+            self.latest.pop("GAME_OVER", None)
+            self.locks = {}
+            self.strokes.clear()
+        elif command == "UPDATE_LOCKS":
+            self.locks = ast.literal_eval(payload)
+        elif command == "SQUARE_LOCKED":
+            r, c, player_id = map(int, payload.split('|'))
+            self.locks[(r, c)] = player_id
+        elif command == "SQUARE_UNLOCKED":
+            r, c = map(int, payload.split('|'))
+            self.locks.pop((r, c), None)
+            self.strokes.discard(r, c)
+        elif command in LATEST_ONLY:
+            self.latest[command] = f"{line}\n"
+            if command == "UPDATE_BOARD":
+                # Claimed squares lose their lock and stroke
+                board = ast.literal_eval(payload)
+                for r, c in [key for key in self.locks if board[key[0]][key[1]]]:
+                    self.locks.pop((r, c))
+                    self.strokes.discard(r, c)
+        elif command == "STROKES":
+            self.strokes.load(payload)
+            return
+        elif command == "PLAYER_SCRIBBLE":
+            # Strokes are added to the snapshot when it is sent
+            r, c, player_id, x, y = map(int, payload.split('|'))
+            self.strokes.add(r, c, player_id, x, y)
+            return
+        self.snapshot = None
+
+    def get_snapshot(self):
+        """Get the encoded full state, built at most once between changes, followed by the strokes in progress."""
+        if self.snapshot is None:
+            state = (
+                f"SYNC|{self.seq}\n"
+                f"UPDATE_PLAYERS|{repr(self.players)}\n"
+                f"UPDATE_LOCKS|{repr(self.locks)}\n"
+                + ''.join(self.latest.get(command, '') for command in LATEST_ONLY)
+            )
+            self.snapshot = state.encode('utf-8')
+        strokes = self.strokes.message(self.locks)
+        return self.snapshot + strokes.encode('utf-8') if strokes else self.snapshot
+
+
+class SpectatorRelay:
+    """Relays one spectator stream from the game server to many spectators, from a single thread."""
+    def __init__(self, server_host, server_port, host='0.0.0.0', port=65434, name="Relay"):
+        """Set up the relay for the given game server."""
+        self.server_address = (server_host, server_port)
+        self.address = (host, port)
+        self.name = name
+        self.selector = selectors.DefaultSelector()
+        self.spectators = {}  # Socket -> Spectator
+        self.mirror = GameMirror()
+        self.upstream = None
+        self.listener = None
+        self.buffer = b""
+        self.running = False
+
+    def start(self):
+        """Connect to the game server, listen for spectators and relay until the server goes away."""
+        self.upstream = socket.create_connection(self.server_address)
+        self.upstream.sendall(f"SPECTATE|{self.name}\n".encode('utf-8'))
+        self.upstream.setblocking(False)
+        self.selector.register(self.upstream, selectors.EVENT_READ, self.read_upstream)
+
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(self.address)
+        self.listener.listen()
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ, self.accept_spectator)
+        print(f"Spectator relay for {self.server_address[0]}:{self.server_address[1]} "
+              f"listening on {self.address[0]}:{self.listener.getsockname()[1]}")
+
+        self.running = True
+        try:
+            while self.running:
+                for key, events in self.selector.select(timeout=1):
+                    key.data(key.fileobj, events)
+        finally:
+            self.close()
+
+    def read_upstream(self, sock, events):
+        """Read events from the server, update the mirror and pass complete lines on."""
+        try:
+            data = sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            print("Game server closed the spectator stream.")
+            self.running = False
+            return
+
+        self.buffer += data
+        end = self.buffer.rfind(b'\n') + 1
+        if not end:
+            return
+        chunk, self.buffer = self.buffer[:end], self.buffer[end:]
+        for line in chunk.decode('utf-8').splitlines():
+            if line:
+                self.mirror.apply(line)
+        # The same bytes object goes to every spectator
+        for spectator in list(self.spectators.values()):
+            self.queue(spectator, chunk)
+
+    def accept_spectator(self, sock, events):
+        """Accept a spectator and send it the current state."""
+        try:
+            client_socket, addr = sock.accept()
+        except BlockingIOError:
+            return
+        client_socket.setblocking(False)
+        spectator = Spectator(client_socket)
+        self.spectators[client_socket] = spectator
+        self.selector.register(client_socket, selectors.EVENT_READ, self.handle_spectator)
+        self.queue(spectator, self.mirror.get_snapshot())
+
+    def handle_spectator(self, sock, events):
+        """Send queued data to a spectator, and notice when it disconnects.
+        Anything a spectator sends is ignored."""
+        spectator = self.spectators.get(sock)
+        if spectator is None:
+            return
+        if events & selectors.EVENT_READ:
+            try:
+                if not sock.recv(4096):
+                    self.drop(spectator)
+                    return
+            except BlockingIOError:
+                pass
+            except OSError:
+                self.drop(spectator)
+                return
+        if events & selectors.EVENT_WRITE:
+            self.flush(spectator)
+
+    def queue(self, spectator, data):
+        """Queue data for a spectator and try to send it right away."""
+        if spectator.queued_bytes + len(data) > MAX_QUEUED_BYTES:
+            print(f"Spectator is {spectator.queued_bytes} bytes behind, dropping it.")
+            self.drop(spectator)
+            return
+        was_empty = not spectator.queue
+        spectator.queue.append(data)
+        spectator.queued_bytes += len(data)
+        if was_empty:
+            self.flush(spectator)
+
+    def flush(self, spectator):
+        """Send as much queued data as the socket takes, and wait for it to be writable if some is left."""
+        try:
+            while spectator.queue:
+                data = spectator.queue[0]
+                sent = spectator.sock.send(memoryview(data)[spectator.offset:])
+                spectator.offset += sent
+                if spectator.offset < len(data):
+                    break
+                spectator.queue.popleft()
+                spectator.queued_bytes -= len(data)
+                spectator.offset = 0
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.drop(spectator)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if spectator.queue else 0)
+        self.selector.modify(spectator.sock, events, self.handle_spectator)
+
+    def drop(self, spectator):
+        """Disconnect a spectator."""
+        if self.spectators.pop(spectator.sock, None) is None:
+            return
+        self.selector.unregister(spectator.sock)
+        try:
+            spectator.sock.close()
+        except OSError:
+            pass
+
+    def close(self):
+        """Disconnect everyone and stop relaying."""
+        self.running = False
+        for spectator in list(self.spectators.values()):
+            self.drop(spectator)
+        for sock in (self.listener, self.upstream):
+            if sock:
+                try:
+                    self.selector.unregister(sock)
+                except (KeyError, ValueError):
+                    pass
+                sock.close()
+        self.selector.close()
+
+
+def main():
+    """Run a spectator relay from the command line."""
+    parser = argparse.ArgumentParser(description="Relay a Deny & Conquer game to many spectators.")
+    parser.add_argument("--server", default="127.0.0.1:65433", help="Game server as host:port")
+    parser.add_argument("--host", default="0.0.0.0", help="Address to listen on for spectators")
+    parser.add_argument("--port", type=int, default=65434)
+    args = parser.parse_args()
+
+    server_host, server_port = args.server.rsplit(':', 1)
+    relay = SpectatorRelay(server_host, int(server_port), host=args.host, port=args.port)
+    try:
+        relay.start()
+    except KeyboardInterrupt:
+        print("\nCtrl+C detected. Shutting down relay...")
+
+
+if __name__ == "__main__":
+    main()
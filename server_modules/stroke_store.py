@@ -0,0 +1,100 @@
+import threading
+from array import array
+
+# Points kept per square, older points are overwritten once a stroke is longer
+MAX_STROKE_POINTS = 512
+# Range of a signed 16-bit coordinate
+MIN_COORD, MAX_COORD = -32768, 32767
+
+
+class StrokeBuffer:
+    """
+    The in-progress stroke in one square, as a ring of x, y pairs in an array('h').
+    The array grows with the stroke up to capacity points, then the oldest points are overwritten.
+    """
+    __slots__ = ('player_id', 'capacity', 'points', 'start', 'count')
+
+    def __init__(self, player_id, capacity):
+        self.player_id = player_id
+        self.capacity = capacity
+        self.points = array('h')
+        self.start = 0  # Index of the oldest point
+        self.count = 0
+
+    def append(self, x, y):
+        """Add a point, overwriting the oldest one if the buffer is full."""
+        x = min(max(x, MIN_COORD), MAX_COORD)
+        y = min(max(y, MIN_COORD), MAX_COORD)
+        if self.count < self.capacity:
+            self.points.append(x)
+            self.points.append(y)
+            self.count += 1
+            return
+        i = 2 * self.start
+        self.points[i] = x
+        self.points[i + 1] = y
+        self.start = (self.start + 1) % self.capacity
+
+    def ordered(self):
+        """Get the coordinates, oldest point first."""
+        i = 2 * self.start
+        return self.points[i:] + self.points[:i]
+
+
+class StrokeStore:
+    """
+    In-progress strokes of the locked squares, so clients that join during a stroke can
+    see it. Memory stays bounded: at most one buffer of MAX_STROKE_POINTS points per square.
+    """
+    def __init__(self, max_points=MAX_STROKE_POINTS):
+        self.max_points = max_points
+        self.strokes = {}  # (row, col) -> StrokeBuffer
+        self.lock = threading.Lock()
+
+    def add(self, r, c, player_id, x, y):
+        """Add a point to the stroke of a square. A new player in the square starts a new stroke."""
+        with self.lock:
+            stroke = self.strokes.get((r, c))
+            if stroke is None or stroke.player_id != player_id:
+                stroke = self.strokes[(r, c)] = StrokeBuffer(player_id, self.max_points)
+            stroke.append(x, y)
+
+    def discard(self, r, c):
+        """Forget the stroke of a square that was claimed or unlocked."""
+        with self.lock:
+            self.strokes.pop((r, c), None)
+
+    def clear(self):
+        """Forget every stroke."""
+        with self.lock:
+            self.strokes.clear()
+
+    def message(self, locks=None):
+        """
+        Get every stroke in one STROKES message, or None if there are none.
+        Format: STROKES|r,c,player_id,x,y,x,y,...;r,c,player_id,...
+        With locks, strokes in squares no longer locked by their player are dropped.
+        """
+        with self.lock:
+            if locks is not None:
+                for key in [key for key, stroke in self.strokes.items() if locks.get(key) != stroke.player_id]:
+                    del self.strokes[key]
+            if not self.strokes:
+                return None
+            parts = [
+                f"{r},{c},{stroke.player_id},{','.join(map(str, stroke.ordered()))}"
+                for (r, c), stroke in self.strokes.items()
+            ]
+        return f"STROKES|{';'.join(parts)}\n"
+
+    def load(self, payload):
+        """Replace all strokes with the ones in the payload of a STROKES message."""
+        with self.lock:
+            self.strokes.clear()
+            for part in payload.split(';'):
+                if not part:
+                    continue
+                r, c, player_id, *coords = map(int, part.split(','))
+                stroke = self.strokes[(r, c)] = StrokeBuffer(player_id, self.max_points)
+                for x, y in zip(coords[::2], coords[1::2]):
+                    stroke.append(x, y)
@@ -0,0 +1,102 @@
+import time
+
+# Each level of the wheel has 2**SLOT_BITS slots
+SLOT_BITS = 6
+SLOTS = 1 << SLOT_BITS
+SLOT_MASK = SLOTS - 1
+LEVELS = 4
+
+
+class TimingWheel:
+    """
+    Hierarchical timing wheel for expiring keys after a deadline.
+    Scheduling, renewing and cancelling are O(1), and each tick only looks at one slot
+    per level, so the cost does not grow with the number of outstanding timers.
+    Level 0 slots are one tick wide, each higher level is SLOTS times coarser, and
+    entries cascade down a level when their slot comes up.
+    """
+    def __init__(self, tick=0.1):
+        """Create an empty wheel with the given tick length in seconds."""
+        self.tick = tick
+        self.current_tick = self.now_tick()
+        self.wheels = [[[] for _ in range(SLOTS)] for _ in range(LEVELS)]
+        self.deadlines = {}  # key -> deadline tick, the source of truth for renewals
+
+    def now_tick(self):
+        """Get the current time in ticks."""
+        return int(time.monotonic() / self.tick)
+
+    def schedule(self, key, delay):
+        """Expire key after delay seconds, replacing any earlier deadline."""
+        deadline = self.now_tick() + max(1, int(delay / self.tick))
+        self.deadlines[key] = deadline
+        self._insert(key, deadline)
+
+    def renew(self, key, delay):
+        """Set a new deadline for a scheduled key.
+        A later deadline leaves the old wheel entry in place, it is moved when it comes up.
+        An earlier one needs an entry of its own, as entries due after it would be dropped."""
+        previous = self.deadlines.get(key)
+        if previous is None:
+            return
+        deadline = self.now_tick() + max(1, int(delay / self.tick))
+        self.deadlines[key] = deadline
+        if deadline < previous:
+            self._insert(key, deadline)
+
+    def cancel(self, key):
+        """Stop tracking key. Its wheel entry is dropped when it comes up."""
+        self.deadlines.pop(key, None)
+
+    def clear(self):
+        """Stop tracking every key."""
+        self.deadlines.clear()
+
+    def _insert(self, key, deadline):
+        """Put an entry in the slot of the coarsest level it needs."""
+        delta = max(deadline - self.current_tick, 1)
+        level = 0
+        while level < LEVELS - 1 and delta >= SLOTS ** (level + 1):
+            level += 1
+        # Deadlines past the top level wait in its last reachable slot and get rescheduled
+        deadline = min(deadline, self.current_tick + SLOTS ** LEVELS - 1)
+        slot = (deadline >> (SLOT_BITS * level)) & SLOT_MASK
+        self.wheels[level][slot].append((key, deadline))
+
+    def advance(self):
+        """Move the wheel up to the current time and return the keys that expired."""
+        expired = []
+        target = self.now_tick()
+        while self.current_tick < target:
+            self.current_tick += 1
+            # Cascade entries from coarser levels whose slot comes up at this tick
+            for level in range(1, LEVELS):
+                if self.current_tick & ((1 << (SLOT_BITS * level)) - 1):
+                    break
+                slot = (self.current_tick >> (SLOT_BITS * level)) & SLOT_MASK
+                entries, self.wheels[level][slot] = self.wheels[level][slot], []
+                for key, deadline in entries:
+                    self._reinsert_or_expire(key, deadline, expired)
+
+            slot = self.current_tick & SLOT_MASK
+            entries, self.wheels[0][slot] = self.wheels[0][slot], []
+            for key, deadline in entries:
+                self._reinsert_or_expire(key, deadline, expired)
+        return expired
+
+    def _reinsert_or_expire(self, key, deadline, expired):
+        """Expire an entry that is due, or move it to the slot of its current deadline."""
+        current = self.deadlines.get(key)
+        if current is None or current < deadline:
+            # Cancelled, or a newer entry was scheduled for this key
+            return
+        if current <= self.current_tick:
+            del self.deadlines[key]
+            expired.append(key)
+        else:
+            # Renewed or beyond the top level, schedule again
+            self._insert(key, current)
+
+    def __len__(self):
+        """Number of keys waiting to expire."""
+        return len(self.deadlines)
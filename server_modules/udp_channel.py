@@ -0,0 +1,120 @@
+import socket
+import threading
+
+MAX_DATAGRAM_SIZE = 1024
+
+
+class UdpChannel:
+    """
+    The UdpChannel class carries scribble traffic over UDP next to the TCP connections.
+    A client sends HELLO|token from its UDP socket after WELCOME, gets HELLO_ACK back and then
+    sends UDP_ENABLE over TCP, so both directions are known to work before anything is switched.
+    Datagrams are numbered, and ones that arrive late or out of order are dropped.
+    """
+    def __init__(self, host, port, player_manager, board, broadcaster):
+        """Create the UDP socket on the same port as the TCP server."""
+        self.host = host
+        self.port = port
+        self.player_manager = player_manager
+        self.board = board
+        self.broadcaster = broadcaster
+        self.sock = None
+        self.seq = 0
+        self.seq_lock = threading.Lock()
+        self.peers = {}  # UDP address -> player info
+        self.last_received = {}  # UDP address -> last datagram sequence number
+
+    def start(self, sock=None):
+        """Bind the socket and start receiving. Returns False if UDP is not available.
+        sock is an already bound socket taken over from the previous server process."""
+        if sock is not None:
+            self.sock = sock
+        else:
+            try:
+                self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.sock.bind((self.host, self.port))
+            except OSError as e:
+                print(f"UDP channel disabled: {e}")
+                self.sock = None
+                return False
+        threading.Thread(target=self.receive_datagrams, daemon=True).start()
+        print(f"UDP scribble channel listening on {self.host}:{self.port}")
+        return True
+
+    def receive_datagrams(self):
+        """Receive datagrams from clients until the socket is closed."""
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(MAX_DATAGRAM_SIZE)
+            except OSError:
+                break
+            try:
+                self.handle_datagram(data.decode('utf-8').strip(), addr)
+            except Exception as e:
+                print(f"Error processing datagram from {addr}: {e}")
+
+    def handle_datagram(self, message, addr):
+        """Handle a HELLO or a numbered scribble update from a client."""
+        if message.startswith("HELLO|"):
+            token = message.split('|', 1)[1]
+            info = self.player_manager.sessions.get(token)
+            if info is None:
+                return
+            # Forget the player's previous address, e.g. before a reconnect
+            for old_addr in [a for a, i in self.peers.items() if i is info]:
+                del self.peers[old_addr]
+                self.last_received.pop(old_addr, None)
+            self.peers[addr] = info
+            info['udp_addr'] = addr
+            self.sock.sendto(b"HELLO_ACK", addr)
+            return
+
+        info = self.peers.get(addr)
+        if info is None:
+            return
+        seq, message = message.split('|', 1)
+        seq = int(seq)
+        # Drop datagrams that arrive after a newer one
+        if seq <= self.last_received.get(addr, -1):
+            return
+        self.last_received[addr] = seq
+
+        command, payload = message.split('|', 1)
+        if command == "SCRIBBLE_UPDATE":
+            r, c, x, y = map(int, payload.split('|')[:4])
+            limiter = info.get('limiter')
+            if limiter and not limiter.allow(command, self.broadcaster.relay_scale()):
+                return
+            if self.board.renew_lock(r, c, info['id']):
+                self.broadcaster.broadcast_scribble(r, c, info['id'], x, y)
+
+    def send(self, addr, message):
+        """Send a numbered datagram to a client."""
+        with self.seq_lock:
+            self.seq += 1
+            data = f"{self.seq}|{message}".encode('utf-8')
+        try:
+            self.sock.sendto(data, addr)
+        except OSError:
+            pass
+
+    def export_state(self):
+        """Get the datagram counter and the players' UDP addresses for a new server process."""
+        with self.seq_lock:
+            return {
+                'seq': self.seq,
+                'peers': [[addr[0], addr[1], info['token']] for addr, info in self.peers.items()],
+            }
+
+    def import_state(self, state):
+        """Restore the UDP peers of the previous server process. Call after the sessions are restored."""
+        self.seq = state['seq']
+        for host, port, token in state['peers']:
+            info = self.player_manager.sessions.get(token)
+            if info is not None:
+                self.peers[(host, port)] = info
+
+    def close(self):
+        """Close the UDP socket."""
+        if self.sock:
+            self.sock.close()
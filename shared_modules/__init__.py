@@ -0,0 +1,4 @@
+"""
+Shared modules package for Deny & Conquer game.
+Contains the code the game server and the game client must agree on.
+"""
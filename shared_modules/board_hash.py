@@ -0,0 +1,34 @@
+"""
+Board hashes for anti-entropy between the server and its clients.
+The hash of a board is the XOR of a 64-bit hash of every claimed square, so a claim
+updates it in constant time, and the hash of each row tells which rows differ.
+The server and the client both use this module, so their hashes always agree.
+"""
+
+MASK = (1 << 64) - 1
+
+
+def square_hash(r, c, player_id):
+    """Hash of a square claimed by player_id (splitmix64), 0 for an unclaimed square."""
+    if not player_id:
+        return 0
+    x = (((r << 42) ^ (c << 21) ^ player_id) + 0x9E3779B97F4A7C15) & MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK
+    return x ^ (x >> 31)
+
+
+def row_hash(r, row):
+    """Hash of row r of a board."""
+    h = 0
+    for c, player_id in enumerate(row):
+        h ^= square_hash(r, c, player_id)
+    return h
+
+
+def board_hash(row_hashes):
+    """Hash of a whole board from the hashes of its rows."""
+    h = 0
+    for row in row_hashes:
+        h ^= row
+    return h
@@ -0,0 +1,87 @@
+import re
+import time
+
+# Regular expression for each field type. The last text field takes the rest of the line.
+FIELD_PATTERNS = {int: r'(-?\d+)', str: r'([^|]*)'}
+
+
+def compile_parser(types, separator=r'\|'):
+    """Compile a parser for payloads made of the given field types.
+    The parser returns the converted fields, or None if the payload does not match."""
+    patterns = [FIELD_PATTERNS[t] for t in types]
+    if types and types[-1] is str:
+        patterns[-1] = r'(.*)'
+    regex = re.compile(separator.join(patterns) + r'\s*$')
+
+    def parse(payload):
+        match = regex.match(payload)
+        if match is None:
+            return None
+        return [t(value) for t, value in zip(types, match.groups())]
+    return parse
+
+
+class CommandTable:
+    """
+    Maps command names to handlers, with an argument parser compiled for each command
+    when it is registered. Dispatching is one dictionary lookup whatever the command.
+    If timing_hook is set, it is called with the command name and the seconds its handler took.
+    """
+    def __init__(self):
+        self.commands = {}  # Command name -> (parser or None, handler)
+        self.timing_hook = None
+
+    def register(self, name, handler, *types, separator=r'\|'):
+        """Register the handler of a command whose payload has the given field types."""
+        parser = compile_parser(types, separator) if types else None
+        self.commands[name] = (parser, handler)
+
+    def register_parser(self, name, handler, parse):
+        """Register the handler of a command whose whole payload is converted by parse."""
+        self.commands[name] = (lambda payload: [parse(payload)], handler)
+
+    def dispatch(self, message, *context):
+        """Run the handler of a message with the context followed by the parsed fields.
+        Returns False for unknown commands, and raises ValueError if the payload does not parse."""
+        command, _, payload = message.partition('|')
+        entry = self.commands.get(command)
+        if entry is None:
+            return False
+        parser, handler = entry
+        args = parser(payload) if parser else ()
+        if args is None:
+            raise ValueError(f"Invalid {command} format: '{payload}'")
+
+        if self.timing_hook is None:
+            handler(*context, *args)
+            return True
+        start = time.perf_counter()
+        try:
+            handler(*context, *args)
+        finally:
+            self.timing_hook(command, time.perf_counter() - start)
+        return True
+
+
+class CommandTimings:
+    """A timing hook that adds up how often each command ran and how long it took."""
+    def __init__(self):
+        self.stats = {}  # Command name -> [count, total seconds, slowest seconds]
+
+    def __call__(self, command, seconds):
+        stats = self.stats.get(command)
+        if stats is None:
+            self.stats[command] = [1, seconds, seconds]
+            return
+        stats[0] += 1
+        stats[1] += seconds
+        if seconds > stats[2]:
+            stats[2] = seconds
+
+    def report(self):
+        """Get one line per command, the most expensive in total first."""
+        lines = []
+        for command, (count, total, slowest) in sorted(self.stats.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{command}: {count} calls, {total * 1000:.1f} ms total, "
+                         f"{total / count * 1e6:.0f} us avg, {slowest * 1000:.2f} ms max")
+        return lines
@@ -0,0 +1,37 @@
+"""
+Preset dictionary for compressed frames.
+zlib starts every frame with an empty window, so a short message has nothing to refer
+back to and barely shrinks. Primed with the protocol's command names and common
+fragments, even a message of a few dozen bytes compresses, while every frame still
+stands on its own and can be shared by all the clients it goes to.
+
+Changing ZDICT breaks compressed frames between old and new builds, add a new one with
+its own negotiation option instead.
+"""
+import zlib
+
+COMPRESS_LEVEL = 6
+# zlib prefers the end of the dictionary, so the most common fragments come last
+ZDICT = (
+    b"UPDATE_PLAYERS|{1: {'name': 'Player_1', 'color': '#FF0000'}, 2: {'name': 'Player_2', 'color': '#0000FF'}, "
+    b"3: {'name': 'Player_3', 'color': '#00FF00'}, 4: {'name': 'Player_4', 'color': '#FFA500'}}\n"
+    b"UPDATE_LOCKS|{(0, 0): 1, (1, 1): 2}\nSTROKES|\nNEW_ROUND|\nNEXT_ROUND|\nLOBBY_UPDATE|\nGAME_OVER|\n"
+    b"PLAYER_LEFT|\nPLAYER_JOINED|\nINFO| joined the game.\nINFO| left the game.\nBOARD_ROWS|\n"
+    b"UPDATE_BOARD|[[0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 0]]\n"
+    b"LOCK_QUEUED|\nLOCK_DENIED|\nLOCK_GRANTED|\nLEADERBOARD|\nSQUARE_UNLOCKED|\nSEQ|1|SQUARE_LOCKED|\n"
+    b"TIMER_UPDATE|\nBOARD_HASH|\nPLAYER_SCRIBBLE|\nPLAYER_SCRIBBLE|\n"
+)
+
+
+def deflate(data, zdict=True):
+    """Compress data into one zlib stream, primed with ZDICT unless zdict is False."""
+    if not zdict:
+        return zlib.compress(data, COMPRESS_LEVEL)
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zdict=ZDICT)
+    return compressor.compress(data) + compressor.flush()
+
+
+def inflate(data):
+    """Decompress a zlib stream from deflate, with or without the preset dictionary."""
+    decompressor = zlib.decompressobj(zdict=ZDICT)
+    return decompressor.decompress(data) + decompressor.flush()
@@ -0,0 +1,5 @@
+from server_modules.simulation import main
+
+# Run a batch of simulated games and print the statistics.
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import unittest
+from server_modules.timing_wheel import TimingWheel
+
+
+class FakeClockWheel(TimingWheel):
+    """A timing wheel on a clock the test moves by hand."""
+    def __init__(self):
+        self.now = 0.0
+        super().__init__(tick=0.1)
+
+    def now_tick(self):
+        return int(round(self.now / self.tick))
+
+    def advance_by(self, seconds):
+        """Move the clock forward tick by tick and return every key that expired."""
+        expired = []
+        for _ in range(int(round(seconds / self.tick))):
+            self.now += self.tick
+            expired += self.advance()
+        return expired
+
+
+class TimingWheelTest(unittest.TestCase):
+    def test_expires_after_delay(self):
+        wheel = FakeClockWheel()
+        wheel.schedule('lock', 5)
+        self.assertEqual(wheel.advance_by(4.9), [])
+        self.assertEqual(wheel.advance_by(0.1), ['lock'])
+        self.assertEqual(len(wheel), 0)
+
+    def test_renew_later_moves_deadline(self):
+        wheel = FakeClockWheel()
+        wheel.schedule('lock', 5)
+        wheel.advance_by(3)
+        wheel.renew('lock', 5)
+        self.assertEqual(wheel.advance_by(4.9), [])
+        self.assertEqual(wheel.advance_by(0.1), ['lock'])
+
+    def test_renew_earlier_than_pending_entry(self):
+        # A dropped player's locks get the session grace period, a scribble after they resume
+        # brings the lease back to a few seconds
+        wheel = FakeClockWheel()
+        wheel.schedule('lock', 5)
+        wheel.renew('lock', 30)
+        wheel.advance_by(6)
+        wheel.renew('lock', 5)
+        self.assertEqual(wheel.advance_by(4.9), [])
+        self.assertEqual(wheel.advance_by(0.1), ['lock'])
+        self.assertEqual(wheel.advance_by(60), [])
+        self.assertEqual(len(wheel), 0)
+
+    def test_cancel(self):
+        wheel = FakeClockWheel()
+        wheel.schedule('lock', 5)
+        wheel.cancel('lock')
+        wheel.renew('lock', 5)
+        self.assertEqual(wheel.advance_by(10), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,5 @@
+from server_modules.board_publisher import main
+
+# Watch the board a local server publishes to shared memory.
+if __name__ == "__main__":
+    main()